@@ -14,8 +14,9 @@ from typing import Optional, Dict
 # Third-party imports
 from dotenv import load_dotenv
 import uvicorn
-from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, Query, Depends
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, Query, Depends, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QTabWidget, QTableWidget, QTableWidgetItem, QPushButton, 
@@ -29,14 +30,32 @@ from PyQt6.QtGui import QAction, QIcon
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 try:
-    from backend.mt5_worker import MT5Worker
+    from backend.worker_manager import AsyncWorkerManager
+    from backend.mt5_worker import TIMEFRAMES
+    from backend import candles, serialization, virtualization
+    from backend.broadcast import BroadcastHub, Outbox, new_metrics, CLOSE_SLOW_CLIENT
+    from backend.position_stream import PositionStream
+    from backend.quote_sources import QuoteSources
+    from backend.live_bars import LiveBars
+    from backend.candle_store import CandleStore
+    from backend.deal_ledger import DealLedger
     from backend.database import (init_db, create_or_update_user, get_user_by_app_login, 
-                                  get_all_users, delete_user, get_sync_state, update_sync_state, reset_sync_state)
+                                  get_all_users, delete_user, reset_sync_state)
 except ImportError:
     try:
-        from mt5_worker import MT5Worker
+        from worker_manager import AsyncWorkerManager
+        from mt5_worker import TIMEFRAMES
+        import candles
+        import serialization
+        import virtualization
+        from broadcast import BroadcastHub, Outbox, new_metrics, CLOSE_SLOW_CLIENT
+        from position_stream import PositionStream
+        from quote_sources import QuoteSources
+        from live_bars import LiveBars
+        from candle_store import CandleStore
+        from deal_ledger import DealLedger
         from database import (init_db, create_or_update_user, get_user_by_app_login, 
-                              get_all_users, delete_user, get_sync_state, update_sync_state, reset_sync_state)
+                              get_all_users, delete_user, reset_sync_state)
     except:
         pass
 
@@ -45,129 +64,16 @@ load_dotenv()
 # One-time DB Init
 init_db()
 
-# === ASYNC WORKER MANAGER (NO ZOMBIES) ===
-class AsyncWorkerManager:
-    def __init__(self):
-        self.workers: Dict[int, MT5Worker] = {}
-        self.queues: Dict[int, tuple] = {} # (cmd_q, res_q)
-        self.futures: Dict[str, asyncio.Future] = {} # { request_id : Future }
-        self.loop = None
-        self.running = True
-        
-        # Thread to consume all result queues
-        self.listener_thread = threading.Thread(target=self._result_listener, daemon=True)
-        self.listener_thread.start()
-
-    def set_loop(self, loop):
-        self.loop = loop
-
-    def is_worker_running(self, mt5_login: int):
-        return mt5_login in self.workers and self.workers[mt5_login].is_alive()
-
-    def start_worker(self, mt5_login: int, path: str):
-        if self.is_worker_running(mt5_login): return True
-        
-        if not os.path.exists(path):
-            print(f"Terminal path not found: {path} for {mt5_login}")
-            return False
-
-        print(f"Starting Worker for MT5 {mt5_login} at {path}...")
-        cmd_q = multiprocessing.Queue()
-        res_q = multiprocessing.Queue()
-        
-        w = MT5Worker(worker_id=mt5_login, terminal_path=path, command_queue=cmd_q, result_queue=res_q)
-        w.start()
-        
-        self.workers[mt5_login] = w
-        self.queues[mt5_login] = (cmd_q, res_q)
-        return True
-
-    def stop_worker(self, mt5_login: int):
-        if mt5_login in self.queues:
-            try: self.queues[mt5_login][0].put({"type": "STOP"})
-            except: pass
-        
-        if mt5_login in self.workers:
-            w = self.workers[mt5_login]
-            w.join(timeout=3)
-            if w.is_alive(): w.terminate()
-            del self.workers[mt5_login]
-            del self.queues[mt5_login]
-            print(f"Stopped Worker for {mt5_login}")
-
-    def stop_all(self):
-        self.running = False
-        active_ids = list(self.workers.keys())
-        for uid in active_ids: self.stop_worker(uid)
-
-    def _result_listener(self):
-        """
-        Background thread that continously polls ALL result queues.
-        Dispatches results to Futures. Discards zombies.
-        """
-        print("Async Result Listener Started")
-        while self.running:
-            # Iterate all active queues
-            # Use list() to avoid runtime error if dict changes size
-            active_logins = list(self.queues.keys()) 
-            
-            idle = True
-            for login in active_logins:
-                if login not in self.queues: continue
-                _, res_q = self.queues[login]
-                
-                try:
-                    # Non-blocking get
-                    while not res_q.empty():
-                        res = res_q.get_nowait()
-                        idle = False
-                        
-                        req_id = res.get('id')
-                        # Check if Future exists
-                        if req_id and req_id in self.futures:
-                            fut = self.futures.pop(req_id)
-                            if not fut.done():
-                                # Complete the future in the Event Loop safely
-                                if self.loop:
-                                    self.loop.call_soon_threadsafe(fut.set_result, res.get('result'))
-                        else:
-                            # ZOMBIE FOUND! Discard it.
-                            # print(f"Discarding Zombie Response: {req_id}")
-                            pass
-                except:
-                    pass
-            
-            if idle:
-                time.sleep(0.01) # Low CPU usage wait
-
-    async def execute(self, mt5_login: int, command_type, data=None, timeout=15):
-        if not self.is_worker_running(mt5_login):
-            return {"status": "error", "detail": "Worker not running"}
-            
-        cmd_q, _ = self.queues[mt5_login]
-        request_id = str(uuid.uuid4())
-        
-        # Create Future
-        loop = asyncio.get_event_loop()
-        fut = loop.create_future()
-        self.futures[request_id] = fut
-        
-        # Send Command
-        cmd = {"type": command_type, "id": request_id, "data": data}
-        cmd_q.put(cmd)
-        
-        try:
-            return await asyncio.wait_for(fut, timeout=timeout)
-        except asyncio.TimeoutError:
-            # Cleanup future if timed out
-            if request_id in self.futures:
-                del self.futures[request_id]
-            return {"status": "error", "detail": "Request timed out"}
-
 manager = AsyncWorkerManager()
+quote_sources = QuoteSources(manager) # Feed selection/failover for /ws/quotes
+candle_store = CandleStore(manager) # Closed bars on disk, per broker/symbol/timeframe (CANDLE_STORE=0 disables)
+live_bars = LiveBars(manager, candle_store) # Recent /history windows from memory (LIVE_BARS=0 disables)
+deal_ledger = DealLedger(manager) # Local copy of MT5 deals for /trade_history (DEAL_LEDGER=0 disables)
 
 # === FASTAPI SERVER ===
-app = FastAPI(title="MirrorTrade Backend (Optimized)", version="4.1")
+# orjson-backed responses for every endpoint (falls back to json when orjson is missing)
+app = FastAPI(title="MirrorTrade Backend (Optimized)", version="4.1",
+              default_response_class=serialization.FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -222,6 +128,10 @@ class HistoryRequest(BaseModel):
     from_date: Optional[str] = None
     to_date: Optional[str] = None
     group: str = "DEALS"
+    # DEALS/POSITIONS (served from the deal ledger): filter by symbol, page with limit/offset (newest first)
+    symbol: Optional[str] = None
+    limit: Optional[int] = None
+    offset: int = 0
 
 # Helpers to resolve AppLogin -> MT5Login
 def resolve_user(app_login: str):
@@ -297,6 +207,7 @@ async def place_trade(item: TradeRequest):
     trade_data['comment'] = f"App {tag}"
     
     res = await manager.execute(mt5_id, "TRADE", trade_data)
+    deal_ledger.invalidate(mt5_id) # Next /trade_history pulls the new deal first
     if res.get('status') == 'error': raise HTTPException(400, res['detail'])
     return res
 
@@ -315,6 +226,7 @@ async def modify_position(item: ModifyRequest):
 async def close_position(item: CloseRequest):
     u = resolve_user(item.login)
     res = await manager.execute(u['mt5_login'], "CLOSE", item.dict())
+    deal_ledger.invalidate(u['mt5_login'])
     if res.get('status') == 'error': raise HTTPException(400, res['detail'])
     return res
 
@@ -332,56 +244,98 @@ async def get_trade_history(item: HistoryRequest):
     if not req.get('from_date') and u['virtual_start_date']:
         req['from_date'] = u['virtual_start_date']
     
-    res = await manager.execute(mt5_id, "TRADE_HISTORY", req)
+    res = None
+    if item.group in ("DEALS", "POSITIONS") and deal_ledger.enabled:
+        # Indexed query on the local ledger (closed positions are aggregated as their closing deal
+        # is stored), the terminal is only asked for deals since the last sync
+        if not deal_ledger.ready(mt5_id): await deal_ledger.sync(mt5_id)
+        if deal_ledger.ready(mt5_id):
+            res = await deal_ledger.query(mt5_id, req.get('from_date'), req.get('to_date'),
+                                          item.symbol, item.limit, item.offset, item.group)
+    if res is None:
+        res = await manager.execute(mt5_id, "TRADE_HISTORY", req)
     
     if res.get('status') == 'success':
         # Apply Logic to Deals/Positions for Display
         deals = res.get('deals', [])
         positions = res.get('positions', [])
         
-        # Helper to virtualize one item
-        def virtualize(p):
-            # Same logic as WS
-            if u['mirror_enabled']:
-                if 'type' in p:
-                     t = p['type']
-                     if t == 'BUY': p['type'] = 'SELL'
-                     elif t == 'SELL': p['type'] = 'BUY'
-                # Invert Profit
-                if 'profit' in p: p['profit'] = -p['profit']
-                if 'swap' in p: p['swap'] = -p['swap']
-                # Swap SL/TP for display correctness
-                if 'sl' in p and 'tp' in p:
-                     p['sl'], p['tp'] = p['tp'], p['sl']
-                
-            if u['multiplier'] > 0 and u['multiplier'] != 1.0:
-                if 'volume' in p: p['volume'] = round(p['volume'] / u['multiplier'], 2)
-                if 'profit' in p: p['profit'] = round(p['profit'] / u['multiplier'], 2)
-                
-        for d in deals: virtualize(d)
-        for p in positions: virtualize(p)
+        # Mirror/multiplier view of the rows (columnar, see virtualization.py)
+        virtualization.virtualize_history(deals, u['mirror_enabled'], u['multiplier'])
+        virtualization.virtualize_history(positions, u['mirror_enabled'], u['multiplier'])
         
         # Recalculate Summary based on these virtualized items?
         # Ideally yes, but for "Wallet" we use RAM State. 
         # For "History Tab", we trust this list.
         
     if res.get('status') == 'error': raise HTTPException(400, res['detail'])
-    return res
+    # Plain worker dicts: skip jsonable_encoder (the slow part for thousands of deals)
+    return serialization.FastJSONResponse(res)
 
 @app.get("/history")
-async def get_history(login: str, symbol: str, timeframe: str = "M1", count: int = 300):
+async def get_history(login: str, symbol: str, timeframe: str = "M1", count: int = 300, format: str = "rows",
+                      from_time: Optional[int] = Query(None, alias="from"), to: Optional[int] = None,
+                      before: Optional[int] = None):
+    # format: rows (default, list of bars) | columnar (parallel arrays) | binary (candles.BINARY_DTYPE records)
+    # Window (bar times, server time seconds):
+    #   default           last `count` bars
+    #   before=T          page of `count` bars older than T, plus "next_before"/"has_more" to keep scrolling back
+    #   from=A [&to=B]    every bar in [A, B] (B defaults to the forming bar), streamed in chunks
     u = resolve_user(login)
+    if format not in candles.FORMATS:
+        raise HTTPException(400, f"Unknown format '{format}', expected one of {candles.FORMATS}")
+    # Checked up front: the candle store and live bars key their files/series by this string
+    if timeframe not in TIMEFRAMES:
+        raise HTTPException(400, f"Unknown timeframe '{timeframe}', expected one of {TIMEFRAMES}")
+    broker = u.get('mt5_server')
     
-    req = {
-        "symbol": symbol,
-        "timeframe": timeframe,
-        "count": count
-    }
+    if from_time is not None:
+        if to is not None and to < from_time: raise HTTPException(400, "'to' is before 'from'")
+        segments, err = await candle_store.span(u['mt5_login'], broker, symbol, timeframe, from_time, to)
+        if err: raise HTTPException(400, err.get('detail', 'History failed'))
+        n = candles.count_bars(segments)
+        if format == "binary":
+            return StreamingResponse(candles.stream_binary(segments), media_type="application/octet-stream",
+                                     headers={"X-Candle-Count": str(n), "X-Candle-Layout": candles.BINARY_LAYOUT})
+        if format == "columnar":
+            body = candles.stream_columns(segments, {"status": "success", "format": "columnar", "count": n})
+        else:
+            body = candles.stream_rows(segments, {"status": "success", "count": n})
+        return StreamingResponse(body, media_type="application/json")
     
-    # Use worker to fetch history (CopyRates)
-    res = await manager.execute(u['mt5_login'], "HISTORY", req, timeout=10)
-    if res.get('status') == 'error': raise HTTPException(400, res['detail'])
-    return res
+    extra = {}
+    if before is not None:
+        # Cursor page, straight from the candle store file when it already has it
+        res = await candle_store.page(u['mt5_login'], broker, symbol, timeframe, before, count)
+        if res.get('status') == 'error': raise HTTPException(400, res['detail'])
+        page = res['rates']
+        extra = {"next_before": int(page['time'][0]) if len(page) else None, "has_more": len(page) >= count > 0}
+    else:
+        # Raw rates array, from the live bar builder (seeded/resynced from the candle store + worker's CopyRates)
+        res = await live_bars.rates(u['mt5_login'], symbol, timeframe, count, broker=broker)
+        if res.get('status') == 'error': raise HTTPException(400, res['detail'])
+    
+    rates = res['rates']
+    if format == "binary":
+        headers = {"X-Candle-Count": str(len(rates)), "X-Candle-Layout": candles.BINARY_LAYOUT}
+        if extra:
+            headers["X-Next-Before"] = str(extra['next_before'] or "")
+            headers["X-Has-More"] = "1" if extra['has_more'] else "0"
+        return Response(content=candles.rates_to_binary(rates), media_type="application/octet-stream", headers=headers)
+    # Already plain ints/floats: returning the response skips jsonable_encoder's per-value walk
+    if format == "columnar":
+        return serialization.FastJSONResponse({"status": "success", "format": "columnar", "count": len(rates), "data": candles.rates_to_columns(rates), **extra})
+    return serialization.FastJSONResponse({"status": "success", "data": candles.rates_to_rows(rates), **extra})
+
+@app.get("/stats")
+async def get_stats():
+    # Worker queue depth per lane (urgent/bulk) and queue wait times, websocket fan-out, quote feeds
+    return {"workers": manager.get_stats(),
+            "hubs": {"positions": positions_hub.stats(), "quotes": dict(quotes_metrics)},
+            "quote_sources": quote_sources.stats(),
+            "live_bars": live_bars.get_stats(),
+            "deal_ledger": deal_ledger.get_stats(),
+            "candle_store": candle_store.get_stats()}
 
 # === OPTIMIZED STATE MANAGEMENT ===
 
@@ -391,89 +345,28 @@ RAM_STATE = {}
 
 
 async def sync_history_loop():
+    # Virtual balance = start balance + virtual net profit of every deal since the user's start date,
+    # summed in SQL over the deal ledger (which DealLedger.run keeps current, no terminal call here)
     print("Started Optimized Sync History Loop")
-    # Quotes Loop is now Direct Poll in endpoint
     
     while True:
         try:
             await asyncio.sleep(5) # Check every 5s (Lightweight)
             
-            # Optimization: Move blocking DB call to thread if needed
-            # For now, keep simple but be aware of blocking
-            users = get_all_users()
+            users = await asyncio.to_thread(get_all_users)
             for u in users:
                 app_login = u['app_login']
                 mt5_login = u['mt5_login']
                 
                 if not manager.is_worker_running(mt5_login): continue
                 
-                # 1. Get Sync State
-                sync = get_sync_state(app_login)
-                cached_profit = sync['cached_profit'] if sync else 0.0
-                last_time_str = sync['last_sync_time'] if sync else None
-                
-                # Parse Last Time
-                from_date = u['virtual_start_date'] # Default start
-                if last_time_str:
-                    from_date = last_time_str
-                
-                # 2. Ask MT5 for NEW deals only
-                req = {
-                    "login": mt5_login,
-                    "group": "DEALS",
-                    "from_date": from_date,
-                    "to_date": datetime.now().isoformat()
-                }
-                
-                # Short timeout, background
-                res = await manager.execute(mt5_login, "TRADE_HISTORY", req, timeout=5)
-                
-                if res and res.get('status') == 'success':
-                    deals = res.get('deals', [])
-                    new_profit = 0.0
-                    max_time = 0
-                    
-                    found_new = False
-                    
-                    for d in deals:
-                         # Filter logic could be improved to robustly strictly > last_time
-                         d_time = d.get('time', 0)
-                         if d_time > max_time: max_time = d_time
-                         
-                         # Check strict newness if string comparison is loose
-                         # Or just trust MT5 ranges.
-                         # Apply Multiplier/Mirror Logic to PROFIT
-                         
-                         raw_profit = d.get('profit', 0) + d.get('swap', 0) + d.get('commission', 0)
-                         
-                         virtual_profit = raw_profit
-                         if u['mirror_enabled']:
-                             virtual_profit = virtual_profit * -1
-                             
-                         if u['multiplier'] > 0:
-                             virtual_profit = virtual_profit / u['multiplier']
-                             
-                         new_profit += virtual_profit
-                         
-                         # Basic filter: Only count if deal time > previously synced timestamp
-                         # (Logic requires numeric timestamp comparison for robustness, but here we assume from_date works)
-                         found_new = True
-
-                    # 3. Commit to DB if new
-                    if found_new and max_time > 0:
-                         # Convert max_time timestamp to iso
-                         new_last_sync = datetime.fromtimestamp(max_time + 1).isoformat()
-                         # +1 to avoid overlap next time
-                         
-                         update_sync_state(app_login, new_profit, new_last_sync)
-                         cached_profit += new_profit # Update local for RAM step
-                
-                # 4. Update RAM State (Balance)
-                start_bal = u['virtual_start_balance']
-                current_balance = start_bal + cached_profit
+                sums = await deal_ledger.totals(mt5_login, u['virtual_start_date'])
+                if sums is None: continue # Ledger not synced yet, keep the last balance
+                # The sums are one row as far as the virtualization is concerned (it is linear)
+                closed_profit = virtualization.net_profit([sums], u['mirror_enabled'], u['multiplier'])
                 
                 if app_login not in RAM_STATE: RAM_STATE[app_login] = {}
-                RAM_STATE[app_login]['balance'] = round(current_balance, 2)
+                RAM_STATE[app_login]['balance'] = round(u['virtual_start_balance'] + closed_profit, 2)
                 RAM_STATE[app_login]['multiplier'] = u['multiplier']
                 RAM_STATE[app_login]['mirror'] = u['mirror_enabled']
 
@@ -495,12 +388,16 @@ async def startup_event():
         # Start Worker?
         # Maybe we auto-start all? Or wait for manual?
         # For now, let's respect the "previously running" logic or just start all valid
-        if u['mt5_path'] and os.path.exists(u['mt5_path']):
+        if u['mt5_path'] and (manager.mt5_module == "fake" or os.path.exists(u['mt5_path'])):
              res = manager.start_worker(u['mt5_login'], u['mt5_path'])
              
     # Start Background Loops
     asyncio.create_task(sync_history_loop())
     asyncio.create_task(monitor_positions_task())
+    asyncio.create_task(positions_broadcast_task())
+    asyncio.create_task(manager.supervise())
+    asyncio.create_task(live_bars.run())
+    asyncio.create_task(deal_ledger.run())
 
 async def monitor_positions_task():
     print("Started Background Position Monitor (Auto-Close)")
@@ -512,8 +409,12 @@ async def monitor_positions_task():
                  if not manager.is_worker_running(mt5_login): continue
                  
                  # Fetch Positions for Auto-Close Check
-                 # We use a short timeout
-                 res = await manager.execute(mt5_login, "POSITIONS", None, timeout=2)
+                 # Push mode: read the state cache, otherwise poll with a short timeout
+                 state = manager.get_state(mt5_login)
+                 if state:
+                     res = state['positions']
+                 else:
+                     res = await manager.execute(mt5_login, "POSITIONS", None, timeout=2)
                  
                  if isinstance(res, list):
                      for p in res:
@@ -539,146 +440,327 @@ async def monitor_positions_task():
             
         await asyncio.sleep(2) # Check every 2 seconds
 
+async def build_positions_payload(only=None):
+    # Virtualized account + positions per user: { app_login : {account, positions} }
+    # only: set of app logins to build (None = every user)
+    payload = {}
+    
+    users = get_all_users()
+    for u in users:
+        app_login = u['app_login']
+        mt5_login = u['mt5_login']
+        if only is not None and app_login not in only: continue
+        
+        # Base from RAM (DB Sync)
+        base_data = RAM_STATE.get(app_login, {})
+        virtual_balance = base_data.get('balance', u['virtual_start_balance'])
+        
+        # Fetch Real-Time Floating
+        if manager.is_worker_running(mt5_login):
+            state = manager.get_state(mt5_login)
+            if state:
+                # Push mode: no worker round-trip at all
+                pos_res, acc_res = state['positions'], state['account']
+            else:
+                # One round-trip for both (BATCH)
+                pos_res, acc_res = await manager.execute_many(
+                    mt5_login, [("POSITIONS", None), ("ACCOUNT_INFO", None)], timeout=1)
+            
+            floating = 0.0
+            virtual_positions = []
+            
+            if isinstance(pos_res, list):
+                # Auto-Close is handled in background task. Virtual profit/side/volume per position,
+                # floating = sum of the unrounded virtual profits
+                floating = virtualization.virtualize_positions(pos_res, u['mirror_enabled'], u['multiplier'])
+                virtual_positions = list(pos_res)
+            
+            equity = virtual_balance + floating
+            
+            # Margin Calculation
+            real_margin = acc_res.get('margin', 0) if isinstance(acc_res, dict) else 0
+            v_margin = real_margin
+            if u['multiplier'] > 0: v_margin = v_margin / u['multiplier']
+            
+            free_margin = equity - v_margin
+            
+            payload[app_login] = {
+                "account": {
+                    "login": app_login,
+                    "balance": round(virtual_balance, 2),
+                    "equity": round(equity, 2),
+                    "margin": round(v_margin, 2),
+                    "margin_free": round(free_margin, 2),
+                    "profit": round(floating, 2)
+                },
+                "positions": virtual_positions
+            }
+    return payload
+
+# One producer for all /ws/positions clients. Each account slice is a SharedItem, encoded once per cycle
+# per wire encoding (json/msgpack) and shared; a client's frame is just the join of its items.
+# Delta mode clients get the same slices as sequence-numbered snapshot/delta messages (PositionStream).
+positions_hub = BroadcastHub("Positions Hub")
+positions_stream = PositionStream()
+
+# Clients subscribe to their own accounts with app_login/app_password by message, first thing
+# after connecting and again at any time (repeat for more accounts):
+#   {"action": "subscribe", "login": A, "password": P}   {"action": "unsubscribe", "login": A}
+# Credentials are never taken from the URL (access logs, proxies). A socket gets nothing until it
+# subscribes; WS_POSITIONS_AUTH=optional restores the legacy broadcast of every account to
+# sockets that never subscribed.
+# Delta mode: ?mode=delta or {"action": "mode", "mode": "delta"}; on a seq gap send {"action": "resync", "login": A}.
+# ?encoding=msgpack switches every server frame to binary MessagePack.
+WS_POSITIONS_AUTH = os.getenv("WS_POSITIONS_AUTH", "required")
+POSITIONS_MODES = ("full", "delta")
+
+async def positions_broadcast_task():
+    print("Started Positions Broadcast (1 FPS)")
+    while True:
+        try:
+            if len(positions_hub):
+                payload = await build_positions_payload(only=positions_hub.demand())
+                if payload:
+                    deltas = {}
+                    for login, data in payload.items():
+                        delta = positions_stream.update(login, data)
+                        if delta: deltas[login] = delta
+                    positions_hub.publish({
+                        login: {"item": serialization.SharedItem(login, data), "delta": deltas.get(login)}
+                        for login, data in payload.items()
+                    })
+        except Exception as e:
+            print(f"Positions Broadcast Error: {e}")
+            traceback.print_exc()
+            
+        await asyncio.sleep(1) # 1 FPS Update
+
+def authenticate_app_login(app_login, password):
+    u = get_user_by_app_login(str(app_login))
+    if not u: return "User not found"
+    if u['app_password'] != password: return "Invalid Password"
+    return None
+
+async def send_positions_snapshot(websocket: WebSocket, box, client, login):
+    snap = positions_stream.snapshot(login)
+    if not snap: return
+    client['seq'][login] = snap[0]
+    await box.write(serialization.send(websocket, snap[1].encode(client['encoding'])))
+
+async def send_positions_update(websocket: WebSocket, box, client, batch):
+    # batch: { login : {"item", "delta"} } latest per account (older cycles may have been conflated away)
+    if client['mode'] == "full":
+        items = [m['item'] for m in batch.values()]
+        if items:
+            await box.write(serialization.send(websocket, serialization.join_items(items, client['encoding'])))
+        return
+    
+    # Delta mode: snapshot first, then only deltas that apply on top of what this client has.
+    # A conflated (skipped) delta shows up as have < current seq -> fresh snapshot instead.
+    for login, m in batch.items():
+        delta = m['delta']
+        have = client['seq'].get(login)
+        current = positions_stream.seq(login)
+        if delta and have == delta[0] - 1:
+            client['seq'][login] = delta[0]
+            await box.write(serialization.send(websocket, delta[1].encode(client['encoding'])))
+        elif have is None or (current is not None and have < current):
+            await send_positions_snapshot(websocket, box, client, login)
+
+async def positions_commands(websocket: WebSocket, box, client):
+    # Reads subscribe/unsubscribe/mode/resync messages; closes the outbox when the client goes away
+    try:
+        while True:
+            msg = await serialization.receive(websocket)
+            action = msg.get('action') if isinstance(msg, dict) else None
+            app_login = str(msg.get('login', '')) if action else ''
+            topics = positions_hub.topics(box)
+            
+            if action == "subscribe":
+                error = authenticate_app_login(app_login, msg.get('password'))
+                if error:
+                    await serialization.send_obj(websocket, {"status": "error", "login": app_login, "detail": error}, client['encoding'])
+                    continue
+                positions_hub.set_topics(box, (topics or set()) | {app_login})
+                await serialization.send_obj(websocket, {"status": "subscribed", "login": app_login}, client['encoding'])
+            elif action == "unsubscribe" and topics is not None:
+                positions_hub.set_topics(box, topics - {app_login})
+                client['seq'].pop(app_login, None)
+                await serialization.send_obj(websocket, {"status": "unsubscribed", "login": app_login}, client['encoding'])
+            elif action == "mode" and msg.get('mode') in POSITIONS_MODES:
+                client['mode'] = msg['mode']
+                client['seq'].clear()
+                await serialization.send_obj(websocket, {"status": "mode", "mode": client['mode']}, client['encoding'])
+            elif action == "resync" and client['mode'] == "delta":
+                if topics is None or app_login in topics:
+                    client['seq'].pop(app_login, None)
+                    await send_positions_snapshot(websocket, box, client, app_login)
+            else:
+                await serialization.send_obj(websocket, {"status": "error", "detail": "Expected subscribe/unsubscribe/mode/resync"}, client['encoding'])
+    except Exception:
+        pass
+    box.close()
+
 @app.websocket("/ws/positions")
 async def websocket_positions(websocket: WebSocket):
     await websocket.accept()
+    
+    mode = websocket.query_params.get("mode", "full")
+    client = {
+        "mode": mode if mode in POSITIONS_MODES else "full",
+        "seq": {}, # { login : last seq sent } (delta mode)
+        "encoding": serialization.negotiate(websocket.query_params.get("encoding")),
+    }
+    
+    if "password" in websocket.query_params:
+        await serialization.send_obj(websocket, {"status": "error", "detail": "Credentials in the URL are not accepted, send a subscribe message"}, client['encoding'])
+    # None = every account (legacy, WS_POSITIONS_AUTH=optional), else nothing until a subscribe message authenticates
+    topics = None if WS_POSITIONS_AUTH == "optional" else set()
+    
+    box = positions_hub.subscribe(topics)
+    commands = asyncio.create_task(positions_commands(websocket, box, client))
     try:
         while True:
-            # 1. Iterate RAM State for Active Users
-            payload = {}
-            
-            users = get_all_users()
-            for u in users:
-                app_login = u['app_login']
-                mt5_login = u['mt5_login']
-                
-                # Base from RAM (DB Sync)
-                base_data = RAM_STATE.get(app_login, {})
-                virtual_balance = base_data.get('balance', u['virtual_start_balance'])
-                
-                # Fetch Real-Time Floating
-                if manager.is_worker_running(mt5_login):
-                    pos_res = await manager.execute(mt5_login, "POSITIONS", None, timeout=1)
-                    acc_res = await manager.execute(mt5_login, "ACCOUNT_INFO", None, timeout=1)
-                    
-                    floating = 0.0
-                    virtual_positions = []
-                    
-                    if isinstance(pos_res, list):
-                        for p in pos_res:
-                            # Auto-Close is now handled in background task
-                            
-                            # Calc Virtual Profit per position
-                            raw_p = p.get('profit', 0) + p.get('swap', 0) + p.get('commission', 0)
-                            v_p = raw_p
-                            if u['mirror_enabled']: v_p = -1 * raw_p
-                            if u['multiplier'] > 0: v_p = v_p / u['multiplier']
-                            
-                            floating += v_p
-                            
-                            # Modify p for display
-                            p['profit'] = round(v_p, 2)
-                            # Swap Side string
-                            if u['mirror_enabled']:
-                                p['type'] = 'SELL' if p['type'] == 'BUY' else 'BUY'
-                                # Swap SL/TP logic for visual consistency
-                                _sl = p.get('sl', 0.0)
-                                _tp = p.get('tp', 0.0)
-                                p['sl'] = _tp
-                                p['tp'] = _sl
-                            if u['multiplier'] > 0:
-                                p['volume'] = round(p['volume'] / u['multiplier'], 2)
-                                
-                            virtual_positions.append(p)
-                    
-                    equity = virtual_balance + floating
-                    
-                    # Margin Calculation
-                    real_margin = acc_res.get('margin', 0) if isinstance(acc_res, dict) else 0
-                    v_margin = real_margin
-                    if u['multiplier'] > 0: v_margin = v_margin / u['multiplier']
-                    
-                    free_margin = equity - v_margin
-                    
-                    payload[app_login] = {
-                        "account": {
-                            "login": app_login,
-                            "balance": round(virtual_balance, 2),
-                            "equity": round(equity, 2),
-                            "margin": round(v_margin, 2),
-                            "margin_free": round(free_margin, 2),
-                            "profit": round(floating, 2)
-                        },
-                        "positions": virtual_positions
-                    }
-            
-            if payload:
-                await websocket.send_json(payload)
-            
-            await asyncio.sleep(1) # 1 FPS Update
+            batch = await box.drain()
+            if box.closed: break # Client gone or too slow
+            await send_positions_update(websocket, box, client, batch)
             
+        if box.closed == "slow":
+            print("WS Client Too Slow, Disconnecting (Positions)")
+            await websocket.close(code=CLOSE_SLOW_CLIENT)
+        else:
+            print("WS Client Disconnected (Positions)")
     except WebSocketDisconnect:
         print("WS Client Disconnected (Positions)")
     except Exception as e:
         print(f"WS Positions Error: {e}")
         traceback.print_exc()
+    finally:
+        commands.cancel()
+        positions_hub.unsubscribe(box)
+
+# /ws/quotes protocol (all optional, a bare connection behaves like before):
+#   ?symbols=EURUSD,XAUUSD&format=batch&max_hz=4
+#   {"action": "subscribe", "symbols": [...]}   {"action": "unsubscribe", "symbols": [...]}
+#   {"action": "rate", "max_hz": 4}   {"action": "format", "format": "batch" | "single"}
+# Only symbols whose bid/ask/time moved since the last send go out. "single" sends one
+# {symbol, bid, ask, time, server} frame per symbol (legacy), "batch" one {"type": "quotes", "quotes": [...]} per cycle.
+# "server" is the worker that fed the quote (see quote_sources.py), "mt5_symbol" its broker name when it differs.
+DEFAULT_WATCHLIST = ["EURUSD", "GBPUSD", "USDJPY", "XAUUSD", "BTCUSD"]
+MAX_QUOTE_SYMBOLS = 64 # Per client (board slots are shared by every client of a worker)
+QUOTE_FORMATS = ("single", "batch")
+
+def parse_quote_symbols(symbols):
+    if isinstance(symbols, str): symbols = symbols.split(",")
+    out = []
+    for sym in symbols or []:
+        sym = str(sym).strip()
+        if sym and len(sym) <= 24 and sym.replace(".", "").replace("_", "").replace("#", "").isalnum():
+            out.append(sym)
+    return out
+
+def parse_max_hz(value):
+    # Minimum seconds between frames, 0 = as fast as the source updates
+    try:
+        hz = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 1.0 / hz if hz > 0 else 0.0
+
+async def quotes_commands(websocket: WebSocket, client):
+    try:
+        while True:
+            msg = await serialization.receive(websocket)
+            action = msg.get('action') if isinstance(msg, dict) else None
+            
+            if action in ("subscribe", "unsubscribe"):
+                symbols = parse_quote_symbols(msg.get('symbols'))
+                if action == "subscribe":
+                    added = [sym for sym in symbols if sym not in client['symbols']]
+                    client['symbols'] = (client['symbols'] + added)[:MAX_QUOTE_SYMBOLS]
+                else:
+                    client['symbols'] = [sym for sym in client['symbols'] if sym not in symbols]
+                    for sym in symbols: client['sent'].pop(sym, None)
+                await serialization.send_obj(websocket, {"status": action + "d", "symbols": client['symbols']}, client['encoding'])
+            elif action == "rate":
+                client['min_interval'] = parse_max_hz(msg.get('max_hz'))
+                await serialization.send_obj(websocket, {"status": "rate", "max_hz": msg.get('max_hz')}, client['encoding'])
+            elif action == "format" and msg.get('format') in QUOTE_FORMATS:
+                client['format'] = msg['format']
+                await serialization.send_obj(websocket, {"status": "format", "format": client['format']}, client['encoding'])
+            else:
+                await serialization.send_obj(websocket, {"status": "error", "detail": "Expected subscribe/unsubscribe/rate/format"}, client['encoding'])
+    except Exception:
+        pass
+    client['closed'] = True
+
+quotes_metrics = new_metrics() # Outbox counters of every /ws/quotes client
+
+async def quotes_writer(websocket: WebSocket, client, box):
+    # Sends whatever the reader queued; a slow socket only makes symbols conflate to their latest tick
+    try:
+        while True:
+            batch = await box.drain()
+            if box.closed: break
+            quotes = list(batch.values())
+            if client['format'] == "batch":
+                await box.write(serialization.send_obj(websocket, {"type": "quotes", "quotes": quotes}, client['encoding']))
+            else:
+                for q in quotes:
+                    await box.write(serialization.send_obj(websocket, q, client['encoding']))
+            if client['min_interval']:
+                await asyncio.sleep(client['min_interval']) # Per-client rate cap, newer ticks conflate meanwhile
+    except Exception:
+        box.close(box.closed or "closed")
 
 @app.websocket("/ws/quotes")
 async def websocket_quotes(websocket: WebSocket):
     await websocket.accept()
     print("WS Client Connected (Direct Poll Mode)")
     
-    WATCHLIST = ["EURUSD", "GBPUSD", "USDJPY", "XAUUSD", "BTCUSD"]
+    params = websocket.query_params
+    fmt = params.get("format", "single")
+    client = {
+        "symbols": parse_quote_symbols(params.get("symbols"))[:MAX_QUOTE_SYMBOLS] or list(DEFAULT_WATCHLIST),
+        "format": fmt if fmt in QUOTE_FORMATS else "single",
+        "min_interval": parse_max_hz(params.get("max_hz")),
+        "sent": {}, # { symbol : change key (source + board seq / bid, ask, time) already sent }
+        "encoding": serialization.negotiate(params.get("encoding")),
+        "closed": False,
+    }
+    box = Outbox(quotes_metrics)
+    quotes_metrics["clients"] += 1
+    commands = asyncio.create_task(quotes_commands(websocket, client))
+    writer = asyncio.create_task(quotes_writer(websocket, client, box))
     
     try:
-        while True:
-            # 1. Choose a source (any running worker)
-            active_ids = list(manager.workers.keys())
-            if not active_ids:
-                await asyncio.sleep(1)
-                continue
-                
-            feed_id = active_ids[0]
+        while not client['closed'] and not box.closed:
+            # Healthiest worker(s) for this watchlist: boards read from shared memory, the rest fetched in parallel
+            quotes, interval = await quote_sources.quotes(list(client['symbols']))
             
-            # 2. Fetch Ticks directly
-            # print(f"DEBUG: Direct fetching ticks from {feed_id}...")
-            res = await manager.execute(feed_id, "TICKS", WATCHLIST, timeout=1)
-            
-            ticks = {}
-            # Update: _handle_ticks returns the dict directly, not nested in 'result'
-            if res and isinstance(res, dict) and 'status' not in res:
-                 ticks = res
-                 # print(f"DEBUG: Ticks fetched: {len(ticks)} symbols")
-            elif res and isinstance(res, dict) and res.get('status') == 'error':
-                 print(f"DEBUG: Worker Error: {res}")
-            else:
-                 # Fallback if structure changes
-                 ticks = res.get('result', {}) if isinstance(res, dict) else {}
-                
-            # 3. Stream each tick to this client
-            sent_count = 0
-            for symbol, data in ticks.items():
-                if data['time'] == 0: continue
-                
-                payload = {
-                    "symbol": symbol,
-                    "bid": data['bid'],
-                    "ask": data['ask'],
-                    "time": data['time'],
-                    "server": feed_id 
-                }
-                await websocket.send_json(payload)
-                sent_count += 1
-                
-            # print(f"DEBUG: Sent {sent_count} quotes to client")
+            # Changed ticks only (a failover changes the key, so the new source's quote goes out right away)
+            for symbol, key, msg in quotes:
+                if client['sent'].get(symbol) == key: continue
+                client['sent'][symbol] = key
+                box.put(symbol, msg)
             
-            await asyncio.sleep(0.5) # 2 FPS
+            await asyncio.sleep(interval)
             
+        if box.closed == "slow":
+            print("WS Client Too Slow, Disconnecting (Quotes)")
+            await websocket.close(code=CLOSE_SLOW_CLIENT)
+        else:
+            print("WS Client Disconnected (Quotes)")
     except WebSocketDisconnect:
         print("WS Client Disconnected (Quotes)")
     except Exception as e:
         print(f"WS Quotes Error: {e}")
         # traceback.print_exc()
+    finally:
+        box.close()
+        commands.cancel()
+        writer.cancel()
+        quotes_metrics["clients"] -= 1
 
 # === GUI THREAD ===
 class ServerThread(QThread):
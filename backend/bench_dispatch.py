@@ -0,0 +1,97 @@
+"""
+Micro-benchmark: IPC round-trip latency of AsyncWorkerManager.execute()
+for the "event" (per-worker blocking reader) and "poll" (legacy 10ms sweep) dispatch modes.
+
+Uses an echo worker instead of MT5Worker so it runs without a terminal.
+    python bench_dispatch.py [round_trips] [idle_workers]
+"""
+import sys
+import os
+import time
+import queue
+import asyncio
+import statistics
+import multiprocessing
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from backend.worker_manager import AsyncWorkerManager, DISPATCH_EVENT, DISPATCH_POLL
+except ImportError:
+    from worker_manager import AsyncWorkerManager, DISPATCH_EVENT, DISPATCH_POLL
+
+
+class EchoWorker(multiprocessing.Process):
+    # Same constructor / queue protocol as MT5Worker, replies with the command data
+    def __init__(self, worker_id, terminal_path, command_queue, result_queue, urgent_queue=None, doorbell=None, **kwargs):
+        super().__init__()
+        self.worker_id = worker_id
+        self.command_queue = command_queue
+        self.result_queue = result_queue
+        self.urgent_queue = urgent_queue
+        self.doorbell = doorbell
+
+    def run(self):
+        while True:
+            if not self.doorbell.acquire(timeout=1):
+                continue
+            # One doorbell token == one command on some lane (it may still be in the feeder):
+            # block on the bulk lane briefly instead of spinning, like MT5Worker._next_command
+            command = None
+            while command is None:
+                try:
+                    command = self.urgent_queue.get_nowait()
+                except queue.Empty:
+                    try:
+                        command = self.command_queue.get(timeout=0.001)
+                    except queue.Empty:
+                        pass
+            if command.get("type") == "STOP":
+                break
+            self.result_queue.put({"id": command.get("id"), "result": command.get("data")})
+
+
+async def run_mode(mode, round_trips, idle_workers):
+    manager = AsyncWorkerManager(dispatch_mode=mode, worker_cls=EchoWorker)
+    manager.set_loop(asyncio.get_running_loop())
+
+    logins = list(range(1, idle_workers + 2))
+    for login in logins:
+        manager.start_worker(login, sys.executable)
+
+    # Warm up (process spawn, pipes, feeder threads)
+    for _ in range(20):
+        await manager.execute(logins[0], "ECHO", 0)
+
+    samples = []
+    for i in range(round_trips):
+        t0 = time.perf_counter()
+        await manager.execute(logins[0], "ECHO", i)
+        samples.append((time.perf_counter() - t0) * 1e6)
+
+    # Idle CPU of this process (listener/readers) with every worker connected
+    cpu0 = time.process_time()
+    await asyncio.sleep(2)
+    idle_cpu = (time.process_time() - cpu0) / 2 * 100
+
+    manager.stop_all()
+
+    samples.sort()
+    print(f"[{mode:>5}] workers={len(logins):<4} "
+          f"mean={statistics.mean(samples):9.1f}us  "
+          f"p50={samples[len(samples) // 2]:9.1f}us  "
+          f"p99={samples[int(len(samples) * 0.99) - 1]:9.1f}us  "
+          f"idle_cpu={idle_cpu:5.1f}%", flush=True)
+
+
+def main():
+    round_trips = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    idle_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    for mode in (DISPATCH_POLL, DISPATCH_EVENT):
+        asyncio.run(run_mode(mode, round_trips, idle_workers))
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: /history candle transport, legacy list-of-dicts vs raw rates array.
+
+Simulates the full path for each bar count without a terminal:
+worker-side conversion -> pickle across the queue -> API-side encoding -> JSON body.
+    python bench_history.py [bars ...]
+"""
+import sys
+import os
+import json
+import time
+import pickle
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from backend import candles
+except ImportError:
+    import candles
+
+# Same record layout copy_rates_from_pos returns
+MT5_RATES_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+])
+
+try:
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    jsonable_encoder = None
+
+
+def fake_rates(n):
+    rng = np.random.default_rng(42)
+    rates = np.zeros(n, dtype=MT5_RATES_DTYPE)
+    close = 1.1 + np.cumsum(rng.normal(0, 1e-4, n))
+    rates["time"] = 1_700_000_000 + np.arange(n) * 60
+    rates["open"] = close + rng.normal(0, 5e-5, n)
+    rates["high"] = np.maximum(rates["open"], close) + 1e-4
+    rates["low"] = np.minimum(rates["open"], close) - 1e-4
+    rates["close"] = close
+    rates["tick_volume"] = rng.integers(1, 500, n)
+    return rates
+
+
+def ipc(obj):
+    # multiprocessing.Queue pickles with the default protocol
+    blob = pickle.dumps(obj)
+    return pickle.loads(blob), len(blob)
+
+
+def to_json(body, encoder=None):
+    # Returning a dict from an endpoint goes through jsonable_encoder, JSONResponse does not
+    if encoder: body = encoder(body)
+    return json.dumps(body).encode()
+
+
+def legacy(rates):
+    data_list = []
+    for rate in rates:
+        data_list.append({
+            "time": int(rate['time']),
+            "open": float(rate['open']),
+            "high": float(rate['high']),
+            "low": float(rate['low']),
+            "close": float(rate['close']),
+            "tick_volume": int(rate['tick_volume'])
+        })
+    res, ipc_bytes = ipc({"status": "success", "data": data_list})
+    return to_json(res, jsonable_encoder), ipc_bytes
+
+
+def raw_rows(rates):
+    res, ipc_bytes = ipc({"status": "success", "rates": rates})
+    return to_json({"status": "success", "data": candles.rates_to_rows(res["rates"])}), ipc_bytes
+
+
+def raw_columnar(rates):
+    res, ipc_bytes = ipc({"status": "success", "rates": rates})
+    return to_json({"status": "success", "format": "columnar", "data": candles.rates_to_columns(res["rates"])}), ipc_bytes
+
+
+def raw_binary(rates):
+    res, ipc_bytes = ipc({"status": "success", "rates": rates})
+    return candles.rates_to_binary(res["rates"]), ipc_bytes
+
+
+def bench(fn, rates, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body, ipc_bytes = fn(rates)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, ipc_bytes, len(body)
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [300, 10_000, 100_000]
+    print(f"Legacy JSON path: {'fastapi.jsonable_encoder + json' if jsonable_encoder else 'json'}, raw paths: json (JSONResponse)")
+    for n in sizes:
+        rates = fake_rates(n)
+        repeat = 20 if n <= 10_000 else 3
+        print(f"--- {n} bars ---")
+        for name, fn in (("legacy rows", legacy), ("raw -> rows", raw_rows),
+                         ("raw -> columnar", raw_columnar), ("raw -> binary", raw_binary)):
+            ms, ipc_bytes, body_bytes = bench(fn, rates, repeat)
+            print(f"{name:<16} {ms:9.2f} ms   ipc={ipc_bytes / 1024:9.1f} KiB   body={body_bytes / 1024:9.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark: encoders for the /ws/positions payload and the /trade_history payload.
+
+    stdlib json | fastapi jsonable_encoder + json (default REST path) | orjson | msgpack
+plus the positions fan-out: encoding per subscriber vs SharedItem encoded once and joined.
+    python bench_serialization.py [accounts] [positions_per_account] [deals] [subscribers]
+"""
+import sys
+import os
+import json
+import time
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from backend import serialization
+except ImportError:
+    import serialization
+
+try:
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    jsonable_encoder = None
+
+SYMBOLS = ["EURUSDm", "GBPUSDm", "USDJPYm", "XAUUSDm", "BTCUSDm", "US30m"]
+
+
+def positions_payload(accounts, per_account):
+    # Same shape build_positions_payload() produces
+    rnd = random.Random(1)
+    payload = {}
+    for a in range(accounts):
+        positions = []
+        for i in range(per_account):
+            price = rnd.uniform(1, 2000)
+            positions.append({
+                "ticket": 100000000 + a * 1000 + i, "symbol": rnd.choice(SYMBOLS), "type": rnd.choice(["BUY", "SELL"]),
+                "volume": round(rnd.uniform(0.01, 5), 2), "price_open": round(price, 5),
+                "price_current": round(price * rnd.uniform(0.99, 1.01), 5), "sl": 0.0, "tp": 0.0,
+                "profit": round(rnd.uniform(-500, 500), 2), "time": 1790000000 + i, "status": "OPEN",
+                "comment": "FlutterWorker", "tick_value": 1.0, "tick_size": 0.00001,
+            })
+        payload[f"user{a}"] = {
+            "account": {"login": f"user{a}", "balance": 10000.0, "equity": 10123.45, "margin": 321.0,
+                        "margin_free": 9802.45, "profit": 123.45},
+            "positions": positions,
+        }
+    return payload
+
+
+def trade_history_payload(deals):
+    # Same shape as MT5Worker._handle_trade_history for group=DEALS
+    rnd = random.Random(2)
+    rows = []
+    for i in range(deals):
+        rows.append({
+            "ticket": 200000000 + i, "order": 300000000 + i, "time": 1780000000 + i * 60, "time_msc": (1780000000 + i * 60) * 1000,
+            "type": rnd.choice(["BUY", "SELL"]), "entry": rnd.choice([0, 1]), "magic": 0, "position_id": 100000000 + i // 2,
+            "reason": 3, "volume": round(rnd.uniform(0.01, 5), 2), "price": round(rnd.uniform(1, 2000), 5),
+            "commission": -3.5, "swap": 0.0, "profit": round(rnd.uniform(-500, 500), 2), "fee": 0.0,
+            "symbol": rnd.choice(SYMBOLS), "comment": "FlutterWorker", "external_id": "",
+        })
+    return {"status": "success", "summary": {"profit": 1.0, "commission": -3.5, "swap": 0.0},
+            "deals": rows, "orders": [], "positions": []}
+
+
+def best_ms(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000, out
+
+
+def encoders():
+    yield "json", lambda obj: json.dumps(obj)
+    if jsonable_encoder:
+        yield "jsonable_encoder+json", lambda obj: json.dumps(jsonable_encoder(obj))
+    if serialization.orjson:
+        yield "orjson", serialization.dumps
+    if serialization.msgpack:
+        yield "msgpack", serialization.packb
+
+
+def bench_payload(name, obj, repeat):
+    print(f"--- {name} ---")
+    for enc_name, enc in encoders():
+        ms, out = best_ms(lambda: enc(obj), repeat)
+        print(f"{enc_name:<22} {ms:9.3f} ms   {len(out) / 1024:9.1f} KiB")
+
+
+def bench_fanout(payload, subscribers, repeat):
+    # Every subscriber follows one account (per-account subscriptions)
+    logins = list(payload.keys())
+    print(f"--- positions fan-out, {subscribers} subscribers over {len(logins)} accounts ---")
+
+    def per_client():
+        return [json.dumps({login: payload[login]}) for login in (logins[i % len(logins)] for i in range(subscribers))]
+
+    def shared(encoding):
+        items = {login: serialization.SharedItem(login, data) for login, data in payload.items()}
+        return [serialization.join_items([items[logins[i % len(logins)]]], encoding) for i in range(subscribers)]
+
+    for name, fn in (("json per client", per_client),
+                     ("shared json", lambda: shared(serialization.ENCODING_JSON)),
+                     ("shared msgpack", lambda: shared(serialization.ENCODING_MSGPACK))):
+        if "msgpack" in name and not serialization.msgpack: continue
+        ms, frames = best_ms(fn, repeat)
+        print(f"{name:<22} {ms:9.3f} ms   {sum(len(f) for f in frames) / 1024:9.1f} KiB on the wire")
+
+
+def main():
+    accounts = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    per_account = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    deals = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+    subscribers = int(sys.argv[4]) if len(sys.argv) > 4 else 200
+
+    print(f"orjson={'yes' if serialization.orjson else 'no'} msgpack={'yes' if serialization.msgpack else 'no'}")
+    positions = positions_payload(accounts, per_account)
+    bench_payload(f"positions payload ({accounts} accounts x {per_account} positions)", positions, 20)
+    bench_payload(f"trade history ({deals} deals)", trade_history_payload(deals), 10)
+    bench_fanout(positions, subscribers, 10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Benchmark + parity check: mirror/multiplier virtualization, old per-dict loops vs virtualization.py.
+
+Every view is first checked against the loops it replaced (copied below) on random rows,
+including .xx5 rounding ties, for each mirror/multiplier combination; exits 1 on any difference.
+Then both are timed:
+    python bench_virtualize.py [deals ...]
+"""
+import sys
+import os
+import copy
+import time
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from backend import virtualization
+except ImportError:
+    import virtualization
+
+SYMBOLS = ["EURUSDm", "GBPUSDm", "USDJPYm", "XAUUSDm", "BTCUSDm", "US30m"]
+SETTINGS = [(False, 1.0), (True, 1.0), (False, 2.0), (True, 3.0), (True, 0.5), (False, 0.0), (True, 0.0)]
+
+
+def fake_deals(n, seed=42):
+    # Same shape TRADE_HISTORY "DEALS" rows have
+    rnd = random.Random(seed)
+    deals = []
+    for i in range(n):
+        tie = rnd.random() < 0.1 # Values that sit on a rounding tie once divided
+        deals.append({
+            "ticket": 1000000 + i, "order": 2000000 + i, "time": 1_700_000_000 + i, "time_msc": (1_700_000_000 + i) * 1000,
+            "type": rnd.choice(["BUY", "SELL", "BUY", "SELL", "BALANCE"]), "entry": rnd.choice([0, 1]),
+            "magic": 234000, "position_id": 3000000 + i // 2, "reason": 3,
+            "volume": rnd.choice([0.01, 0.05, 0.1, 0.15, 0.25, 1.0, 2.35]),
+            "price": round(rnd.uniform(0.5, 2.0), 5),
+            "commission": round(rnd.uniform(-5, 0), 2), "swap": round(rnd.uniform(-3, 3), 2),
+            "profit": rnd.randrange(-100000, 100000) / 100 + (0.005 if tie else 0.0),
+            "fee": 0.0, "symbol": rnd.choice(SYMBOLS), "comment": "App [M:0|X:1.0]", "external_id": "",
+        })
+    return deals
+
+
+def fake_positions(n, seed=7):
+    # Same shape POSITIONS rows have
+    rnd = random.Random(seed)
+    return [{
+        "ticket": 4000000 + i, "symbol": rnd.choice(SYMBOLS), "type": rnd.choice(["BUY", "SELL", "BUY LIMIT"]),
+        "volume": rnd.choice([0.01, 0.1, 0.15, 0.25, 1.0, 2.35]), "price_open": round(rnd.uniform(0.5, 2.0), 5),
+        "sl": round(rnd.uniform(0.5, 2.0), 5), "tp": round(rnd.uniform(0.5, 2.0), 5),
+        "profit": rnd.randrange(-100000, 100000) / 100, "swap": round(rnd.uniform(-3, 3), 2), "commission": -0.7,
+        "status": "OPEN",
+    } for i in range(n)]
+
+
+# --- The loops virtualization.py replaced (backend_gui.py) ---
+
+def legacy_history(rows, u):
+    def virtualize(p):
+        if u['mirror_enabled']:
+            if 'type' in p:
+                 t = p['type']
+                 if t == 'BUY': p['type'] = 'SELL'
+                 elif t == 'SELL': p['type'] = 'BUY'
+            if 'profit' in p: p['profit'] = -p['profit']
+            if 'swap' in p: p['swap'] = -p['swap']
+            if 'sl' in p and 'tp' in p:
+                 p['sl'], p['tp'] = p['tp'], p['sl']
+        if u['multiplier'] > 0 and u['multiplier'] != 1.0:
+            if 'volume' in p: p['volume'] = round(p['volume'] / u['multiplier'], 2)
+            if 'profit' in p: p['profit'] = round(p['profit'] / u['multiplier'], 2)
+    for p in rows: virtualize(p)
+
+
+def legacy_positions(rows, u):
+    floating = 0.0
+    for p in rows:
+        raw_p = p.get('profit', 0) + p.get('swap', 0) + p.get('commission', 0)
+        v_p = raw_p
+        if u['mirror_enabled']: v_p = -1 * raw_p
+        if u['multiplier'] > 0: v_p = v_p / u['multiplier']
+        floating += v_p
+        p['profit'] = round(v_p, 2)
+        if u['mirror_enabled']:
+            p['type'] = 'SELL' if p['type'] == 'BUY' else 'BUY'
+            _sl = p.get('sl', 0.0)
+            _tp = p.get('tp', 0.0)
+            p['sl'] = _tp
+            p['tp'] = _sl
+        if u['multiplier'] > 0:
+            p['volume'] = round(p['volume'] / u['multiplier'], 2)
+    return floating
+
+
+def legacy_net_profit(deals, u):
+    new_profit = 0.0
+    for d in deals:
+        raw_profit = d.get('profit', 0) + d.get('swap', 0) + d.get('commission', 0)
+        virtual_profit = raw_profit
+        if u['mirror_enabled']:
+            virtual_profit = virtual_profit * -1
+        if u['multiplier'] > 0:
+            virtual_profit = virtual_profit / u['multiplier']
+        new_profit += virtual_profit
+    return new_profit
+
+
+def check_parity(n):
+    failures = 0
+    deals, positions = fake_deals(n), fake_positions(n)
+    for mirror, multiplier in SETTINGS:
+        u = {"mirror_enabled": 1 if mirror else 0, "multiplier": multiplier}
+        label = f"mirror={mirror} x{multiplier}"
+
+        old, new = copy.deepcopy(deals), copy.deepcopy(deals)
+        legacy_history(old, u)
+        virtualization.virtualize_history(new, u['mirror_enabled'], u['multiplier'])
+        if old != new:
+            failures += 1
+            print(f"DIFF history {label}: {next((a, b) for a, b in zip(old, new) if a != b)}")
+
+        old, new = copy.deepcopy(positions), copy.deepcopy(positions)
+        f_old = legacy_positions(old, u)
+        f_new = virtualization.virtualize_positions(new, u['mirror_enabled'], u['multiplier'])
+        if old != new or f_old != f_new:
+            failures += 1
+            print(f"DIFF positions {label}: floating {f_old} vs {f_new}")
+
+        n_old = legacy_net_profit(deals, u)
+        n_new = virtualization.net_profit(deals, u['mirror_enabled'], u['multiplier'])
+        if n_old != n_new:
+            failures += 1
+            print(f"DIFF net_profit {label}: {n_old} vs {n_new}")
+
+    # Empty input
+    if virtualization.virtualize_positions([], True, 2.0) != 0.0 or virtualization.net_profit([], True, 2.0) != 0.0:
+        failures += 1
+        print("DIFF on empty rows")
+    print(f"Parity on {n} deals/positions x {len(SETTINGS)} settings: {'OK' if not failures else f'{failures} FAILED'}")
+    return failures
+
+
+def bench(fn, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        data = copy.deepcopy(rows)
+        t0 = time.perf_counter()
+        fn(data)
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    if check_parity(20_000): sys.exit(1)
+
+    sizes = [int(a) for a in sys.argv[1:]] or [1_000, 100_000]
+    u = {"mirror_enabled": 1, "multiplier": 3.0}
+    m, x = u['mirror_enabled'], u['multiplier']
+    for n in sizes:
+        deals, positions = fake_deals(n), fake_positions(n)
+        repeat = 10 if n <= 10_000 else 3
+        print(f"--- {n} rows (mirror, x{x}) ---")
+        for name, old, new, rows in (
+            ("history", lambda r: legacy_history(r, u), lambda r: virtualization.virtualize_history(r, m, x), deals),
+            ("positions", lambda r: legacy_positions(r, u), lambda r: virtualization.virtualize_positions(r, m, x), positions),
+            ("net_profit", lambda r: legacy_net_profit(r, u), lambda r: virtualization.net_profit(r, m, x), deals),
+        ):
+            t_old, t_new = bench(old, rows, repeat), bench(new, rows, repeat)
+            print(f"{name:<11} loop {t_old:9.2f} ms   columnar {t_new:9.2f} ms   x{t_old / t_new:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
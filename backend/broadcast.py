@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+
+# === BROADCAST HUB ===
+# One producer computes a payload per cycle, every subscriber (websocket) gets it through its own
+# Outbox. Adding a client costs an outbox + socket write, not another round of worker requests.
+#
+# Messages are keyed (app login, symbol ...). Subscribers may narrow themselves to topics (keys);
+# the hub tracks demand so the producer only builds the keys somebody is listening to.
+#
+# Backpressure: an Outbox holds at most one pending message per key (latest value wins), so a
+# slow client gets the newest state instead of a backlog. A client that leaves messages pending
+# for WS_SLOW_CLIENT_S (or whose socket send blocks for WS_SEND_TIMEOUT_S) is disconnected.
+
+SLOW_CLIENT_AFTER = float(os.getenv("WS_SLOW_CLIENT_S", "10"))
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT_S", "5"))
+MAX_PENDING_KEYS = int(os.getenv("WS_MAX_PENDING", "512"))
+
+CLOSE_SLOW_CLIENT = 1013 # "Try Again Later"
+
+
+def new_metrics():
+    return {"clients": 0, "delivered": 0, "conflated": 0, "dropped": 0, "slow_disconnects": 0, "send_timeouts": 0}
+
+
+class Outbox:
+    """Bounded per-client outbound buffer with latest-value conflation per key."""
+
+    def __init__(self, metrics=None, slow_after=SLOW_CLIENT_AFTER, max_keys=MAX_PENDING_KEYS):
+        self.metrics = metrics if metrics is not None else new_metrics()
+        self.slow_after = slow_after
+        self.max_keys = max_keys
+        self.pending = {} # { key : latest message } not yet written
+        self.since = None # Monotonic time the oldest pending message was queued
+        self.ready = asyncio.Event()
+        self.closed = None # Close reason once closed
+
+    def put(self, key, message):
+        if self.closed: return
+        if self.since is not None and time.monotonic() - self.since > self.slow_after:
+            self.metrics["slow_disconnects"] += 1
+            self.close("slow")
+            return
+        if key in self.pending:
+            self.metrics["conflated"] += 1 # Older value never sent, replaced by this one
+        elif len(self.pending) >= self.max_keys:
+            self.metrics["dropped"] += 1
+            return
+        self.pending[key] = message
+        if self.since is None: self.since = time.monotonic()
+        self.ready.set()
+
+    async def drain(self):
+        # Everything pending as { key : latest message }, {} once closed
+        while not self.pending and not self.closed:
+            self.ready.clear()
+            await self.ready.wait()
+        if self.closed: return {}
+        batch, self.pending, self.since = self.pending, {}, None
+        self.metrics["delivered"] += len(batch)
+        return batch
+
+    async def write(self, coro):
+        # Socket write with a timeout, a stuck peer must not hold the writer forever
+        try:
+            await asyncio.wait_for(coro, timeout=SEND_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.metrics["send_timeouts"] += 1
+            self.close("slow")
+            raise
+
+    def close(self, reason="closed"):
+        if not self.closed:
+            self.closed = reason
+            self.ready.set()
+
+
+class BroadcastHub:
+    def __init__(self, name):
+        self.name = name
+        self.subscribers = {} # { Outbox : set of topics, or None = everything }
+        self.last = {} # { key : message } latest cycle, handed to new subscribers right away
+        self.published = 0
+        self.metrics = new_metrics()
+
+    def __len__(self):
+        return len(self.subscribers)
+
+    def subscribe(self, topics=None):
+        box = Outbox(self.metrics)
+        self.subscribers[box] = set(topics) if topics is not None else None
+        self.metrics["clients"] = len(self.subscribers)
+        self._replay(box, self.subscribers[box])
+        print(f"[{self.name}] Subscriber added ({len(self.subscribers)} total)")
+        return box
+
+    def _replay(self, box, topics):
+        for key, message in self.last.items():
+            if topics is None or key in topics:
+                box.put(key, message)
+
+    def set_topics(self, box, topics):
+        if box not in self.subscribers: return
+        old = self.subscribers[box]
+        self.subscribers[box] = set(topics) if topics is not None else None
+        if topics is not None:
+            # Drop pending messages for keys no longer wanted, replay the newly added ones
+            for key in [k for k in box.pending if k not in topics]: box.pending.pop(key, None)
+            added = set(topics) - (old or set()) if old is not None else set()
+            self._replay(box, added)
+
+    def topics(self, box):
+        return self.subscribers.get(box)
+
+    def unsubscribe(self, box):
+        if self.subscribers.pop(box, False) is not False:
+            box.close()
+            self.metrics["clients"] = len(self.subscribers)
+            print(f"[{self.name}] Subscriber removed ({len(self.subscribers)} total)")
+
+    def demand(self):
+        # Union of subscribed topics, None if anyone wants everything
+        wanted = set()
+        for topics in self.subscribers.values():
+            if topics is None: return None
+            wanted |= topics
+        return wanted
+
+    def publish(self, messages):
+        # messages: { key : message }, shared by every subscriber, so encode once and never mutate them
+        self.last = messages
+        self.published += 1
+        for box, topics in list(self.subscribers.items()):
+            for key, message in messages.items():
+                if topics is None or key in topics:
+                    box.put(key, message)
+
+    def stats(self):
+        demand = self.demand()
+        return dict(self.metrics, published=self.published,
+                    pending=sum(len(box.pending) for box in self.subscribers),
+                    topics="*" if demand is None else len(demand))
@@ -0,0 +1,243 @@
+import os
+import re
+import asyncio
+
+import numpy as np
+
+# === CANDLE STORE ===
+# Closed bars never change, so they are kept on disk: one file of raw STORE_DTYPE records per
+# (broker server, symbol, timeframe), ascending by time, read through a read-only np.memmap.
+#   - tail: every request fetches only the bars since the last stored one (HISTORY "from",
+#     copy_rates_range) - the forming bar plus whatever closed meanwhile, which gets appended
+#   - head: a window reaching further back than the file fetches just the older part
+#     (HISTORY "before", copy_rates_from / "from"+"to", copy_rates_range) and prepends it
+#   - page(before, count) cursor pages and span(start, end) ranges are sliced from the map, a page
+#     that is already on disk costs no terminal call at all
+# Windows of any `count` are sliced from the map, so restarts and repeated chart opens cost one
+# small tail request instead of the whole window. Files are shared by every account on the same
+# broker server. CANDLE_STORE=0 disables it, CANDLE_STORE_DIR moves it.
+
+STORE_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+]) # copy_rates_* layout, 60 bytes per bar
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class CandleStore:
+    def __init__(self, manager, root=None):
+        self.manager = manager
+        self.enabled = os.getenv("CANDLE_STORE", "1") != "0"
+        self.root = root or os.getenv("CANDLE_STORE_DIR") or \
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "candle_store")
+        self.maps = {} # { (broker, symbol, timeframe) : memmap of the file }
+        self.locks = {} # { key : asyncio.Lock } one sync at a time per file
+        self.exhausted = set() # Keys whose terminal has nothing older than the file's first bar
+        self.checked_from = {} # { key : time } range requests already found nothing stored-able before the file from there
+        self.stats = {"requests": 0, "tail_fetches": 0, "head_fetches": 0, "bars_written": 0, "bars_served_from_disk": 0}
+
+    def _path(self, key):
+        broker, symbol, timeframe = (_UNSAFE.sub("_", str(part)) for part in key)
+        return os.path.join(self.root, broker, f"{symbol}_{timeframe}.bin")
+
+    def _bars(self, key):
+        m = self.maps.get(key)
+        if m is not None: return m
+        path = self._path(key)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size % STORE_DTYPE.itemsize:
+            # Torn write (crash mid-append): drop the partial record so appends stay aligned
+            size -= size % STORE_DTYPE.itemsize
+            os.truncate(path, size)
+        if not size: return np.zeros(0, dtype=STORE_DTYPE)
+        m = self.maps[key] = np.memmap(path, dtype=STORE_DTYPE, mode="r", shape=(size // STORE_DTYPE.itemsize,))
+        return m
+
+    def _append(self, key, bars):
+        if not len(bars): return
+        self.maps.pop(key, None) # Remapped on next read to see the new length
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.write(bars.astype(STORE_DTYPE).tobytes())
+        self.stats["bars_written"] += len(bars)
+
+    def _prepend(self, key, bars):
+        # Rare (scrolling further back than ever before): rewrite the file. False if it is busy
+        # (Windows can't replace a file another request still has mapped), the bars are then served unstored.
+        old = np.array(self._bars(key)) # Copy before the map is released
+        self.maps.pop(key, None)
+        path = self._path(key)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(bars.astype(STORE_DTYPE).tobytes())
+            f.write(old.tobytes())
+        try:
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Candle store: could not extend {path}: {e}")
+            os.remove(tmp)
+            return False
+        self.stats["bars_written"] += len(bars)
+        return True
+
+    async def _fetch(self, login, symbol, timeframe, window):
+        req = dict(window, symbol=symbol, timeframe=timeframe, raw=True)
+        return await self.manager.execute(login, "HISTORY", req, timeout=10)
+
+    def _usable(self, broker):
+        return self.enabled and bool(broker)
+
+    async def _sync(self, key, login, symbol, timeframe, count):
+        """
+        Brings the file up to the forming bar. Returns (forming bar as a 1-bar array, None),
+        (None, error result) or (None, None) if the terminal has nothing after our last bar.
+        """
+        stored = self._bars(key)
+        if not len(stored):
+            # First time: the latest `count` bars, everything but the forming one is stored
+            res = await self._fetch(login, symbol, timeframe, {"count": max(count, 2)})
+            if res.get('status') != 'success': return None, res
+            rates = res['rates']
+            if not len(rates): return None, None
+            self._append(key, rates[:-1])
+            if len(rates) < max(count, 2): self.exhausted.add(key)
+            return rates[-1:], None
+
+        # Tail: from the last stored bar up to the forming one
+        last = int(stored['time'][-1])
+        res = await self._fetch(login, symbol, timeframe, {"from": last})
+        self.stats["tail_fetches"] += 1
+        if res.get('status') != 'success': return None, res
+        tail = res['rates']
+        tail = tail[tail['time'] > last]
+        if not len(tail): return None, None # History rebuilt/shortened on the terminal? don't guess
+        self._append(key, tail[:-1])
+        return tail[-1:], None
+
+    async def _extend_head(self, key, login, symbol, timeframe, window):
+        # Fetch bars older than the file ({"before", "count"} or {"from", "to"}) and prepend them.
+        # Returns the fetched bars if they could not be stored, else None.
+        first = int(self._bars(key)['time'][0])
+        res = await self._fetch(login, symbol, timeframe, window)
+        self.stats["head_fetches"] += 1
+        if res.get('status') != 'success': return None
+        older = res['rates']
+        older = older[older['time'] < first]
+        if "count" in window and len(older) < window["count"]: self.exhausted.add(key)
+        if len(older) and not self._prepend(key, older): return older
+        return None
+
+    async def rates(self, login, broker, symbol, timeframe, count):
+        """
+        Same result as a raw HISTORY command ({"status", "rates"} or an error): the last `count`
+        bars, the forming one from the terminal and the closed ones from disk.
+        """
+        if not self._usable(broker) or count <= 0:
+            return await self._fetch(login, symbol, timeframe, {"count": count})
+
+        key = (broker, symbol, timeframe)
+        self.stats["requests"] += 1
+        async with self.locks.setdefault(key, asyncio.Lock()):
+            forming, err = await self._sync(key, login, symbol, timeframe, count)
+            if err: return err
+            if forming is None: return await self._fetch(login, symbol, timeframe, {"count": count})
+
+            # Head: older bars than the file has, if the window reaches that far back
+            stored = self._bars(key)
+            missing = count - 1 - len(stored)
+            unstored = None
+            if missing > 0 and key not in self.exhausted:
+                unstored = await self._extend_head(key, login, symbol, timeframe,
+                                                   {"before": int(stored['time'][0]) - 1, "count": missing})
+                stored = self._bars(key)
+
+            closed = np.array(stored[len(stored) - min(count - 1, len(stored)):]) # Copy out of the map
+            if unstored is not None: closed = np.concatenate((unstored.astype(STORE_DTYPE), closed))
+            self.stats["bars_served_from_disk"] += len(closed)
+            return {"status": "success", "rates": np.concatenate((closed.astype(forming.dtype), forming))}
+
+    async def page(self, login, broker, symbol, timeframe, before, count):
+        """
+        Cursor page: up to `count` bars strictly older than `before` (a bar time), oldest first.
+        Pages inside the file cost no terminal call at all.
+        """
+        if not self._usable(broker) or count <= 0:
+            return await self._fetch(login, symbol, timeframe, {"before": before - 1, "count": max(count, 0)})
+
+        key = (broker, symbol, timeframe)
+        self.stats["requests"] += 1
+        async with self.locks.setdefault(key, asyncio.Lock()):
+            stored = self._bars(key)
+            forming = None
+            if not len(stored) or before > int(stored['time'][-1]):
+                # Page reaches past the file's end: bring it up to date first
+                forming, err = await self._sync(key, login, symbol, timeframe, count)
+                if err: return err
+                if forming is None:
+                    return await self._fetch(login, symbol, timeframe, {"before": before - 1, "count": count})
+                stored = self._bars(key)
+            if before < int(stored['time'][0]):
+                # Cursor further back than the file starts (not a next_before we handed out): bars
+                # prepended to the file would not reach it, and storing from there would leave a gap
+                return await self._fetch(login, symbol, timeframe, {"before": before - 1, "count": count})
+            newest = forming if forming is not None and forming['time'][0] < before else None
+            need = count - (1 if newest is not None else 0)
+
+            idx = int(np.searchsorted(stored['time'], before)) # stored[:idx] are older than the cursor
+            unstored = None
+            if idx < need and key not in self.exhausted:
+                unstored = await self._extend_head(key, login, symbol, timeframe,
+                                                   {"before": int(stored['time'][0]) - 1, "count": need - idx})
+                stored = self._bars(key)
+                idx = int(np.searchsorted(stored['time'], before))
+
+            closed = np.array(stored[max(0, idx - need):idx])
+            if unstored is not None: closed = np.concatenate((unstored.astype(STORE_DTYPE), closed))[-need:] if need else closed[:0]
+            self.stats["bars_served_from_disk"] += len(closed)
+            if newest is not None: closed = np.concatenate((closed, newest.astype(STORE_DTYPE)))
+            return {"status": "success", "rates": closed}
+
+    async def span(self, login, broker, symbol, timeframe, start, end=None):
+        """
+        Every bar with start <= time <= end (None = up to the forming bar), as a list of arrays
+        to stream from - memmap slices of the file, not copies. Returns (segments, None) or (None, error).
+        """
+        if not self._usable(broker):
+            window = {"from": start} if end is None else {"from": start, "to": end}
+            res = await self._fetch(login, symbol, timeframe, window)
+            return ([res['rates']], None) if res.get('status') == 'success' else (None, res)
+
+        key = (broker, symbol, timeframe)
+        self.stats["requests"] += 1
+        async with self.locks.setdefault(key, asyncio.Lock()):
+            stored = self._bars(key)
+            forming = None
+            if not len(stored) or end is None or end > int(stored['time'][-1]):
+                forming, err = await self._sync(key, login, symbol, timeframe, 2)
+                if err: return None, err
+                stored = self._bars(key)
+
+            unstored = None
+            if len(stored):
+                first = int(stored['time'][0])
+                if start < min(first, self.checked_from.get(key, first)) and key not in self.exhausted:
+                    unstored = await self._extend_head(key, login, symbol, timeframe, {"from": start, "to": first - 1})
+                    self.checked_from[key] = start # Nothing more to find before the file from here on
+                    stored = self._bars(key)
+
+            segments = []
+            if unstored is not None:
+                segments.append(unstored[(unstored['time'] >= start) & (end is None or unstored['time'] <= end)])
+            times = stored['time']
+            lo = int(np.searchsorted(times, start))
+            hi = len(times) if end is None else int(np.searchsorted(times, end, side="right"))
+            segments.append(stored[lo:hi])
+            if forming is not None and forming['time'][0] >= start and (end is None or forming['time'][0] <= end):
+                segments.append(forming)
+            self.stats["bars_served_from_disk"] += hi - lo
+            return segments, None
+
+    def get_stats(self):
+        return dict(self.stats, files=len(self.maps), root=self.root)
@@ -0,0 +1,95 @@
+import numpy as np
+
+try:
+    from backend import serialization
+except ImportError:
+    import serialization
+
+# === CANDLE ENCODING ===
+# Workers hand back the raw NumPy rates array from copy_rates_* (pickled as one
+# contiguous buffer, no per-bar objects). The API turns it into one of:
+#   rows     - [{"time", "open", "high", "low", "close", "tick_volume"}, ...] (legacy shape)
+#   columnar - {"time": [...], "open": [...], ...} parallel arrays
+#   binary   - packed little-endian records, BINARY_DTYPE, 48 bytes per bar
+
+CANDLE_FIELDS = ("time", "open", "high", "low", "close", "tick_volume")
+
+BINARY_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"),
+    ("low", "<f8"), ("close", "<f8"), ("tick_volume", "<i8"),
+])
+BINARY_LAYOUT = "time:i8,open:f8,high:f8,low:f8,close:f8,tick_volume:i8"
+
+FORMATS = ("rows", "columnar", "binary")
+
+STREAM_CHUNK = 5000 # Bars encoded at a time when streaming a range
+
+
+def _columns(rates):
+    # tolist() converts a whole column to Python ints/floats in C
+    return [rates[f].astype(BINARY_DTYPE[f]).tolist() for f in CANDLE_FIELDS]
+
+
+def rates_to_rows(rates):
+    return [dict(zip(CANDLE_FIELDS, bar)) for bar in zip(*_columns(rates))]
+
+
+def rates_to_columns(rates):
+    return dict(zip(CANDLE_FIELDS, _columns(rates)))
+
+
+def rates_to_binary(rates):
+    out = np.empty(len(rates), dtype=BINARY_DTYPE)
+    for f in CANDLE_FIELDS:
+        out[f] = rates[f]
+    return out.tobytes()
+
+
+# --- Streaming (range requests) ---
+# Input is a list of rates arrays (memmap slices from the candle store, or terminal pages), output
+# the same JSON/binary documents as above in pieces, so only STREAM_CHUNK bars are ever turned
+# into Python objects at once.
+
+def count_bars(segments):
+    return sum(len(seg) for seg in segments)
+
+
+def _chunks(segments, size=STREAM_CHUNK):
+    for seg in segments:
+        for i in range(0, len(seg), size):
+            yield np.asarray(seg[i:i + size])
+
+
+def _array_body(parts):
+    # JSON arrays (bytes) -> their comma-joined contents, empty ones skipped
+    first = True
+    for part in parts:
+        body = part[1:-1]
+        if not body: continue
+        yield body if first else b"," + body
+        first = False
+
+
+def _header(fields):
+    # Leading members of the JSON object, e.g. {"status": "success", "count": 10}
+    return b"{" + b"".join(serialization.dumps(k) + b":" + serialization.dumps(v) + b"," for k, v in fields.items())
+
+
+def stream_rows(segments, fields):
+    yield _header(fields) + b'"data":['
+    yield from _array_body(serialization.dumps(rates_to_rows(c)) for c in _chunks(segments))
+    yield b"]}"
+
+
+def stream_columns(segments, fields):
+    yield _header(fields) + b'"data":{'
+    for n, f in enumerate(CANDLE_FIELDS):
+        yield (b"," if n else b"") + serialization.dumps(f) + b":["
+        yield from _array_body(serialization.dumps(c[f].astype(BINARY_DTYPE[f]).tolist()) for c in _chunks(segments))
+        yield b"]"
+    yield b"}}"
+
+
+def stream_binary(segments):
+    for c in _chunks(segments):
+        yield rates_to_binary(c)
@@ -6,6 +6,9 @@ from typing import Optional, Dict, List
 
 DB_FILE = os.path.join(os.path.dirname(__file__), "mirror_trade.db")
 
+DEAL_ENTRY_IN, DEAL_ENTRY_OUT, DEAL_ENTRY_OUT_BY = 0, 1, 3 # MT5 deal entry values (stored as-is in `deals`)
+SCHEMA_VERSION = 1 # PRAGMA user_version once init_db's one-off migrations are done (1: closed_positions backfill)
+
 def get_db_connection():
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
@@ -54,6 +57,68 @@ def init_db():
         )
     ''')
     
+    # 3. Deals Table (Local Ledger of MT5 Deals, appended by the deal ledger sync)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS deals (
+            mt5_login INTEGER NOT NULL,
+            ticket INTEGER NOT NULL,
+            "order" INTEGER,
+            time INTEGER NOT NULL,
+            time_msc INTEGER,
+            type TEXT,
+            entry INTEGER,
+            magic INTEGER,
+            position_id INTEGER,
+            reason INTEGER,
+            volume REAL,
+            price REAL,
+            commission REAL DEFAULT 0.0,
+            swap REAL DEFAULT 0.0,
+            profit REAL DEFAULT 0.0,
+            fee REAL DEFAULT 0.0,
+            symbol TEXT,
+            comment TEXT,
+            external_id TEXT,
+            PRIMARY KEY (mt5_login, ticket)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_deals_login_time ON deals (mt5_login, time)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_deals_login_position ON deals (mt5_login, position_id)")
+    
+    # 4. Closed Positions Table (Aggregated from the ledger's deals when a closing deal arrives)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS closed_positions (
+            mt5_login INTEGER NOT NULL,
+            ticket INTEGER NOT NULL,
+            symbol TEXT,
+            type TEXT,
+            volume REAL,
+            open_time INTEGER,
+            close_time INTEGER,
+            open_price REAL,
+            close_price REAL,
+            profit REAL DEFAULT 0.0,
+            commission REAL DEFAULT 0.0,
+            swap REAL DEFAULT 0.0,
+            net_profit REAL DEFAULT 0.0,
+            time INTEGER NOT NULL,
+            comment TEXT,
+            PRIMARY KEY (mt5_login, ticket)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_closed_positions_login_time ON closed_positions (mt5_login, time)")
+    
+    # Ledgers filled before the table existed: aggregate what they already have. Runs once per
+    # database file (user_version), not on every start while closed_positions is still empty
+    c.execute("PRAGMA user_version")
+    if c.fetchone()[0] < 1:
+        c.execute(f"SELECT DISTINCT mt5_login, position_id FROM deals WHERE entry IN ({DEAL_ENTRY_OUT}, {DEAL_ENTRY_OUT_BY})")
+        by_login = {}
+        for row in c.fetchall(): by_login.setdefault(row[0], []).append(row[1])
+        for mt5_login, position_ids in by_login.items():
+            _finalize_positions(c, mt5_login, position_ids)
+    c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
     conn.commit()
     conn.close()
     print(f"Database initialized at {DB_FILE}")
@@ -180,6 +245,104 @@ def reset_sync_state(app_login: str):
     conn.commit()
     conn.close()
 
+# === Deal Ledger ===
+# Same fields as the worker's TRADE_HISTORY "DEALS" rows (type already converted to "BUY"/"SELL"...)
+DEAL_COLUMNS = ("ticket", "order", "time", "time_msc", "type", "entry", "magic", "position_id", "reason",
+                "volume", "price", "commission", "swap", "profit", "fee", "symbol", "comment", "external_id")
+
+def get_deal_watermark(mt5_login: int):
+    # (newest deal time, highest deal ticket) stored for this account, (None, None) if none yet
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT MAX(time), MAX(ticket) FROM deals WHERE mt5_login = ?", (mt5_login,))
+    row = c.fetchone()
+    conn.close()
+    return row[0], row[1]
+
+def insert_deals(mt5_login: int, deals: List[Dict]):
+    # Known tickets are ignored, so overlapping sync windows are harmless. Returns rows added.
+    # Closing deals (re)finalize their position's closed_positions row in the same transaction.
+    if not deals: return 0
+    cols = ", ".join(f'"{k}"' for k in DEAL_COLUMNS)
+    marks = ", ".join("?" for _ in range(len(DEAL_COLUMNS) + 1))
+    rows = [(mt5_login,) + tuple(d.get(k) for k in DEAL_COLUMNS) for d in deals]
+    conn = get_db_connection()
+    c = conn.cursor()
+    before = conn.total_changes
+    c.executemany(f"INSERT OR IGNORE INTO deals (mt5_login, {cols}) VALUES ({marks})", rows)
+    added = conn.total_changes - before
+    closing = {d.get('position_id') for d in deals if d.get('entry') in (DEAL_ENTRY_OUT, DEAL_ENTRY_OUT_BY)}
+    if added and closing: _finalize_positions(c, mt5_login, list(closing))
+    conn.commit()
+    conn.close()
+    return added
+
+def _finalize_positions(c, mt5_login: int, position_ids: List[int]):
+    # Aggregate every stored deal of these positions into their closed_positions rows.
+    # Same row as the worker's TRADE_HISTORY "POSITIONS" group builds.
+    deals_by_id = {}
+    for i in range(0, len(position_ids), 500): # SQLite caps bound parameters per statement
+        chunk = position_ids[i:i + 500]
+        c.execute(f'''SELECT position_id, type, entry, symbol, volume, price, time, profit, commission, swap, comment
+                     FROM deals WHERE mt5_login = ? AND position_id IN ({", ".join("?" for _ in chunk)})
+                     ORDER BY time, ticket''', [mt5_login] + chunk)
+        for row in c.fetchall(): deals_by_id.setdefault(row['position_id'], []).append(row)
+    
+    rows = []
+    for pid, deals in deals_by_id.items():
+        entry_deal = next((d for d in deals if d['entry'] == DEAL_ENTRY_IN), deals[0])
+        exit_deal = next((d for d in reversed(deals) if d['entry'] in (DEAL_ENTRY_OUT, DEAL_ENTRY_OUT_BY)), None)
+        if exit_deal is None: continue
+        profit = sum(d['profit'] for d in deals)
+        commission = sum(d['commission'] for d in deals)
+        swap = sum(d['swap'] for d in deals)
+        rows.append((mt5_login, pid, entry_deal['symbol'], "BUY" if entry_deal['type'] == "BUY" else "SELL",
+                     entry_deal['volume'], entry_deal['time'], exit_deal['time'], entry_deal['price'], exit_deal['price'],
+                     profit, commission, swap, profit + commission + swap, exit_deal['time'], entry_deal['comment']))
+    c.executemany('''INSERT OR REPLACE INTO closed_positions (
+                         mt5_login, ticket, symbol, type, volume, open_time, close_time, open_price, close_price,
+                         profit, commission, swap, net_profit, time, comment
+                     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+
+POSITION_COLUMNS = ("ticket", "symbol", "type", "volume", "open_time", "close_time", "open_price", "close_price",
+                    "profit", "commission", "swap", "net_profit", "time", "comment")
+
+def query_deals(mt5_login: int, from_time: Optional[int] = None, to_time: Optional[int] = None,
+                symbol: Optional[str] = None, limit: Optional[int] = None, offset: int = 0, table: str = "deals"):
+    # Newest first (ties in ticket order, like the worker's sort), from `deals` or `closed_positions` (by close time).
+    # Returns (rows, total matching, {"profit", "commission", "swap"} sums over all matching)
+    columns = POSITION_COLUMNS if table == "closed_positions" else DEAL_COLUMNS
+    where = ["mt5_login = ?"]
+    params = [mt5_login]
+    if from_time is not None:
+        where.append("time >= ?")
+        params.append(from_time)
+    if to_time is not None:
+        where.append("time <= ?")
+        params.append(to_time)
+    if symbol:
+        where.append("symbol = ?")
+        params.append(symbol)
+    where = " AND ".join(where)
+    
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute(f"SELECT COUNT(*), TOTAL(profit), TOTAL(commission), TOTAL(swap) FROM {table} WHERE {where}", params)
+    total, profit, commission, swap = c.fetchone()
+    
+    cols = ", ".join(f'"{k}"' for k in columns)
+    query = f"SELECT {cols} FROM {table} WHERE {where} ORDER BY time DESC, ticket"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+    elif offset:
+        query += " LIMIT -1 OFFSET ?"
+        params.append(offset)
+    c.execute(query, params)
+    rows = [dict(row) for row in c.fetchall()]
+    conn.close()
+    return rows, total, {"profit": profit, "commission": commission, "swap": swap}
+
 # Initialize on Import if not exists
 if not os.path.exists(DB_FILE):
     init_db()
@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timedelta
+
+try:
+    from backend.database import get_all_users, get_deal_watermark, insert_deals, query_deals
+except ImportError:
+    from database import get_all_users, get_deal_watermark, insert_deals, query_deals
+
+# === DEAL LEDGER ===
+# Local copy of every account's MT5 deals in the `deals` table, so /trade_history is an indexed
+# query instead of history_deals_get over the whole account age on every request.
+#   - first sync pulls everything the worker's TRADE_HISTORY default range has (since 2023-01-01)
+#   - after that only deals from the stored high-watermark on: the newest stored time (minus
+#     DEAL_LEDGER_OVERLAP_S for same-second / late deals) is the request window, deals at or
+#     below both the time and ticket watermarks are dropped, the rest INSERT OR IGNORE by ticket
+# Every running account syncs every DEAL_LEDGER_SYNC_S and requests are served straight from the
+# table. Only a ledger invalidated by a trade/close through us, or one the sync loop hasn't reached
+# for DEAL_LEDGER_FRESH_S (at least the sync interval, i.e. the loop is behind), pulls the tail first.
+# Virtual balances (sync_history_loop) are SQL sums over the same table, see totals().
+# A closing deal (DEAL_ENTRY_OUT/OUT_BY) finalizes its position's closed_positions row as it is
+# stored, so position history is a lookup too instead of regrouping every deal on each request.
+# DEAL_LEDGER=0 serves straight from the terminal.
+
+SYNC_INTERVAL = float(os.getenv("DEAL_LEDGER_SYNC_S", "5"))
+FRESH_FOR = max(float(os.getenv("DEAL_LEDGER_FRESH_S", str(SYNC_INTERVAL * 2))), SYNC_INTERVAL)
+OVERLAP = int(os.getenv("DEAL_LEDGER_OVERLAP_S", "60"))
+
+SYNC_TIMEOUT = 30 # First sync of an old account is one big history_deals_get
+
+
+def parse_time(d_str):
+    # ISO date string from the app -> epoch seconds, same reading as the worker's parse_date
+    if not d_str: return None
+    try:
+        return int(datetime.fromisoformat(d_str.replace('Z', '+00:00')).timestamp())
+    except ValueError:
+        return None
+
+
+class DealLedger:
+    def __init__(self, manager):
+        self.manager = manager
+        self.enabled = os.getenv("DEAL_LEDGER", "1") != "0"
+        self.synced_at = {} # { mt5_login : monotonic time of the last successful sync }
+        self.locks = {} # { mt5_login : asyncio.Lock } one sync at a time per account
+        self.stale = set() # mt5_logins with deals of their own we haven't pulled yet
+        self.stats = {"syncs": 0, "failed": 0, "deals_added": 0, "queries": 0}
+
+    def ready(self, login):
+        return self.enabled and login in self.synced_at
+
+    def invalidate(self, login):
+        self.stale.add(login)
+
+    async def sync(self, login):
+        """Appends deals newer than the watermark. False if the terminal could not be asked."""
+        lock = self.locks.setdefault(login, asyncio.Lock())
+        if lock.locked():
+            # Someone is already syncing this account, their result is as fresh as ours would be
+            async with lock: return login in self.synced_at
+        async with lock:
+            self.stale.discard(login) # Anything invalidated from here on lands after this fetch
+            last_time, last_ticket = await asyncio.to_thread(get_deal_watermark, login)
+            # Server time can run ahead of ours, leave the end open by a day
+            req = {"group": "DEALS", "to_date": (datetime.now() + timedelta(days=1)).isoformat()}
+            if last_time is not None:
+                req["from_date"] = datetime.fromtimestamp(max(last_time - OVERLAP, 0)).isoformat()
+
+            res = await self.manager.execute(login, "TRADE_HISTORY", req, timeout=SYNC_TIMEOUT)
+            if not isinstance(res, dict) or res.get('status') != 'success':
+                self.stats["failed"] += 1
+                if login in self.synced_at: self.stale.add(login) # Retry on next use
+                return False
+
+            deals = res.get('deals', [])
+            if last_time is not None:
+                deals = [d for d in deals if d['time'] > last_time or d['ticket'] > last_ticket]
+            if deals:
+                added = await asyncio.to_thread(insert_deals, login, deals)
+                self.stats["deals_added"] += added
+            self.synced_at[login] = time.monotonic()
+            self.stats["syncs"] += 1
+            return True
+
+    async def _fresh(self, login):
+        if login in self.stale or time.monotonic() - self.synced_at.get(login, 0) > FRESH_FOR:
+            await self.sync(login)
+
+    async def query(self, login, from_date=None, to_date=None, symbol=None, limit=None, offset=0, group="DEALS"):
+        """
+        TRADE_HISTORY-shaped result for "DEALS" or "POSITIONS" (closed, by close time) from the
+        ledger: newest first, summary over every matching row (not just the page) plus "total" for paging.
+        """
+        await self._fresh(login)
+        self.stats["queries"] += 1
+        table = "closed_positions" if group == "POSITIONS" else "deals"
+        rows, total, sums = await asyncio.to_thread(query_deals, login, parse_time(from_date), parse_time(to_date),
+                                                    symbol, limit, offset, table)
+        summary = dict(sums, balance=0.0, deposit=0.0)
+        return {"status": "success", "summary": summary, "orders": [], "total": total,
+                "deals": rows if group == "DEALS" else [], "positions": rows if group == "POSITIONS" else []}
+
+    async def totals(self, login, from_date=None):
+        """
+        {"profit", "commission", "swap"} summed over every deal since from_date, None until the
+        first sync is done. With DEAL_LEDGER=0 one TRADE_HISTORY over the range is summed instead.
+        """
+        if not self.enabled:
+            req = {"group": "DEALS", "from_date": from_date, "to_date": (datetime.now() + timedelta(days=1)).isoformat()}
+            res = await self.manager.execute(login, "TRADE_HISTORY", req, timeout=SYNC_TIMEOUT)
+            if not isinstance(res, dict) or res.get('status') != 'success': return None
+            deals = res.get('deals', [])
+            return {k: sum(d.get(k, 0) for d in deals) for k in ("profit", "commission", "swap")}
+        if login not in self.synced_at: return None # run() does the (possibly long) first sync
+        await self._fresh(login)
+        _, _, sums = await asyncio.to_thread(query_deals, login, parse_time(from_date), None, None, 0)
+        return sums
+
+    async def run(self):
+        """Keeps the ledger of every running account current."""
+        print("Deal Ledger Started")
+        while True:
+            try:
+                if self.enabled:
+                    users = await asyncio.to_thread(get_all_users)
+                    logins = {u['mt5_login'] for u in users}
+                    logins = [l for l in logins if self.manager.is_worker_running(l) and l not in self.manager.recovering]
+                    await asyncio.gather(*(self.sync(l) for l in logins))
+            except Exception as e:
+                print(f"Deal Ledger Error: {e}")
+            await asyncio.sleep(SYNC_INTERVAL)
+
+    def get_stats(self):
+        return dict(self.stats, accounts=len(self.synced_at))
@@ -0,0 +1,733 @@
+"""
+Deterministic stand-in for the MetaTrader5 package (Linux CI / perf lab).
+
+Select it with MT5_MODULE=fake; MT5Worker then imports this module instead of MetaTrader5.
+Only the calls the backend uses are implemented, with the same names, return types
+(namedtuples / NumPy rates arrays) and constants.
+
+Knobs (environment, read at import in the worker process):
+    FAKE_MT5_SEED        price path seed (default 1)
+    FAKE_MT5_SUFFIX      broker suffix appended to every symbol (default "m", e.g. EURUSDm)
+    FAKE_MT5_BALANCE     starting balance (default 10000)
+    FAKE_MT5_TICK_MS     tick period, prices/time_msc change once per period (default 100)
+    FAKE_MT5_LATENCY_MS  added latency for every call (default 0)
+    FAKE_MT5_LATENCY     per-call overrides, e.g. "order_send=40,copy_rates_from_pos=5"
+"""
+import os
+import time
+import math
+import zlib
+import fnmatch
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+# === CONSTANTS (same values as MetaTrader5) ===
+TIMEFRAME_M1, TIMEFRAME_M2, TIMEFRAME_M3, TIMEFRAME_M4, TIMEFRAME_M5 = 1, 2, 3, 4, 5
+TIMEFRAME_M6, TIMEFRAME_M10, TIMEFRAME_M12, TIMEFRAME_M15, TIMEFRAME_M20, TIMEFRAME_M30 = 6, 10, 12, 15, 20, 30
+TIMEFRAME_H1, TIMEFRAME_H2, TIMEFRAME_H3, TIMEFRAME_H4 = 16385, 16386, 16387, 16388
+TIMEFRAME_H6, TIMEFRAME_H8, TIMEFRAME_H12 = 16390, 16392, 16396
+TIMEFRAME_D1, TIMEFRAME_W1, TIMEFRAME_MN1 = 16408, 32769, 49153
+
+ORDER_TYPE_BUY, ORDER_TYPE_SELL = 0, 1
+ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_SELL_LIMIT = 2, 3
+ORDER_TYPE_BUY_STOP, ORDER_TYPE_SELL_STOP = 4, 5
+ORDER_TYPE_BUY_STOP_LIMIT, ORDER_TYPE_SELL_STOP_LIMIT, ORDER_TYPE_CLOSE_BY = 6, 7, 8
+
+ORDER_STATE_STARTED, ORDER_STATE_PLACED, ORDER_STATE_CANCELED = 0, 1, 2
+ORDER_STATE_PARTIAL, ORDER_STATE_FILLED, ORDER_STATE_REJECTED = 3, 4, 5
+
+ORDER_FILLING_FOK, ORDER_FILLING_IOC, ORDER_FILLING_RETURN = 0, 1, 2
+ORDER_TIME_GTC, ORDER_TIME_DAY, ORDER_TIME_SPECIFIED, ORDER_TIME_SPECIFIED_DAY = 0, 1, 2, 3
+
+SYMBOL_FILLING_FOK, SYMBOL_FILLING_IOC = 1, 2
+
+TRADE_ACTION_DEAL, TRADE_ACTION_PENDING, TRADE_ACTION_SLTP = 1, 5, 6
+TRADE_ACTION_MODIFY, TRADE_ACTION_REMOVE, TRADE_ACTION_CLOSE_BY = 7, 8, 10
+
+TRADE_RETCODE_REJECT = 10006
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_INVALID_PRICE = 10015
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_NO_MONEY = 10019
+TRADE_RETCODE_INVALID_ORDER = 10035
+TRADE_RETCODE_POSITION_CLOSED = 10036
+
+DEAL_TYPE_BUY, DEAL_TYPE_SELL, DEAL_TYPE_BALANCE, DEAL_TYPE_CREDIT = 0, 1, 2, 3
+DEAL_ENTRY_IN, DEAL_ENTRY_OUT, DEAL_ENTRY_INOUT, DEAL_ENTRY_OUT_BY = 0, 1, 2, 3
+DEAL_REASON_CLIENT, DEAL_REASON_EXPERT, DEAL_REASON_SL, DEAL_REASON_TP = 0, 3, 4, 5
+
+POSITION_TYPE_BUY, POSITION_TYPE_SELL = 0, 1
+
+RES_S_OK = 1
+RES_E_FAIL = -1
+RES_E_INVALID_PARAMS = -2
+RES_E_NOT_FOUND = -4
+RES_E_INTERNAL_FAIL = -10001
+RES_E_AUTH_FAILED = -6
+
+# === RECORD TYPES ===
+TerminalInfo = namedtuple("TerminalInfo", "connected trade_allowed name company path data_path build")
+AccountInfo = namedtuple("AccountInfo", "login trade_mode leverage limit_orders margin_so_mode trade_allowed "
+                                        "trade_expert margin_mode currency_digits fifo_close balance credit profit "
+                                        "equity margin margin_free margin_level margin_so_call margin_so_so "
+                                        "margin_initial margin_maintenance assets liabilities commission_blocked "
+                                        "name server currency company")
+SymbolInfo = namedtuple("SymbolInfo", "name description path visible select digits point spread "
+                                      "trade_tick_size trade_tick_value trade_contract_size volume_min volume_max "
+                                      "volume_step filling_mode bid ask time currency_base currency_profit currency_margin")
+Tick = namedtuple("Tick", "time bid ask last volume time_msc flags volume_real")
+TradePosition = namedtuple("TradePosition", "ticket time time_msc time_update time_update_msc type magic identifier "
+                                            "reason volume price_open sl tp price_current swap profit symbol comment external_id")
+TradeOrder = namedtuple("TradeOrder", "ticket time_setup time_setup_msc time_done time_done_msc time_expiration type "
+                                      "type_time type_filling state magic position_id position_by_id reason volume_initial "
+                                      "volume_current price_open sl tp price_current price_stoplimit symbol comment external_id")
+TradeDeal = namedtuple("TradeDeal", "ticket order time time_msc type entry magic position_id reason volume price "
+                                    "commission swap profit fee symbol comment external_id")
+OrderSendResult = namedtuple("OrderSendResult", "retcode deal order volume price bid ask comment request_id retcode_external request")
+
+RATES_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+])
+
+_TF_SECONDS = {
+    TIMEFRAME_M1: 60, TIMEFRAME_M2: 120, TIMEFRAME_M3: 180, TIMEFRAME_M4: 240, TIMEFRAME_M5: 300,
+    TIMEFRAME_M6: 360, TIMEFRAME_M10: 600, TIMEFRAME_M12: 720, TIMEFRAME_M15: 900, TIMEFRAME_M20: 1200,
+    TIMEFRAME_M30: 1800, TIMEFRAME_H1: 3600, TIMEFRAME_H2: 7200, TIMEFRAME_H3: 10800, TIMEFRAME_H4: 14400,
+    TIMEFRAME_H6: 21600, TIMEFRAME_H8: 28800, TIMEFRAME_H12: 43200, TIMEFRAME_D1: 86400,
+    TIMEFRAME_W1: 604800, TIMEFRAME_MN1: 2592000,
+}
+
+# === CONFIG ===
+SEED = int(os.getenv("FAKE_MT5_SEED", "1"))
+SUFFIX = os.getenv("FAKE_MT5_SUFFIX", "m")
+START_BALANCE = float(os.getenv("FAKE_MT5_BALANCE", "10000"))
+TICK_SECONDS = int(os.getenv("FAKE_MT5_TICK_MS", "100")) / 1000.0
+LEVERAGE = 100
+
+
+def _parse_latency(spec):
+    out = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, ms = part.split("=", 1)
+            out[name.strip()] = float(ms) / 1000.0
+    return out
+
+
+DEFAULT_LATENCY = float(os.getenv("FAKE_MT5_LATENCY_MS", "0")) / 1000.0
+CALL_LATENCY = _parse_latency(os.getenv("FAKE_MT5_LATENCY", ""))
+
+
+def configure(seed=None, suffix=None, balance=None, tick_ms=None, latency_ms=None, latency=None):
+    """Override the environment defaults in-process (call before initialize())."""
+    global SEED, SUFFIX, START_BALANCE, TICK_SECONDS, DEFAULT_LATENCY, CALL_LATENCY
+    if seed is not None: SEED = seed
+    if suffix is not None: SUFFIX = suffix
+    if balance is not None: START_BALANCE = balance
+    if tick_ms is not None: TICK_SECONDS = tick_ms / 1000.0
+    if latency_ms is not None: DEFAULT_LATENCY = latency_ms / 1000.0
+    if latency is not None: CALL_LATENCY = {k: v / 1000.0 for k, v in latency.items()}
+    _build_symbols()
+
+
+# === SYMBOL UNIVERSE ===
+# base name : (base price, digits, contract size, relative volatility)
+_UNIVERSE = {
+    "EURUSD": (1.0850, 5, 100000, 0.004), "GBPUSD": (1.2700, 5, 100000, 0.005),
+    "AUDUSD": (0.6600, 5, 100000, 0.005), "NZDUSD": (0.6100, 5, 100000, 0.005),
+    "USDJPY": (150.00, 3, 100000, 0.005), "USDCHF": (0.8800, 5, 100000, 0.004),
+    "USDCAD": (1.3500, 5, 100000, 0.004), "EURGBP": (0.8550, 5, 100000, 0.003),
+    "EURJPY": (162.50, 3, 100000, 0.005), "GBPJPY": (190.50, 3, 100000, 0.006),
+    "EURCHF": (0.9550, 5, 100000, 0.003), "EURAUD": (1.6400, 5, 100000, 0.005),
+    "EURCAD": (1.4650, 5, 100000, 0.004), "AUDJPY": (99.000, 3, 100000, 0.006),
+    "CADJPY": (111.00, 3, 100000, 0.005), "CHFJPY": (170.00, 3, 100000, 0.005),
+    "GBPCHF": (1.1200, 5, 100000, 0.004), "AUDNZD": (1.0800, 5, 100000, 0.003),
+    "USDAED": (3.6725, 5, 100000, 0.0005), "USDTRY": (32.000, 5, 100000, 0.008),
+    "USDZAR": (18.500, 5, 100000, 0.008), "USDMXN": (17.000, 5, 100000, 0.007),
+    "XAUUSD": (2350.0, 2, 100, 0.008), "XAGUSD": (28.000, 3, 5000, 0.012),
+    "BTCUSD": (65000., 2, 1, 0.02), "ETHUSD": (3200.0, 2, 1, 0.025),
+    "US30": (39000., 1, 1, 0.006), "USTEC": (18000., 1, 1, 0.008),
+    "US500": (5200.0, 1, 1, 0.006), "USOIL": (78.000, 3, 1000, 0.012),
+}
+
+_symbols = {} # { broker name : spec dict }
+
+
+def _seed_for(name):
+    return zlib.crc32(f"{SEED}:{name}".encode())
+
+
+def _build_symbols():
+    _symbols.clear()
+    for base, (price, digits, contract, vol) in _UNIVERSE.items():
+        name = base + SUFFIX
+        rnd = np.random.default_rng(_seed_for(base))
+        point = 10.0 ** -digits
+        _symbols[name] = {
+            "name": name, "base": base, "price": price, "digits": digits, "point": point,
+            "contract": contract, "vol": vol,
+            "spread": int(rnd.integers(2, 25)),
+            "phases": rnd.uniform(0, 2 * math.pi, 3),
+            "noise_seed": float(rnd.uniform(1, 1000)),
+            "visible": False,
+            "currency_base": base[:3] if len(base) == 6 else base,
+            "currency_profit": base[3:] if len(base) == 6 else "USD",
+        }
+
+
+_build_symbols()
+
+
+def _mid(spec, t):
+    # Deterministic price path: three slow waves plus hash noise per tick step.
+    # Works on floats and NumPy arrays alike.
+    p1, p2, p3 = spec["phases"]
+    step = np.floor(np.asarray(t, dtype=np.float64) / TICK_SECONDS) % 1000003
+    noise = np.sin(step * 12.9898 + spec["noise_seed"]) * 43758.5453
+    noise = (noise - np.floor(noise)) * 2 - 1
+    x = (0.6 * np.sin(2 * np.pi * t / 604800 + p1)
+         + 0.3 * np.sin(2 * np.pi * t / 21600 + p2)
+         + 0.1 * np.sin(2 * np.pi * t / 900 + p3)
+         + 0.02 * noise)
+    return spec["price"] * (1 + spec["vol"] * x)
+
+
+def _quote(spec, t=None):
+    t = _now() if t is None else t
+    t = math.floor(t / TICK_SECONDS) * TICK_SECONDS
+    bid = round(float(_mid(spec, t)), spec["digits"])
+    ask = round(bid + spec["spread"] * spec["point"], spec["digits"])
+    return bid, ask, t
+
+
+# === TERMINAL STATE ===
+_state = {
+    "initialized": False,
+    "error": (RES_S_OK, "Success"),
+    "login": None,
+    "server": None,
+    "balance": START_BALANCE,
+    "positions": {}, # { ticket : dict }
+    "orders": {}, # { ticket : dict } pending
+    "history_orders": [],
+    "deals": [],
+    "next_ticket": 100000000 + SEED % 1000 * 1000,
+    "last_match": 0.0,
+}
+
+
+def _now():
+    return time.time()
+
+
+def _ticket():
+    _state["next_ticket"] += 1
+    return _state["next_ticket"]
+
+
+def _ok():
+    _state["error"] = (RES_S_OK, "Success")
+
+
+def _fail(code, msg):
+    _state["error"] = (code, msg)
+
+
+def _call(name):
+    delay = CALL_LATENCY.get(name, DEFAULT_LATENCY)
+    if delay > 0: time.sleep(delay)
+    _match()
+
+
+def _ts(value):
+    if value is None: return None
+    if isinstance(value, datetime): return value.timestamp()
+    return float(value)
+
+
+# === TERMINAL / ACCOUNT ===
+
+def initialize(path=None, login=None, password=None, server=None, timeout=None, portable=False):
+    _state["initialized"] = True
+    _state["path"] = path or "fake://terminal64.exe"
+    if login: return globals()["login"](login, password=password, server=server)
+    _ok()
+    return True
+
+
+def shutdown():
+    _state["initialized"] = False
+    return True
+
+
+def last_error():
+    return _state["error"]
+
+
+def version():
+    return (500, 4000, "01 Jan 2026")
+
+
+def terminal_info():
+    if not _state["initialized"]:
+        _fail(RES_E_FAIL, "Terminal not initialized")
+        return None
+    return TerminalInfo(True, True, "FakeMT5", "FakeMT5 Ltd.", _state["path"], "/tmp/fake_mt5", 4000)
+
+
+def login(login, password=None, server=None, timeout=None):
+    _call("login")
+    if not _state["initialized"]:
+        _fail(RES_E_FAIL, "Terminal not initialized")
+        return False
+    if str(password) == "invalid":
+        _fail(RES_E_AUTH_FAILED, "Authorization failed")
+        return False
+    if _state["login"] != int(login):
+        _state.update({"login": int(login), "server": server, "balance": START_BALANCE,
+                       "positions": {}, "orders": {}, "history_orders": [], "deals": []})
+        # Opening balance deal, like a funded demo account
+        _state["deals"].append(TradeDeal(_ticket(), 0, int(_now()) - 86400, int((_now() - 86400) * 1000),
+                                         DEAL_TYPE_BALANCE, DEAL_ENTRY_IN, 0, 0, 0, 0.0, 0.0,
+                                         0.0, 0.0, START_BALANCE, 0.0, "", "Deposit", ""))
+    _ok()
+    return True
+
+
+def _to_usd(spec, amount, bid):
+    ccy = spec["currency_profit"]
+    if ccy == "USD": return amount
+    if spec["currency_base"] == "USD": return amount / bid
+    cross = _symbols.get(ccy + "USD" + SUFFIX)
+    if cross: return amount * _quote(cross)[0]
+    cross = _symbols.get("USD" + ccy + SUFFIX)
+    if cross: return amount / _quote(cross)[0]
+    return amount
+
+
+def _position_profit(p):
+    spec = _symbols[p["symbol"]]
+    bid, ask, _ = _quote(spec)
+    current = bid if p["type"] == POSITION_TYPE_BUY else ask
+    direction = 1 if p["type"] == POSITION_TYPE_BUY else -1
+    raw = direction * (current - p["price_open"]) * p["volume"] * spec["contract"]
+    return current, round(_to_usd(spec, raw, bid), 2)
+
+
+def _margin(symbol, volume, price):
+    spec = _symbols[symbol]
+    return round(_to_usd(spec, volume * spec["contract"] * price, price) / LEVERAGE, 2)
+
+
+def account_info():
+    _call("account_info")
+    if _state["login"] is None:
+        _fail(RES_E_FAIL, "Not logged in")
+        return None
+    profit = margin = 0.0
+    for p in _state["positions"].values():
+        profit += _position_profit(p)[1]
+        margin += _margin(p["symbol"], p["volume"], p["price_open"])
+    balance = round(_state["balance"], 2)
+    equity = round(balance + profit, 2)
+    margin = round(margin, 2)
+    level = round(equity / margin * 100, 2) if margin else 0.0
+    _ok()
+    return AccountInfo(_state["login"], 0, LEVERAGE, 200, 0, True, True, 2, 2, False,
+                       balance, 0.0, round(profit, 2), equity, margin, round(equity - margin, 2), level,
+                       50.0, 30.0, 0.0, 0.0, 0.0, 0.0, 0.0,
+                       f"Fake {_state['login']}", _state["server"] or "FakeBroker-Demo", "USD", "FakeMT5 Ltd.")
+
+
+# === SYMBOLS / TICKS ===
+
+def _symbol_record(spec):
+    bid, ask, t = _quote(spec)
+    step = 0.01 if spec["contract"] >= 100 else 0.1
+    tick_value = _to_usd(spec, spec["contract"] * spec["point"], bid)
+    return SymbolInfo(spec["name"], spec["base"], f"Fake\\{spec['base']}", spec["visible"], spec["visible"],
+                      spec["digits"], spec["point"], spec["spread"], spec["point"], tick_value,
+                      float(spec["contract"]), step, 100.0, step, SYMBOL_FILLING_FOK | SYMBOL_FILLING_IOC,
+                      bid, ask, int(t), spec["currency_base"], spec["currency_profit"], spec["currency_base"])
+
+
+def _match_group(name, group):
+    # MT5 group syntax: comma separated masks, "*" wildcard, "!" excludes
+    included = False
+    for mask in group.split(","):
+        mask = mask.strip()
+        if not mask: continue
+        if mask.startswith("!"):
+            if fnmatch.fnmatchcase(name, mask[1:]): return False
+        elif fnmatch.fnmatchcase(name, mask):
+            included = True
+    return included
+
+
+def symbols_total():
+    _call("symbols_total")
+    return len(_symbols)
+
+
+def symbols_get(group=None):
+    _call("symbols_get")
+    _ok()
+    return tuple(_symbol_record(s) for name, s in _symbols.items() if not group or _match_group(name, group))
+
+
+def symbol_info(symbol):
+    _call("symbol_info")
+    spec = _symbols.get(symbol)
+    if not spec:
+        _fail(RES_E_NOT_FOUND, f"Symbol {symbol} not found")
+        return None
+    _ok()
+    return _symbol_record(spec)
+
+
+def symbol_select(symbol, enable=True):
+    _call("symbol_select")
+    spec = _symbols.get(symbol)
+    if not spec:
+        _fail(RES_E_NOT_FOUND, f"Symbol {symbol} not found")
+        return False
+    spec["visible"] = bool(enable)
+    _ok()
+    return True
+
+
+def symbol_info_tick(symbol):
+    _call("symbol_info_tick")
+    spec = _symbols.get(symbol)
+    if not spec or not spec["visible"]:
+        _fail(RES_E_NOT_FOUND, f"Symbol {symbol} not selected")
+        return None
+    bid, ask, t = _quote(spec)
+    _ok()
+    return Tick(int(t), bid, ask, 0.0, 0, int(round(t * 1000)), 6, 0.0)
+
+
+# === RATES ===
+
+def _bars(spec, tf_seconds, opens):
+    # Sample the price path inside each bar for open/high/low/close
+    samples = 8
+    offsets = np.linspace(0, tf_seconds - TICK_SECONDS, samples)
+    grid = opens[:, None] + offsets[None, :]
+    now = _now()
+    grid = np.minimum(grid, now) # Forming bar stops at "now"
+    mids = _mid(spec, grid)
+    rates = np.zeros(len(opens), dtype=RATES_DTYPE)
+    rates["time"] = opens
+    rates["open"] = np.round(mids[:, 0], spec["digits"])
+    rates["close"] = np.round(mids[:, -1], spec["digits"])
+    rates["high"] = np.round(mids.max(axis=1), spec["digits"])
+    rates["low"] = np.round(mids.min(axis=1), spec["digits"])
+    vol_seed = (opens // tf_seconds).astype(np.int64) % 1000003
+    rates["tick_volume"] = (np.abs(np.sin(vol_seed * 78.233 + spec["noise_seed"])) * 400 + 20).astype(np.uint64)
+    rates["spread"] = spec["spread"]
+    return rates
+
+
+def _rates_setup(name, symbol, timeframe):
+    _call(name)
+    spec = _symbols.get(symbol)
+    tf_seconds = _TF_SECONDS.get(timeframe)
+    if not spec or not tf_seconds:
+        _fail(RES_E_INVALID_PARAMS, f"Invalid params {symbol}/{timeframe}")
+        return None, None
+    _ok()
+    return spec, tf_seconds
+
+
+def copy_rates_from_pos(symbol, timeframe, start_pos, count):
+    spec, tf = _rates_setup("copy_rates_from_pos", symbol, timeframe)
+    if not spec: return None
+    last_open = (int(_now()) // tf) * tf - int(start_pos) * tf
+    opens = last_open - np.arange(int(count) - 1, -1, -1, dtype=np.int64) * tf
+    return _bars(spec, tf, opens)
+
+
+def copy_rates_from(symbol, timeframe, date_from, count):
+    # count bars ending at (and including) the bar open at or before date_from
+    spec, tf = _rates_setup("copy_rates_from", symbol, timeframe)
+    if not spec: return None
+    last_open = (int(min(_ts(date_from), _now())) // tf) * tf
+    opens = last_open - np.arange(int(count) - 1, -1, -1, dtype=np.int64) * tf
+    return _bars(spec, tf, opens)
+
+
+def copy_rates_range(symbol, timeframe, date_from, date_to):
+    spec, tf = _rates_setup("copy_rates_range", symbol, timeframe)
+    if not spec: return None
+    first = -(-int(_ts(date_from)) // tf) * tf
+    last = (int(min(_ts(date_to), _now())) // tf) * tf
+    if last < first: return np.zeros(0, dtype=RATES_DTYPE)
+    return _bars(spec, tf, np.arange(first, last + 1, tf, dtype=np.int64))
+
+
+# === TRADING ===
+
+def _result(retcode, comment, request, deal=0, order=0, volume=0.0, price=0.0, bid=0.0, ask=0.0):
+    _ok() if retcode == TRADE_RETCODE_DONE else _fail(RES_E_FAIL, comment)
+    return OrderSendResult(retcode, deal, order, volume, price, bid, ask, comment, 0, 0, request)
+
+
+def _valid_volume(spec, volume):
+    rec = _symbol_record(spec)
+    if volume < rec.volume_min - 1e-9 or volume > rec.volume_max + 1e-9: return False
+    steps = volume / rec.volume_step
+    return abs(steps - round(steps)) < 1e-6
+
+
+def _add_deal(order, p, deal_type, entry, volume, price, profit, reason, comment):
+    t = _now()
+    deal = TradeDeal(_ticket(), order, int(t), int(t * 1000), deal_type, entry, p.get("magic", 0),
+                     p["ticket"], reason, volume, price, 0.0, 0.0, profit, 0.0, p["symbol"], comment, "")
+    _state["deals"].append(deal)
+    return deal
+
+
+def _add_history_order(ticket, p, order_type, state, volume, price, comment, setup=None):
+    t = _now()
+    setup = setup or t
+    _state["history_orders"].append(TradeOrder(
+        ticket, int(setup), int(setup * 1000), int(t), int(t * 1000), 0, order_type, ORDER_TIME_GTC,
+        ORDER_FILLING_IOC, state, p.get("magic", 0), p.get("ticket", 0), 0, 0, volume,
+        0.0 if state == ORDER_STATE_FILLED else volume, price, p.get("sl", 0.0), p.get("tp", 0.0),
+        price, 0.0, p["symbol"], comment, ""))
+
+
+def _open_position(ticket, symbol, side, volume, price, sl, tp, magic, comment, reason=DEAL_REASON_EXPERT):
+    t = _now()
+    p = {"ticket": ticket, "symbol": symbol, "type": side, "volume": volume, "price_open": price,
+         "sl": sl, "tp": tp, "magic": magic, "comment": comment, "time": t, "time_update": t}
+    _state["positions"][ticket] = p
+    _add_deal(ticket, p, DEAL_TYPE_BUY if side == POSITION_TYPE_BUY else DEAL_TYPE_SELL,
+              DEAL_ENTRY_IN, volume, price, 0.0, reason, comment)
+    return p
+
+
+def _close_position(p, volume, reason=DEAL_REASON_EXPERT, comment=""):
+    spec = _symbols[p["symbol"]]
+    bid, ask, _ = _quote(spec)
+    price = bid if p["type"] == POSITION_TYPE_BUY else ask
+    direction = 1 if p["type"] == POSITION_TYPE_BUY else -1
+    profit = round(_to_usd(spec, direction * (price - p["price_open"]) * volume * spec["contract"], bid), 2)
+
+    order = _ticket()
+    close_type = ORDER_TYPE_SELL if p["type"] == POSITION_TYPE_BUY else ORDER_TYPE_BUY
+    _add_history_order(order, p, close_type, ORDER_STATE_FILLED, volume, price, comment)
+    deal = _add_deal(order, p, DEAL_TYPE_SELL if p["type"] == POSITION_TYPE_BUY else DEAL_TYPE_BUY,
+                     DEAL_ENTRY_OUT, volume, price, profit, reason, comment)
+    _state["balance"] += profit
+
+    p["volume"] = round(p["volume"] - volume, 8)
+    if p["volume"] <= 1e-9:
+        _state["positions"].pop(p["ticket"], None)
+    return deal, order, price
+
+
+def _match():
+    # Matching engine: trigger pending orders and SL/TP, at most once per tick period
+    now = _now()
+    if now - _state["last_match"] < TICK_SECONDS: return
+    _state["last_match"] = now
+
+    for ticket, o in list(_state["orders"].items()):
+        bid, ask, _ = _quote(_symbols[o["symbol"]])
+        t = o["type"]
+        hit = ((t == ORDER_TYPE_BUY_LIMIT and ask <= o["price"]) or (t == ORDER_TYPE_BUY_STOP and ask >= o["price"])
+               or (t == ORDER_TYPE_SELL_LIMIT and bid >= o["price"]) or (t == ORDER_TYPE_SELL_STOP and bid <= o["price"]))
+        if not hit: continue
+        del _state["orders"][ticket]
+        side = POSITION_TYPE_BUY if t in (ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_BUY_STOP) else POSITION_TYPE_SELL
+        price = ask if side == POSITION_TYPE_BUY else bid
+        _add_history_order(ticket, o, t, ORDER_STATE_FILLED, o["volume"], price, o["comment"], setup=o["time"])
+        _open_position(ticket, o["symbol"], side, o["volume"], price, o["sl"], o["tp"], o["magic"], o["comment"])
+
+    for p in list(_state["positions"].values()):
+        bid, ask, _ = _quote(_symbols[p["symbol"]])
+        if p["type"] == POSITION_TYPE_BUY:
+            sl_hit = p["sl"] and bid <= p["sl"]
+            tp_hit = p["tp"] and bid >= p["tp"]
+        else:
+            sl_hit = p["sl"] and ask >= p["sl"]
+            tp_hit = p["tp"] and ask <= p["tp"]
+        if sl_hit or tp_hit:
+            _close_position(p, p["volume"], DEAL_REASON_SL if sl_hit else DEAL_REASON_TP,
+                            "[sl]" if sl_hit else "[tp]")
+
+
+def order_send(request):
+    _call("order_send")
+    req = dict(request or {})
+    action = req.get("action")
+    symbol = req.get("symbol")
+    spec = _symbols.get(symbol) if symbol else None
+    if _state["login"] is None:
+        return _result(TRADE_RETCODE_REJECT, "Not logged in", request)
+
+    if action == TRADE_ACTION_DEAL:
+        if not spec: return _result(TRADE_RETCODE_INVALID, "Invalid symbol", request)
+        volume = float(req.get("volume", 0))
+        if not _valid_volume(spec, volume): return _result(TRADE_RETCODE_INVALID_VOLUME, "Invalid volume", request)
+        bid, ask, _ = _quote(spec)
+        side = POSITION_TYPE_BUY if req.get("type") == ORDER_TYPE_BUY else POSITION_TYPE_SELL
+        price = ask if side == POSITION_TYPE_BUY else bid
+
+        if req.get("position"):
+            p = _state["positions"].get(req["position"])
+            if not p: return _result(TRADE_RETCODE_POSITION_CLOSED, "Position doesn't exist", request)
+            if volume > p["volume"] + 1e-9: return _result(TRADE_RETCODE_INVALID_VOLUME, "Invalid volume", request)
+            deal, order, price = _close_position(p, volume, DEAL_REASON_EXPERT, req.get("comment", ""))
+            return _result(TRADE_RETCODE_DONE, "Request executed", request, deal.ticket, order, volume, price, bid, ask)
+
+        if _margin(symbol, volume, price) > (account_info().margin_free or 0):
+            return _result(TRADE_RETCODE_NO_MONEY, "No money", request)
+        ticket = _ticket()
+        p = _open_position(ticket, symbol, side, volume, price, float(req.get("sl", 0.0) or 0.0),
+                           float(req.get("tp", 0.0) or 0.0), int(req.get("magic", 0)), req.get("comment", ""))
+        _add_history_order(ticket, p, req.get("type"), ORDER_STATE_FILLED, volume, price, p["comment"])
+        return _result(TRADE_RETCODE_DONE, "Request executed", request, _state["deals"][-1].ticket, ticket,
+                       volume, price, bid, ask)
+
+    if action == TRADE_ACTION_PENDING:
+        if not spec: return _result(TRADE_RETCODE_INVALID, "Invalid symbol", request)
+        volume = float(req.get("volume", 0))
+        if not _valid_volume(spec, volume): return _result(TRADE_RETCODE_INVALID_VOLUME, "Invalid volume", request)
+        if req.get("type") not in (ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_SELL_LIMIT, ORDER_TYPE_BUY_STOP, ORDER_TYPE_SELL_STOP):
+            return _result(TRADE_RETCODE_INVALID, "Invalid order type", request)
+        price = float(req.get("price", 0))
+        if price <= 0: return _result(TRADE_RETCODE_INVALID_PRICE, "Invalid price", request)
+        ticket = _ticket()
+        _state["orders"][ticket] = {"ticket": ticket, "symbol": symbol, "type": req["type"], "volume": volume,
+                                    "price": price, "sl": float(req.get("sl", 0.0) or 0.0),
+                                    "tp": float(req.get("tp", 0.0) or 0.0), "magic": int(req.get("magic", 0)),
+                                    "comment": req.get("comment", ""), "time": _now()}
+        bid, ask, _ = _quote(spec)
+        return _result(TRADE_RETCODE_DONE, "Request executed", request, 0, ticket, volume, price, bid, ask)
+
+    if action == TRADE_ACTION_SLTP:
+        p = _state["positions"].get(req.get("position"))
+        if not p: return _result(TRADE_RETCODE_POSITION_CLOSED, "Position doesn't exist", request)
+        p["sl"] = float(req.get("sl", 0.0) or 0.0)
+        p["tp"] = float(req.get("tp", 0.0) or 0.0)
+        p["time_update"] = _now()
+        return _result(TRADE_RETCODE_DONE, "Request executed", request, 0, p["ticket"])
+
+    if action == TRADE_ACTION_MODIFY:
+        o = _state["orders"].get(req.get("order"))
+        if not o: return _result(TRADE_RETCODE_INVALID_ORDER, "Order doesn't exist", request)
+        if req.get("price"): o["price"] = float(req["price"])
+        o["sl"] = float(req.get("sl", 0.0) or 0.0)
+        o["tp"] = float(req.get("tp", 0.0) or 0.0)
+        return _result(TRADE_RETCODE_DONE, "Request executed", request, 0, o["ticket"])
+
+    if action == TRADE_ACTION_REMOVE:
+        o = _state["orders"].pop(req.get("order"), None)
+        if not o: return _result(TRADE_RETCODE_INVALID_ORDER, "Order doesn't exist", request)
+        _add_history_order(o["ticket"], o, o["type"], ORDER_STATE_CANCELED, o["volume"], o["price"], o["comment"],
+                           setup=o["time"])
+        return _result(TRADE_RETCODE_DONE, "Request executed", request, 0, o["ticket"])
+
+    return _result(TRADE_RETCODE_INVALID, "Unsupported action", request)
+
+
+def order_calc_margin(action, symbol, volume, price):
+    _call("order_calc_margin")
+    if symbol not in _symbols:
+        _fail(RES_E_INVALID_PARAMS, "Invalid symbol")
+        return None
+    _ok()
+    return _margin(symbol, float(volume), float(price))
+
+
+# === POSITIONS / ORDERS / HISTORY ===
+
+def _filter(items, symbol=None, group=None, ticket=None, key="ticket"):
+    out = []
+    for it in items:
+        if ticket is not None and it[key] != ticket: continue
+        if symbol is not None and it["symbol"] != symbol: continue
+        if group is not None and not _match_group(it["symbol"], group): continue
+        out.append(it)
+    return out
+
+
+def positions_total():
+    _call("positions_total")
+    return len(_state["positions"])
+
+
+def positions_get(symbol=None, group=None, ticket=None):
+    _call("positions_get")
+    out = []
+    for p in _filter(_state["positions"].values(), symbol, group, ticket):
+        current, profit = _position_profit(p)
+        out.append(TradePosition(p["ticket"], int(p["time"]), int(p["time"] * 1000), int(p["time_update"]),
+                                 int(p["time_update"] * 1000), p["type"], p["magic"], p["ticket"],
+                                 DEAL_REASON_EXPERT, p["volume"], p["price_open"], p["sl"], p["tp"],
+                                 current, 0.0, profit, p["symbol"], p["comment"], ""))
+    _ok()
+    return tuple(out)
+
+
+def orders_total():
+    _call("orders_total")
+    return len(_state["orders"])
+
+
+def orders_get(symbol=None, group=None, ticket=None):
+    _call("orders_get")
+    out = []
+    for o in _filter(_state["orders"].values(), symbol, group, ticket):
+        bid, ask, _ = _quote(_symbols[o["symbol"]])
+        current = ask if o["type"] in (ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_BUY_STOP) else bid
+        out.append(TradeOrder(o["ticket"], int(o["time"]), int(o["time"] * 1000), 0, 0, 0, o["type"],
+                              ORDER_TIME_GTC, ORDER_FILLING_IOC, ORDER_STATE_PLACED, o["magic"], 0, 0, 0,
+                              o["volume"], o["volume"], o["price"], o["sl"], o["tp"], current, 0.0,
+                              o["symbol"], o["comment"], ""))
+    _ok()
+    return tuple(out)
+
+
+def _history(records, time_field, date_from, date_to, group, ticket, position):
+    if ticket is not None:
+        return tuple(r for r in records if r.ticket == ticket)
+    if position is not None:
+        pos_field = "position_id"
+        return tuple(r for r in records if getattr(r, pos_field) == position)
+    t0, t1 = _ts(date_from), _ts(date_to)
+    if t0 is None or t1 is None:
+        _fail(RES_E_INVALID_PARAMS, "Invalid arguments")
+        return None
+    return tuple(r for r in records if t0 <= getattr(r, time_field) <= t1
+                 and (not group or _match_group(r.symbol, group)))
+
+
+def history_deals_total(date_from, date_to):
+    return len(history_deals_get(date_from, date_to) or ())
+
+
+def history_deals_get(date_from=None, date_to=None, group=None, ticket=None, position=None):
+    _call("history_deals_get")
+    res = _history(_state["deals"], "time", date_from, date_to, group, ticket, position)
+    if res is not None: _ok()
+    return res
+
+
+def history_orders_total(date_from, date_to):
+    return len(history_orders_get(date_from, date_to) or ())
+
+
+def history_orders_get(date_from=None, date_to=None, group=None, ticket=None, position=None):
+    _call("history_orders_get")
+    res = _history(_state["history_orders"], "time_setup", date_from, date_to, group, ticket, position)
+    if res is not None: _ok()
+    return res
@@ -0,0 +1,228 @@
+import os
+import time
+import asyncio
+
+import numpy as np
+
+# === LIVE BARS ===
+# /history for recent windows straight from memory. Per (mt5 login, symbol, timeframe) a series of
+# bars (copy_rates_* dtype) is seeded once through HISTORY, then kept current from the tick stream
+# (tick board, or TICKS with TICK_BOARD=0): the forming bar's high/low/close/tick_volume move with
+# every bid, a tick in a new period opens the next bar.
+#
+# Timeframes that divide each other are derived instead of fetched: M5/M15/H1... come from an
+# M1 series, H4/D1 from H1 and so on, as long as the finer series reaches back far enough.
+# W1/MN1 (not fixed-length periods) and windows over LIVE_BARS_MAX go to the terminal as before.
+# With a CandleStore, seeds/resyncs/pass-throughs go through it (closed bars from disk, only the
+# tail from the terminal).
+#
+# The board only holds the latest tick, so extremes shorter than the poll interval can be missed
+# and tick_volume counts observed ticks. Every LIVE_BARS_RESYNC_S (and after a worker restart) the
+# bars since the last sync are re-read from the terminal and spliced in, which bounds that drift.
+
+TIMEFRAME_SECONDS = {"M1": 60, "M5": 300, "M15": 900, "M30": 1800, "H1": 3600, "H4": 14400, "D1": 86400}
+
+SEED_BARS = int(os.getenv("LIVE_BARS_SEED", "2000")) # Bars fetched when a series is created (enough to derive from)
+MAX_BARS = int(os.getenv("LIVE_BARS_MAX", "10000")) # Per series, also the largest count served from memory
+RESYNC_AFTER = float(os.getenv("LIVE_BARS_RESYNC_S", "900"))
+IDLE_AFTER = float(os.getenv("LIVE_BARS_IDLE_S", "900")) # Series nobody asked for that long stop being tracked
+
+FETCH_INTERVAL = 0.5 # Seconds between TICKS polls when a worker has no board
+
+
+def resample(bars, seconds):
+    # Bars of a finer timeframe -> bars of `seconds`. The first bucket is dropped when our
+    # history starts inside it (it would be missing its beginning).
+    if not len(bars): return bars[:0]
+    buckets = bars['time'] // seconds * seconds
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    if bars['time'][0] != buckets[0]: starts = starts[1:]
+    if not len(starts): return bars[:0]
+
+    sub = bars[starts[0]:]
+    idx = starts - starts[0]
+    ends = np.r_[idx[1:], len(sub)] - 1
+    out = np.empty(len(idx), dtype=bars.dtype)
+    for name in bars.dtype.names:
+        col = sub[name]
+        if name == 'time': out[name] = buckets[starts]
+        elif name == 'open': out[name] = col[idx]
+        elif name == 'high': out[name] = np.maximum.reduceat(col, idx)
+        elif name == 'low': out[name] = np.minimum.reduceat(col, idx)
+        elif name in ('tick_volume', 'real_volume'): out[name] = np.add.reduceat(col, idx)
+        else: out[name] = col[ends] # close, spread: last value of the bucket
+    return out
+
+
+class Series:
+    __slots__ = ("timeframe", "seconds", "bars", "exhausted", "synced_at", "used_at", "dirty")
+
+    def __init__(self, timeframe, bars, exhausted):
+        self.timeframe = timeframe
+        self.seconds = TIMEFRAME_SECONDS[timeframe]
+        self.bars = np.array(bars[-MAX_BARS:], copy=True) # Own, writable copy
+        self.exhausted = exhausted # Terminal had fewer bars than we asked for, this is all there is
+        self.synced_at = self.used_at = time.monotonic()
+        self.dirty = False # Feed was interrupted, resync before serving
+
+    def covers(self, count):
+        return len(self.bars) >= count or self.exhausted
+
+    def update(self, bid, tick_time):
+        bars = self.bars
+        t = tick_time // self.seconds * self.seconds
+        if len(bars) and bars['time'][-1] == t:
+            # Forming bar
+            if bid > bars['high'][-1]: bars['high'][-1] = bid
+            if bid < bars['low'][-1]: bars['low'][-1] = bid
+            bars['close'][-1] = bid
+            bars['tick_volume'][-1] += 1
+        elif not len(bars) or t > bars['time'][-1]:
+            # First tick of a new period opens the next bar
+            bar = np.zeros(1, dtype=bars.dtype)
+            bar['time'] = t
+            bar['open'] = bar['high'] = bar['low'] = bar['close'] = bid
+            bar['tick_volume'] = 1
+            if len(bars) and 'spread' in bars.dtype.names: bar['spread'] = bars['spread'][-1]
+            self.bars = np.concatenate((bars[-(MAX_BARS - 1):], bar))
+        # Older ticks (out of order, before the last bar) are ignored
+
+
+class LiveBars:
+    def __init__(self, manager, store=None):
+        self.manager = manager
+        self.store = store
+        self.brokers = {} # { mt5_login : broker server } file key for the candle store
+        self.enabled = os.getenv("LIVE_BARS", "1") != "0"
+        self.series = {} # { (mt5_login, symbol) : { timeframe : Series } }
+        self.seen = {} # { (mt5_login, symbol) : last tick key fed into the bars }
+        self.boards = {} # { mt5_login : board name } to notice worker restarts
+        self.stats = {"hits": 0, "derived": 0, "seeds": 0, "resyncs": 0, "passthrough": 0, "ticks": 0}
+
+    async def _fetch(self, login, symbol, timeframe, count):
+        if self.store:
+            return await self.store.rates(login, self.brokers.get(login), symbol, timeframe, count)
+        req = {"symbol": symbol, "timeframe": timeframe, "count": count, "raw": True}
+        return await self.manager.execute(login, "HISTORY", req, timeout=10)
+
+    async def rates(self, login, symbol, timeframe, count, broker=None):
+        """
+        Same result as a raw HISTORY command ({"status", "rates"} or an error), the last `count`
+        bars including the forming one, from memory whenever possible.
+        """
+        if broker: self.brokers[login] = broker
+        seconds = TIMEFRAME_SECONDS.get(timeframe)
+        if not self.enabled or seconds is None or count <= 0 or count > MAX_BARS:
+            self.stats["passthrough"] += 1
+            return await self._fetch(login, symbol, timeframe, count)
+
+        now = time.monotonic()
+        tfs = self.series.get((login, symbol), {})
+
+        series = tfs.get(timeframe)
+        if series and series.covers(count):
+            if not await self._resync(login, symbol, series): return await self._fetch(login, symbol, timeframe, count)
+            series.used_at = now
+            self.stats["hits"] += 1
+            return {"status": "success", "rates": series.bars[-count:]}
+
+        # A finer series that reaches back far enough, coarsest first (fewest bars to fold)
+        for finer in sorted(tfs.values(), key=lambda s: -s.seconds):
+            if finer.seconds >= seconds or seconds % finer.seconds: continue
+            bars = resample(finer.bars, seconds)
+            if len(bars) < count and not finer.exhausted: continue
+            if finer.dirty or now - finer.synced_at > RESYNC_AFTER:
+                if not await self._resync(login, symbol, finer): break
+                bars = resample(finer.bars, seconds)
+            finer.used_at = now
+            self.stats["derived"] += 1
+            return {"status": "success", "rates": bars[-count:]}
+
+        # Seed (or grow) this timeframe's series
+        want = min(max(count, SEED_BARS), MAX_BARS)
+        res = await self._fetch(login, symbol, timeframe, want)
+        if not isinstance(res, dict) or res.get('status') != 'success': return res
+        rates = res['rates']
+        # (looked up again: the feed loop may have expired the key while we awaited)
+        self.series.setdefault((login, symbol), {})[timeframe] = Series(timeframe, rates, exhausted=len(rates) < want)
+        self.stats["seeds"] += 1
+        return {"status": "success", "rates": rates[-count:]}
+
+    async def _resync(self, login, symbol, series):
+        # Re-read the bars since the last sync and splice them over ours. False if the terminal failed.
+        elapsed = time.monotonic() - series.synced_at
+        if not series.dirty and elapsed <= RESYNC_AFTER: return True
+        n = min(int(elapsed // series.seconds) + 2, MAX_BARS)
+        res = await self._fetch(login, symbol, series.timeframe, n)
+        if not isinstance(res, dict) or res.get('status') != 'success': return False
+        fresh = res['rates']
+        if len(fresh):
+            cut = np.searchsorted(series.bars['time'], fresh['time'][0])
+            series.bars = np.concatenate((series.bars[:cut], fresh.astype(series.bars.dtype)))[-MAX_BARS:]
+        series.synced_at = time.monotonic()
+        series.dirty = False
+        self.stats["resyncs"] += 1
+        return True
+
+    def on_tick(self, login, symbol, key, bid, tick_time):
+        if self.seen.get((login, symbol)) == key: return
+        self.seen[(login, symbol)] = key
+        self.stats["ticks"] += 1
+        for series in self.series.get((login, symbol), {}).values():
+            series.update(bid, int(tick_time))
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in list(self.series.keys()):
+            tfs = self.series[key]
+            for tf in [tf for tf, s in tfs.items() if now - s.used_at > IDLE_AFTER]:
+                del tfs[tf]
+            if not tfs:
+                del self.series[key]
+                self.seen.pop(key, None)
+
+    def _interrupted(self, login):
+        # Worker gone or restarted: ticks were missed, every series of that login resyncs before use
+        for (l, _), tfs in self.series.items():
+            if l != login: continue
+            for series in tfs.values(): series.dirty = True
+        self.seen = {k: v for k, v in self.seen.items() if k[0] != login}
+
+    async def run(self):
+        """Feeds ticks of every tracked (login, symbol) into its bars."""
+        print("Live Bar Builder Started")
+        while True:
+            interval = self.manager.tick_interval
+            try:
+                self._expire()
+                by_login = {}
+                for login, symbol in list(self.series.keys()):
+                    by_login.setdefault(login, []).append(symbol)
+
+                for login, symbols in by_login.items():
+                    board = self.manager.get_tick_board(login)
+                    name = board.name if board else None
+                    if not self.manager.is_worker_running(login) or self.boards.get(login, name) != name:
+                        self._interrupted(login)
+                    self.boards[login] = name
+                    if not self.manager.is_worker_running(login): continue
+
+                    if board:
+                        for symbol in symbols:
+                            q = board.read(symbol)
+                            if q is None:
+                                board.register(symbol) # Same slot the quote streams use, if any
+                                continue
+                            if q['time']: self.on_tick(login, symbol, (name, q['seq']), q['bid'], q['time'])
+                    else:
+                        interval = FETCH_INTERVAL
+                        res = await self.manager.execute(login, "TICKS", symbols, timeout=1)
+                        if isinstance(res, dict) and 'status' not in res:
+                            for symbol, t in res.items():
+                                if t.get('time'): self.on_tick(login, symbol, (t['bid'], t['ask'], t['time']), t['bid'], t['time'])
+            except Exception as e:
+                print(f"Live Bars Error: {e}")
+            await asyncio.sleep(interval)
+
+    def get_stats(self):
+        return dict(self.stats, series=sum(len(tfs) for tfs in self.series.values()))
@@ -1,113 +1,431 @@
-import MetaTrader5 as mt5
+import os
+import bisect
+import importlib
 import multiprocessing
 import time
 from datetime import datetime
 import traceback
 import queue
 
+try:
+    from backend.tick_board import TickBoard
+    from backend.position_stream import diff_state
+    from backend import shm_rates
+except ImportError:
+    from tick_board import TickBoard
+    from position_stream import diff_state
+    import shm_rates
+
+def load_mt5(name=None):
+    # MT5_MODULE=fake swaps in the deterministic simulator (fake_mt5.py), any other value is imported as-is
+    name = name or os.getenv("MT5_MODULE", "MetaTrader5")
+    if name == "fake":
+        try:
+            from backend import fake_mt5 as module
+        except ImportError:
+            import fake_mt5 as module
+        return module
+    return importlib.import_module(name)
+
+try:
+    mt5 = load_mt5()
+except ImportError:
+    mt5 = None # No terminal package here (e.g. Linux), workers load theirs in run()
+
+PUSH_HEARTBEAT = 5.0 # Seconds between STATE pushes when nothing changed (keeps the manager cache fresh)
+SYMBOL_REFRESH = 60.0 # Seconds between bulk symbols_get() refreshes (spec cache, changed symbol list)
+RANGE_OPEN_END = 4102444800 # 2100-01-01, HISTORY "from" without "to" = everything up to the forming bar
+FEEDER_WAIT = 1.0 # Seconds a rung doorbell may precede its command (feeder thread lag, normally well under 1 ms)
+TIMEFRAMES = ("M1", "M5", "M15", "M30", "H1", "H4", "D1", "W1", "MN1") # HISTORY timeframes, TIMEFRAME_<name> in MT5
+SUFFIX_MAX_LEN = 4 # Longest foreign suffix stripped when matching e.g. EURUSD.pro -> EURUSD
+
 class MT5Worker(multiprocessing.Process):
-    def __init__(self, worker_id, terminal_path, command_queue, result_queue):
+    def __init__(self, worker_id, terminal_path, command_queue, result_queue,
+                 tick_board_name=None, tick_interval=0.1, urgent_queue=None, doorbell=None, mt5_module=None,
+                 shm_ack_queue=None):
         super().__init__()
         self.worker_id = worker_id
         self.terminal_path = terminal_path
-        self.command_queue = command_queue
+        self.mt5_module = mt5_module # None = MT5_MODULE env / MetaTrader5
+        self.command_queue = command_queue # Bulk lane (and the only lane if urgent_queue is None)
         self.result_queue = result_queue
         self.running = True
         self.current_account = None
+        self.expired = 0 # Commands skipped because their deadline passed while queued
 
-    def _resolve_symbol(self, symbol):
-        # 1. Try exact match (forces Market Watch selection if available)
-        if mt5.symbol_select(symbol, True):
+        # Priority lane: urgent commands (trades) always drain before the bulk lane.
+        # doorbell is a Semaphore released once per command put on either lane.
+        self.urgent_queue = urgent_queue
+        self.doorbell = doorbell
+
+        # Shared-memory quote publishing (attached inside run(), i.e. in the worker process)
+        self.tick_board_name = tick_board_name
+        self.tick_interval = tick_interval
+        self.tick_board = None
+        self._board_symbols = {} # { registered symbol : resolved broker symbol }
+        self._board_last = {} # { slot : (time_msc, bid, ask) } last published
+        self._last_publish = 0.0
+
+        # Out-of-band raw HISTORY rates (shm_rates.py): blocks stay open here until the manager acks them
+        self.shm_ack_queue = shm_ack_queue
+        self._shm_held = {} if shm_ack_queue is not None else None
+
+        # Push mode (SUBSCRIBE): poll positions/account locally, push versioned deltas
+        self.push_interval = None # None = not subscribed
+        self._push_snapshot = None # ({ ticket : position }, account) last pushed
+        self._push_version = 0
+        self._last_push_poll = 0.0
+        self._last_push_sent = 0.0
+
+        # Symbol resolution index + spec cache: one symbols_get() instead of select/symbols_get/symbol_info
+        # per lookup. Rebuilt after LOGIN (other broker), refreshed every SYMBOL_REFRESH from the main loop.
+        self._symbol_names = None # Sorted broker symbol names, None = not built yet
+        self._symbol_set = set()
+        self._resolved = {} # { requested : broker symbol, None = not carried } (misses are cached too)
+        self._symbols_checked = 0.0
+        self._specs = {} # { broker symbol : digits, point, tick size/value, contract size, volume limits, filling } or None
+
+    def _build_symbol_index(self):
+        # One symbols_get() feeds both the resolution index and the spec cache
+        self._symbols_checked = time.monotonic()
+        symbols = mt5.symbols_get()
+        if not symbols:
+            # Terminal not ready (or not connected yet), resolve live until it is
+            print(f"[Worker {self.worker_id}] Symbol index unavailable: {mt5.last_error()}", flush=True)
+            self._symbol_names = None
+            return
+        names = sorted(s.name for s in symbols)
+        if names != self._symbol_names:
+            if self._symbol_names is not None:
+                print(f"[Worker {self.worker_id}] Symbol list changed ({len(self._symbol_names)} -> {len(names)})", flush=True)
+            self._symbol_names = names
+            self._symbol_set = set(names)
+            self._resolved = {}
+            print(f"[Worker {self.worker_id}] Symbol index: {len(names)} symbols", flush=True)
+        self._specs = {s.name: self._spec_of(s) for s in symbols}
+
+    def _check_symbol_index(self):
+        # Retry every few seconds while unavailable (periodic refreshes happen in the main loop)
+        if self._symbol_names is None:
+            if not self._symbols_checked or time.monotonic() - self._symbols_checked >= 5.0:
+                self._build_symbol_index()
+
+    def _refresh_symbols(self):
+        # Idle-time refresh between commands: tick_value follows the profit currency rate, symbols come and go
+        if self._symbol_names is not None and time.monotonic() - self._symbols_checked >= SYMBOL_REFRESH:
+            self._build_symbol_index()
+
+    @staticmethod
+    def _spec_of(info):
+        return {
+            "digits": info.digits, "point": info.point,
+            "tick_size": info.trade_tick_size, "tick_value": info.trade_tick_value,
+            "contract_size": info.trade_contract_size,
+            "volume_min": info.volume_min, "volume_step": info.volume_step, "volume_max": info.volume_max,
+            "filling_mode": info.filling_mode,
+        }
+
+    def _symbol_spec(self, symbol):
+        # Cached spec of a broker symbol; one symbol_info() for names not seen in the last refresh
+        if symbol not in self._specs:
+            info = mt5.symbol_info(symbol)
+            self._specs[symbol] = self._spec_of(info) if info is not None else None
+        return self._specs[symbol]
+
+    def _check_volume(self, symbol, volume):
+        # Error message for a volume the broker would reject, None if fine (or unknown)
+        spec = self._symbol_spec(symbol)
+        if not spec or not spec['volume_step']: return None
+        steps = volume / spec['volume_step']
+        if volume < spec['volume_min'] - 1e-9 or volume > spec['volume_max'] + 1e-9 or abs(steps - round(steps)) > 1e-6:
+            return (f"Invalid volume {volume} for {symbol} "
+                    f"(min {spec['volume_min']}, step {spec['volume_step']}, max {spec['volume_max']})")
+        return None
+
+    def _filling_for(self, symbol):
+        # IOC as always, unless the symbol doesn't allow it: then FOK, or RETURN if neither is allowed
+        spec = self._symbol_spec(symbol)
+        if not spec: return mt5.ORDER_FILLING_IOC
+        mode = spec['filling_mode']
+        if mode & mt5.SYMBOL_FILLING_IOC: return mt5.ORDER_FILLING_IOC
+        if mode & mt5.SYMBOL_FILLING_FOK: return mt5.ORDER_FILLING_FOK
+        return mt5.ORDER_FILLING_RETURN
+
+    def _match_prefix(self, symbol):
+        # Exact name, else this broker's suffix (e.g. "EURUSD" -> "EURUSDm"): shortest name starting
+        # with it, e.g. between EURUSDm and EURUSD_i, pick EURUSDm
+        if symbol in self._symbol_set:
             return symbol
-            
-        # 2. Try prefix search (e.g. "EURUSD" -> "EURUSDm")
-        try:
-            matches = mt5.symbols_get(group=symbol + "*")
-            if matches and len(matches) > 0:
-                # Prioritize shortest match (usually the base + suffix)
-                # e.g. between EURUSDm and EURUSD_i, pick EURUSDm
-                matches = sorted(matches, key=lambda s: len(s.name))
-                best = matches[0].name
-                print(f"[Worker {self.worker_id}] Suffix match found: {best}", flush=True)
-                if mt5.symbol_select(best, True):
-                    return best
-        except Exception as e:
-            print(f"[Worker {self.worker_id}] Symbol resolve error: {e}", flush=True)
-            pass
-            
-        print(f"[Worker {self.worker_id}] No resolution found, returning original: {symbol}", flush=True)
-        return symbol # Return original as fallback
+        names = self._symbol_names
+        best = None
+        i = bisect.bisect_left(names, symbol)
+        while i < len(names) and names[i].startswith(symbol):
+            if best is None or len(names[i]) < len(best): best = names[i]
+            i += 1
+        return best
+
+    def _match_symbol(self, symbol):
+        real = self._match_prefix(symbol)
+        if real:
+            return real
+
+        # Another broker's suffix (e.g. "EURUSD.r" -> "EURUSD" / "EURUSDm")
+        for cut in range(1, min(SUFFIX_MAX_LEN, len(symbol) - 1) + 1):
+            rest = symbol[-cut:]
+            if rest[0] in "._-#" or (rest.isalpha() and rest.islower()):
+                real = self._match_prefix(symbol[:-cut])
+                if real: return real
+        return None
+
+    def _lookup_symbol(self, symbol):
+        # Broker symbol for a requested name, None if this broker doesn't carry it. Memoized.
+        self._check_symbol_index()
+        if symbol in self._resolved:
+            return self._resolved[symbol]
+        if self._symbol_names is None:
+            return symbol if mt5.symbol_select(symbol, True) else None # No index yet, don't cache
+
+        real = self._match_symbol(symbol)
+        if real is None:
+            print(f"[Worker {self.worker_id}] No resolution found for {symbol}", flush=True)
+        else:
+            if real != symbol:
+                print(f"[Worker {self.worker_id}] Suffix match found: {symbol} -> {real}", flush=True)
+            mt5.symbol_select(real, True) # Market Watch, needed for ticks (once per resolution)
+        self._resolved[symbol] = real
+        return real
+
+    def _resolve_symbol(self, symbol):
+        real = self._lookup_symbol(symbol)
+        return real if real is not None else symbol # Original as fallback, the MT5 call reports the error
 
     def run(self):
+        global mt5
         print(f"[Worker {self.worker_id}] Starting... Path: {self.terminal_path}", flush=True)
         
         # Initialize MT5 specific to this worker (Process Isolated)
         try:
+            if self.mt5_module or mt5 is None:
+                mt5 = load_mt5(self.mt5_module)
             if not mt5.initialize(path=self.terminal_path, timeout=60000):
                 self.result_queue.put({"status": "error", "detail": f"Init failed: {mt5.last_error()}"})
                 return
             
             info = mt5.terminal_info()
             print(f"[Worker {self.worker_id}] MT5 Initialized. Data Path: {info.data_path}", flush=True)
+            self._build_symbol_index()
         except Exception as e:
             self.result_queue.put({"status": "error", "detail": f"Init Exception: {e}"})
             return
 
+        if self.tick_board_name:
+            try:
+                self.tick_board = TickBoard.attach(self.tick_board_name)
+            except Exception as e:
+                print(f"[Worker {self.worker_id}] Tick board attach failed: {e}", flush=True)
+
         while self.running:
             try:
-                # Wait for command with timeout to allow checking self.running
-                try:
-                    command = self.command_queue.get(timeout=1)
-                except queue.Empty:
+                # Wait for command with timeout to allow checking self.running (and publishing ticks/state)
+                wait = 1
+                if self.tick_board: wait = min(wait, self.tick_interval)
+                if self.push_interval: wait = min(wait, self.push_interval)
+                command = self._next_command(wait)
+
+                if self.tick_board:
+                    self._publish_ticks()
+                if self.push_interval:
+                    self._push_state()
+                self._refresh_symbols()
+                shm_rates.release(self._shm_held, self.shm_ack_queue)
+                if command is None:
                     continue
 
                 cmd_type = command.get("type")
                 request_id = command.get("id")
+                queued_at = command.get("queued_at")
+                wait_ms = round((time.time() - queued_at) * 1000, 1) if queued_at else None
                 
                 if cmd_type == "STOP":
                     self.running = False
                     break
 
+                # Caller already timed out: skip without touching MT5, just release its accounting
+                deadline = command.get("deadline")
+                if deadline and time.time() > deadline:
+                    self.expired += 1
+                    result = {"status": "error", "detail": f"{cmd_type} deadline expired, not executed"}
+                    self.result_queue.put({"id": request_id, "result": result, "wait_ms": wait_ms, "expired": True})
+                    continue
+
                 # Process Command
-                result = None
-                try:
-                    if cmd_type == "LOGIN":
-                        result = self._handle_login(command["data"])
-                    elif cmd_type == "TRADE":
-                        result = self._handle_trade(command["data"])
-                    elif cmd_type == "MODIFY":
-                        result = self._handle_modify(command["data"])
-                    elif cmd_type == "CLOSE":
-                        result = self._handle_close(command["data"])
-                    elif cmd_type == "HISTORY":
-                        result = self._handle_history(command["data"])
-                    elif cmd_type == "POSITIONS":
-                        result = self._handle_positions()
-                    elif cmd_type == "ACCOUNT_INFO":
-                        result = self._handle_account_info()
-                    elif cmd_type == "TICKS":
-                        result = self._handle_ticks(command["data"])
-                    elif cmd_type == "TRADE_HISTORY":
-                        result = self._handle_trade_history(command["data"])
-                    elif cmd_type == "CHECK_MARGIN":
-                        result = self._handle_check_margin(command["data"])
-                    else:
-                         result = {"status": "error", "detail": "Unknown command"}
-                except Exception as e:
-                    print(f"[Worker {self.worker_id}] Error processing {cmd_type}: {e}")
-                    traceback.print_exc()
-                    result = {"status": "error", "detail": str(e)}
+                if cmd_type == "BATCH":
+                    result = self._handle_batch(command.get("data") or [])
+                else:
+                    result = self._dispatch(cmd_type, command.get("data"))
 
-                # Send Result
-                response = {"id": request_id, "result": result}
+                # Send Result (wait_ms = time spent queued, for head-of-line stats)
+                response = {"id": request_id, "result": result, "wait_ms": wait_ms}
                 self.result_queue.put(response)
 
             except Exception as e:
                  print(f"[Worker {self.worker_id}] Loop Error: {e}")
 
+        if self.tick_board:
+            self.tick_board.close()
+        shm_rates.release(self._shm_held, self.shm_ack_queue, close_all=True)
         mt5.shutdown()
         print(f"[Worker {self.worker_id}] Shutdown.")
 
+    def _next_command(self, wait):
+        if self.urgent_queue is None:
+            try:
+                return self.command_queue.get(timeout=wait)
+            except queue.Empty:
+                return None
+
+        # Sleep on the doorbell: one token per command put on either lane, and exactly one
+        # token is taken per command dequeued, so the count never drifts. Queue.put hands data
+        # to a feeder thread, so the command may reach its pipe a moment after the token:
+        # block briefly on the bulk lane (re-checking the urgent lane in between) instead of spinning.
+        if not self.doorbell.acquire(timeout=wait):
+            return None
+        give_up = time.monotonic() + FEEDER_WAIT
+        while True:
+            try:
+                return self.urgent_queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                return self.command_queue.get(timeout=0.001)
+            except queue.Empty:
+                if time.monotonic() > give_up:
+                    print(f"[Worker {self.worker_id}] Doorbell rang but no command arrived", flush=True)
+                    return None
+
+    def _handle_subscribe(self, data):
+        data = data or {}
+        if not data.get('enabled', True):
+            self.push_interval = None
+            self._push_snapshot = None
+            return {"status": "success", "detail": "Unsubscribed"}
+
+        self.push_interval = max(0.05, float(data.get('interval', 0.5)))
+        self._push_snapshot = None # Next push is a full snapshot (also used for resync)
+        self._last_push_poll = 0.0
+        return {"status": "success", "detail": f"Subscribed every {self.push_interval}s"}
+
+    def _push_state(self):
+        # Unsolicited message (id None, "push": "STATE"). First one after SUBSCRIBE is full,
+        # then only added/changed/removed tickets and changed account fields.
+        now = time.monotonic()
+        if now - self._last_push_poll < self.push_interval: return
+        self._last_push_poll = now
+
+        try:
+            positions = {p['ticket']: p for p in self._handle_positions()}
+            account = self._handle_account_info() or {}
+        except Exception as e:
+            print(f"[Worker {self.worker_id}] State poll error: {e}", flush=True)
+            return
+
+        prev = self._push_snapshot
+        if prev is None:
+            msg = {"full": True, "positions": list(positions.values()), "account": account}
+        else:
+            prev_positions, prev_account = prev
+            added, changed, removed, account_diff = diff_state(prev_positions, prev_account, positions, account)
+
+            self._push_snapshot = (positions, account)
+            if not (added or changed or removed or account_diff) and now - self._last_push_sent < PUSH_HEARTBEAT:
+                return
+            msg = {"full": False, "added": added, "changed": changed, "removed": removed, "account": account_diff}
+
+        self._push_snapshot = (positions, account)
+        self._push_version += 1
+        self._last_push_sent = now
+        msg.update({"id": None, "push": "STATE", "worker_id": self.worker_id,
+                    "login": self.current_account, "version": self._push_version})
+        self.result_queue.put(msg)
+
+    def _publish_ticks(self):
+        # Write latest bid/ask for every registered symbol into shared memory.
+        # Unchanged ticks are skipped so the slot seq only moves on real updates.
+        now = time.monotonic()
+        if now - self._last_publish < self.tick_interval: return
+        self._last_publish = now
+
+        board = self.tick_board
+        added = board.refresh_index()
+        if added:
+            for symbol in added:
+                self._board_symbols[symbol] = self._resolve_symbol(symbol)
+                self._board_last.pop(board.index[symbol], None) # Slot may have been reused by the API
+            for symbol in [s for s in self._board_symbols if s not in board.index]:
+                del self._board_symbols[symbol] # Evicted
+
+        for symbol, slot in board.index.items():
+            try:
+                tick = mt5.symbol_info_tick(self._board_symbols.get(symbol, symbol))
+                if not tick: continue
+                key = (tick.time_msc, tick.bid, tick.ask)
+                if self._board_last.get(slot) == key: continue
+                board.publish(slot, tick.bid, tick.ask, tick.time, tick.time_msc)
+                self._board_last[slot] = key
+            except Exception as e:
+                print(f"[Worker {self.worker_id}] Tick publish error ({symbol}): {e}", flush=True)
+
+    def _dispatch(self, cmd_type, data):
+        result = None
+        try:
+            if cmd_type == "LOGIN":
+                result = self._handle_login(data)
+            elif cmd_type == "TRADE":
+                result = self._handle_trade(data)
+            elif cmd_type == "MODIFY":
+                result = self._handle_modify(data)
+            elif cmd_type == "CLOSE":
+                result = self._handle_close(data)
+            elif cmd_type == "HISTORY":
+                result = self._handle_history(data)
+            elif cmd_type == "POSITIONS":
+                result = self._handle_positions()
+            elif cmd_type == "ACCOUNT_INFO":
+                result = self._handle_account_info()
+            elif cmd_type == "TICKS":
+                result = self._handle_ticks(data)
+            elif cmd_type == "RESOLVE":
+                result = self._handle_resolve(data)
+            elif cmd_type == "TRADE_HISTORY":
+                result = self._handle_trade_history(data)
+            elif cmd_type == "CHECK_MARGIN":
+                result = self._handle_check_margin(data)
+            elif cmd_type == "SUBSCRIBE":
+                result = self._handle_subscribe(data)
+            elif cmd_type == "PING":
+                info = mt5.terminal_info()
+                result = {"status": "success", "pong": time.time(), "expired": self.expired,
+                          "connected": bool(info and info.connected)} # Terminal <-> broker link, quotes freeze without it
+            else:
+                 result = {"status": "error", "detail": "Unknown command"}
+        except Exception as e:
+            print(f"[Worker {self.worker_id}] Error processing {cmd_type}: {e}")
+            traceback.print_exc()
+            result = {"status": "error", "detail": str(e)}
+        return result
+
+    def _handle_batch(self, sub_commands):
+        # Run sub-commands back-to-back, one response for the whole batch.
+        # Results keep the request order: [result_0, result_1, ...]
+        results = []
+        for sub in sub_commands:
+            sub_type = sub.get("type")
+            if sub_type in ("BATCH", "STOP"):
+                results.append({"status": "error", "detail": f"{sub_type} not allowed inside BATCH"})
+                continue
+            results.append(self._dispatch(sub_type, sub.get("data")))
+        return results
+
     def _handle_login(self, data):
         login = int(data['login'])
         password = data['password']
@@ -117,6 +435,10 @@ class MT5Worker(multiprocessing.Process):
              return {"status": "error", "detail": f"Login failed: {mt5.last_error()}"}
         
         self.current_account = login
+        self._symbol_names = None # Possibly another broker, rebuild the symbol index/specs on next lookup
+        self._symbols_checked = 0.0
+        self._resolved = {}
+        self._specs = {}
         return {"status": "success", "detail": f"Logged in as {login}"}
 
     def _handle_trade(self, item):
@@ -127,6 +449,9 @@ class MT5Worker(multiprocessing.Process):
         if not mt5.symbol_select(symbol, True):
              return {"status": "error", "detail": f"Symbol {symbol} select failed"}
 
+        volume_error = self._check_volume(symbol, float(item['volume']))
+        if volume_error: return {"status": "error", "detail": volume_error}
+
         action = mt5.TRADE_ACTION_DEAL
         order_type = mt5.ORDER_TYPE_BUY if item['action'] == "BUY" else mt5.ORDER_TYPE_SELL
         price = 0.0
@@ -158,7 +483,7 @@ class MT5Worker(multiprocessing.Process):
             "magic": 234000,
             "comment": item.get("comment", "FlutterWorker"),
             "type_time": mt5.ORDER_TIME_GTC,
-            "type_filling": mt5.ORDER_FILLING_IOC,
+            "type_filling": self._filling_for(symbol),
         }
         
         res = mt5.order_send(request)
@@ -241,6 +566,7 @@ class MT5Worker(multiprocessing.Process):
         positions = mt5.positions_get()
         if positions:
              for p in positions:
+                 spec = self._symbol_spec(p.symbol) # Cached, no terminal call on the hot loop
                  data.append({
                      "ticket": p.ticket,
                      "symbol": p.symbol,
@@ -252,8 +578,8 @@ class MT5Worker(multiprocessing.Process):
                      "time": p.time, # timestamp
                      "status": "OPEN",
                      "comment": p.comment,
-                     "tick_value": 0.0, # Optimize: don't fetch symbol_info for every pos in worker loop, or do it?
-                     "tick_size": 0.0   # Fast enough usually
+                     "tick_value": spec['tick_value'] if spec else 0.0,
+                     "tick_size": spec['tick_size'] if spec else 0.0
                  })
                  
         orders = mt5.orders_get()
@@ -294,13 +620,9 @@ class MT5Worker(multiprocessing.Process):
         timeframe = data.get('timeframe', 'M1')
         count = int(data.get('count', 300))
         
-        tf_map = {
-            "M1": mt5.TIMEFRAME_M1, "M5": mt5.TIMEFRAME_M5, "M15": mt5.TIMEFRAME_M15,
-            "M30": mt5.TIMEFRAME_M30, "H1": mt5.TIMEFRAME_H1, "H4": mt5.TIMEFRAME_H4,
-            "D1": mt5.TIMEFRAME_D1, "W1": mt5.TIMEFRAME_W1, "MN1": mt5.TIMEFRAME_MN1
-        }
-        
-        mt5_tf = tf_map.get(timeframe, mt5.TIMEFRAME_M1)
+        if timeframe not in TIMEFRAMES:
+            return {"status": "error", "detail": f"Unknown timeframe '{timeframe}', expected one of {TIMEFRAMES}"}
+        mt5_tf = getattr(mt5, f"TIMEFRAME_{timeframe}")
         
         # Ensure symbol is ready
         real_symbol = self._resolve_symbol(symbol)
@@ -315,7 +637,16 @@ class MT5Worker(multiprocessing.Process):
         if not mt5.symbol_select(real_symbol, True):
              return {"status": "error", "detail": f"Symbol {real_symbol} select failed (History)"}
              
-        rates = mt5.copy_rates_from_pos(real_symbol, mt5_tf, 0, count)
+        # Window: "from" [+ "to"] -> copy_rates_range, "before" + count -> copy_rates_from (bars at or
+        # before that time), else the last count bars. Times are bar times (server time seconds).
+        if data.get('from') is not None:
+            date_to = data.get('to')
+            rates = mt5.copy_rates_range(real_symbol, mt5_tf, int(data['from']),
+                                         int(date_to) if date_to is not None else RANGE_OPEN_END)
+        elif data.get('before') is not None:
+            rates = mt5.copy_rates_from(real_symbol, mt5_tf, int(data['before']), count)
+        else:
+            rates = mt5.copy_rates_from_pos(real_symbol, mt5_tf, 0, count)
         
         if rates is None:
              err = mt5.last_error()
@@ -323,6 +654,11 @@ class MT5Worker(multiprocessing.Process):
              return {"status": "error", "detail": f"Failed to get history for {symbol} ({real_symbol}): {err}"}
              
         print(f"[Worker {self.worker_id}] Retrieved {len(rates)} rates for {real_symbol}", flush=True)
+        if data.get('raw'):
+            # Raw NumPy rates array, encoded on the API side (candles.py). Large ones travel
+            # through shared memory instead of the result pipe (shm_rates.py)
+            return {"status": "success", "rates": shm_rates.pack(rates, self._shm_held)}
+
         data_list = []
         for rate in rates:
             data_list.append({
@@ -340,7 +676,10 @@ class MT5Worker(multiprocessing.Process):
         # Return dict of {symbol: {bid, ask...}}
         res = {}
         for s in symbols:
-             real_s = self._resolve_symbol(s)
+             real_s = self._lookup_symbol(s)
+             if real_s is None:
+                 res[s] = {"bid": 0.0, "ask": 0.0, "time": 0} # Broker doesn't carry it (cached miss, no MT5 call)
+                 continue
              tick = mt5.symbol_info_tick(real_s)
              
              # If tick not found, try selecting it (forces allow in MarketWatch)
@@ -356,6 +695,10 @@ class MT5Worker(multiprocessing.Process):
         
         return res
 
+    def _handle_resolve(self, symbols):
+        # {requested: broker symbol, or None if this broker does not carry it} (quote source suffix mapping)
+        return {s: self._lookup_symbol(s) for s in symbols or []}
+
     def _handle_trade_history(self, data):
         try:
             # Handle string dates safely
@@ -397,9 +740,10 @@ class MT5Worker(multiprocessing.Process):
 
             if group == "POSITIONS":
                 # Aggregate Deals into Positions
+                # (DEAL_LEDGER=0 fallback only, the backend serves these from closed_positions)
                 deals_by_id = {}
                 try:
-                    all_deals = mt5.history_deals_get(from_date, to_date)
+                    all_deals = res_tuple # Already the deals of this range
                     if all_deals:
                         for d in all_deals:
                             pid = d.position_id
@@ -510,6 +854,9 @@ class MT5Worker(multiprocessing.Process):
         # Resolve symbol
         real_symbol = self._resolve_symbol(symbol)
         
+        volume_error = self._check_volume(real_symbol, volume)
+        if volume_error: return {"status": "error", "detail": volume_error}
+        
         # Enum Map
         action_type = mt5.ORDER_TYPE_BUY if action_str == "BUY" else mt5.ORDER_TYPE_SELL
         
@@ -0,0 +1,74 @@
+try:
+    from backend.serialization import Shared
+except ImportError:
+    from serialization import Shared
+
+# === POSITION STREAM (delta mode for /ws/positions) ===
+# Per app login, keeps the last virtualized {account, positions} slice and a sequence number.
+# Every cycle that changes something produces one delta, encoded once and shared by all
+# delta-mode subscribers of that login:
+#   {"type": "snapshot", "login", "seq", "account": {...}, "positions": [...]}
+#   {"type": "delta", "login", "seq", "added": [p], "changed": [{ticket, field: value}],
+#    "removed": [ticket], "account": {changed fields}}
+# A delta with seq N applies on top of seq N - 1; on a gap the client asks for a new snapshot.
+# Messages are handed out as serialization.Shared, so each is encoded once per wire encoding.
+
+
+def diff_state(prev_positions, prev_account, positions, account):
+    """
+    Changes from one {ticket: position} / account dict pair to the next:
+    (added rows, changed [{ticket, field: value}], removed tickets, changed account fields).
+    Shared by this stream and the worker's push mode (MT5Worker._push_state).
+    """
+    added, changed = [], []
+    for ticket, p in positions.items():
+        old = prev_positions.get(ticket)
+        if old is None or old.get('status') != p.get('status'):
+            added.append(p) # New, or pending order filled -> replace whole row
+        elif old != p:
+            diff = {k: v for k, v in p.items() if old.get(k) != v}
+            diff['ticket'] = ticket
+            changed.append(diff)
+    removed = [ticket for ticket in prev_positions if ticket not in positions]
+    account_diff = {k: v for k, v in account.items() if prev_account.get(k) != v}
+    return added, changed, removed, account_diff
+
+
+class PositionStream:
+    def __init__(self):
+        self.accounts = {} # { app_login : {seq, positions{ticket: p}, account, snapshot (seq, Shared)} }
+
+    def seq(self, login):
+        state = self.accounts.get(login)
+        return state['seq'] if state else None
+
+    def update(self, login, data):
+        # data: {"account": {...}, "positions": [...]}. Returns (seq, Shared delta) or None if unchanged/first.
+        positions = {p['ticket']: p for p in data.get('positions', [])}
+        account = data.get('account') or {}
+
+        state = self.accounts.get(login)
+        if state is None:
+            self.accounts[login] = {"seq": 1, "positions": positions, "account": account, "snapshot": None}
+            return None
+
+        added, changed, removed, account_diff = diff_state(state['positions'], state['account'], positions, account)
+        state['positions'], state['account'] = positions, account
+        if not (added or changed or removed or account_diff):
+            return None
+
+        state['seq'] += 1
+        state['snapshot'] = None
+        msg = {"type": "delta", "login": login, "seq": state['seq'],
+               "added": added, "changed": changed, "removed": removed, "account": account_diff}
+        return state['seq'], Shared(msg)
+
+    def snapshot(self, login):
+        # (seq, Shared snapshot) of the current state, built at most once per seq
+        state = self.accounts.get(login)
+        if state is None: return None
+        if state['snapshot'] is None:
+            msg = {"type": "snapshot", "login": login, "seq": state['seq'],
+                   "account": state['account'], "positions": list(state['positions'].values())}
+            state['snapshot'] = (state['seq'], Shared(msg))
+        return state['snapshot']
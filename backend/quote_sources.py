@@ -0,0 +1,267 @@
+import os
+import time
+import zlib
+import asyncio
+
+try:
+    from backend.worker_manager import LANE_BULK
+except ImportError:
+    from worker_manager import LANE_BULK
+
+# === QUOTE SOURCES ===
+# Picks which worker(s) feed /ws/quotes instead of always the first one.
+#
+# Health per worker (lower score = better):
+#   heartbeat_ms        supervisor PING round-trip (worker responsiveness)
+#   fetch latency       EWMA of TICKS round-trips (TICK_BOARD=0)
+#   bulk lane depth     a worker busy with history pulls answers quotes late
+#   failures            consecutive failed TICKS fetches; QUOTE_MAX_FAILURES of them benches it for QUOTE_RETRY_S
+#   staleness           no quote advanced for QUOTE_STALE_S while another source is fresh (frozen feed)
+# Dead, recovering and broker-disconnected (PING "connected": false) workers are never used.
+#
+# The primary keeps the feed until something is clearly better (QUOTE_SWITCH_RATIO), so quotes
+# don't hop between brokers on noise. Watchlists of QUOTE_SHARD_MIN+ symbols are split across the
+# QUOTE_MAX_SHARDS best workers (rendezvous hashing, so a symbol keeps its worker while that one is
+# healthy) and fetched in parallel. Brokers name symbols differently (EURUSD, EURUSDm, EURUSD.r):
+# each worker resolves the requested names once (RESOLVE) and symbols its broker doesn't carry
+# go to a worker that does.
+
+STALE_AFTER = float(os.getenv("QUOTE_STALE_S", "10"))
+SHARD_MIN = int(os.getenv("QUOTE_SHARD_MIN", "16"))
+MAX_SHARDS = int(os.getenv("QUOTE_MAX_SHARDS", "4"))
+MAX_FAILURES = int(os.getenv("QUOTE_MAX_FAILURES", "3"))
+RETRY_AFTER = float(os.getenv("QUOTE_RETRY_S", "5"))
+SWITCH_RATIO = float(os.getenv("QUOTE_SWITCH_RATIO", "2"))
+
+FETCH_TIMEOUT = 1 # Seconds per TICKS request
+FETCH_INTERVAL = 0.5 # Seconds between TICKS polls (board path polls at the board's rate)
+LATENCY_ALPHA = 0.3 # EWMA weight of the newest TICKS round-trip
+BUSY_PENALTY_MS = 20 # Per request queued on the bulk lane
+FAILURE_PENALTY_MS = 250 # Per consecutive failure
+STALE_PENALTY_MS = 10000
+SWITCH_MARGIN_MS = 50 # Absolute slack, single PING samples jitter by tens of ms under load
+
+
+class QuoteSources:
+    def __init__(self, manager):
+        self.manager = manager
+        self.primary = None
+        self.switches = 0
+        self.latency = {} # { mt5_login : EWMA TICKS ms }
+        self.failures = {} # { mt5_login : consecutive failed fetches }
+        self.benched = {} # { mt5_login : monotonic time it may be tried again }
+        self.last_advance = {} # { mt5_login : monotonic time any of its quotes last moved }
+        self.seen = {} # { (mt5_login, symbol) : board seq / (bid, ask, time) last observed }
+        self.symbols = {} # { mt5_login : { requested : broker symbol, None = not carried } }
+        self.symbol_sessions = {} # { mt5_login : manager session self.symbols[login] was resolved in }
+        self.resolving = set() # (mt5_login, symbol) with a RESOLVE in flight
+        self.unresolved = {} # { mt5_login : [symbols] } to RESOLVE at the end of this plan()
+        self._pending = set() # RESOLVE tasks in flight, named "resolve:<mt5_login>"
+
+    # --- Health ---
+
+    def usable(self, login):
+        m = self.manager
+        if not m.is_worker_running(login) or login in m.recovering: return False
+        if m.health.get(login, {}).get('connected') is False: return False
+        return time.monotonic() >= self.benched.get(login, 0)
+
+    def _age(self, login):
+        t = self.last_advance.get(login)
+        return None if t is None else time.monotonic() - t
+
+    def stale(self, login, candidates):
+        # Frozen only relative to the others: a quiet market (everything idle) is not a failure
+        age = self._age(login)
+        if age is None or age <= STALE_AFTER: return False
+        for other in candidates:
+            if other == login: continue
+            other_age = self._age(other)
+            if other_age is None or other_age <= STALE_AFTER: return True
+        return False
+
+    def score(self, login, candidates):
+        health = self.manager.health.get(login, {})
+        bulk = self.manager.lane_stats.get(login, {}).get(LANE_BULK, {})
+        s = (health.get('heartbeat_ms') or 0.0) + self.latency.get(login, 0.0)
+        s += BUSY_PENALTY_MS * bulk.get('depth', 0)
+        s += FAILURE_PENALTY_MS * self.failures.get(login, 0)
+        if self.stale(login, candidates): s += STALE_PENALTY_MS
+        return s
+
+    def ranked(self):
+        # Usable workers best first, the current primary stays first unless clearly beaten
+        candidates = [login for login in list(self.manager.workers.keys()) if self.usable(login)]
+        for login in [l for l in self.last_advance if l not in candidates]:
+            self.last_advance.pop(login, None) # Fresh grace period once it is usable again
+        if not candidates: return []
+        scores = {login: self.score(login, candidates) for login in candidates}
+        order = sorted(candidates, key=lambda login: scores[login])
+        best = order[0]
+
+        if self.primary in scores and scores[self.primary] <= scores[best] * SWITCH_RATIO + SWITCH_MARGIN_MS:
+            best = self.primary
+        if best != self.primary:
+            if self.primary is not None:
+                self.switches += 1
+                old = f"{scores[self.primary]:.0f}" if self.primary in scores else "unusable"
+                print(f"[Quotes] Feed {self.primary} -> {best} (score {old} -> {scores[best]:.0f})")
+            self.primary = best
+        order.remove(best)
+        return [best] + order
+
+    # --- Symbol mapping ---
+
+    def _mapping(self, login):
+        # Broker names hold for one terminal session: a respawned worker or a new LOGIN (maybe
+        # on another broker) resolves everything again
+        session = self.manager.sessions.get(login)
+        if self.symbol_sessions.get(login) != session:
+            self.symbol_sessions[login] = session
+            self.symbols.pop(login, None)
+        return self.symbols.setdefault(login, {})
+
+    def carries(self, login, symbol):
+        # Optimistic until the worker's RESOLVE answer arrives
+        mapping = self._mapping(login)
+        if symbol not in mapping:
+            if (login, symbol) not in self.resolving:
+                self.resolving.add((login, symbol))
+                self.unresolved.setdefault(login, []).append(symbol)
+            return True
+        return mapping[symbol] is not None
+
+    async def _resolve(self, login, symbols):
+        session = self.manager.sessions.get(login)
+        try:
+            res = await self.manager.execute(login, "RESOLVE", symbols, timeout=10)
+            if session != self.manager.sessions.get(login): return # Answered by the previous session
+            if isinstance(res, dict) and 'status' not in res:
+                self._mapping(login).update(res)
+                missing = [s for s, real in res.items() if real is None]
+                if missing: print(f"[Quotes] {login} does not carry {missing}")
+        except Exception as e:
+            print(f"[Quotes] Resolve error ({login}): {e}")
+        finally:
+            for s in symbols: self.resolving.discard((login, s))
+
+    def broker_symbol(self, login, symbol):
+        return self._mapping(login).get(symbol)
+
+    # --- Planning ---
+
+    def plan(self, symbols):
+        # { mt5_login : [symbols] } - who serves which symbol this cycle
+        ranked = self.ranked()
+        if not ranked: return {}
+        shards = ranked[:min(MAX_SHARDS, len(ranked))] if len(symbols) >= SHARD_MIN else ranked[:1]
+
+        plan = {}
+        for symbol in symbols:
+            carriers = [login for login in shards if self.carries(login, symbol)]
+            if not carriers:
+                # Not on any shard's broker, first other worker that has it
+                carriers = [login for login in ranked[len(shards):] if self.carries(login, symbol)][:1]
+                if not carriers: continue
+            login = carriers[0] if len(carriers) == 1 else \
+                max(carriers, key=lambda l: zlib.crc32(f"{l}:{symbol}".encode()))
+            plan.setdefault(login, []).append(symbol)
+
+        # One RESOLVE per worker for everything new this cycle. A worker still answering the
+        # previous one keeps its new symbols queued for a later cycle
+        busy = {t.get_name() for t in self._pending}
+        waiting = {}
+        for login, syms in self.unresolved.items():
+            name = f"resolve:{login}"
+            if name in busy:
+                waiting[login] = syms
+                continue
+            task = asyncio.create_task(self._resolve(login, syms), name=name)
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        self.unresolved = waiting
+        return plan
+
+    def _observe(self, login, symbol, key):
+        # Freshness bookkeeping, shared by every client reading through this object
+        now = time.monotonic()
+        if login not in self.last_advance: self.last_advance[login] = now # Grace period from first use
+        if self.seen.get((login, symbol)) != key:
+            self.seen[(login, symbol)] = key
+            self.last_advance[login] = now
+
+    def _quote(self, login, symbol, bid, ask, tick_time):
+        msg = {"symbol": symbol, "bid": bid, "ask": ask, "time": tick_time, "server": login}
+        real = self.broker_symbol(login, symbol)
+        if real and real != symbol: msg["mt5_symbol"] = real
+        return msg
+
+    # --- Fetching ---
+
+    async def _fetch(self, login, symbols):
+        t0 = time.monotonic()
+        res = await self.manager.execute(login, "TICKS", symbols, timeout=FETCH_TIMEOUT)
+        if not isinstance(res, dict) or 'status' in res: # Ticks come back as a bare {symbol: tick}
+            n = self.failures[login] = self.failures.get(login, 0) + 1
+            if n >= MAX_FAILURES:
+                self.benched[login] = time.monotonic() + RETRY_AFTER
+                self.failures[login] = 0
+                print(f"[Quotes] {login} benched for {RETRY_AFTER}s: {res.get('detail') if isinstance(res, dict) else res}")
+            return login, {}
+
+        ms = (time.monotonic() - t0) * 1000
+        prev = self.latency.get(login)
+        self.latency[login] = ms if prev is None else prev + LATENCY_ALPHA * (ms - prev)
+        self.failures[login] = 0
+        return login, res
+
+    async def quotes(self, symbols):
+        """
+        One cycle for a client: [(symbol, change key, quote msg)] plus the seconds to wait
+        before the next cycle. Board-backed workers are read from shared memory, the rest
+        get one TICKS request each, all in parallel.
+        """
+        plan = self.plan(symbols)
+        out = []
+        fetches = []
+        for login, syms in plan.items():
+            board = self.manager.get_tick_board(login)
+            if board is None:
+                fetches.append(self._fetch(login, syms))
+                continue
+            for symbol in syms:
+                q = board.read(symbol)
+                if q is None:
+                    board.register(symbol) # Worker starts publishing it on its next cycle
+                    continue
+                if q['time'] == 0: continue
+                key = (board.name, q['seq'])
+                self._observe(login, symbol, key)
+                out.append((symbol, key, self._quote(login, symbol, q['bid'], q['ask'], q['time'])))
+
+        if fetches:
+            for login, ticks in await asyncio.gather(*fetches):
+                for symbol, data in ticks.items():
+                    if not isinstance(data, dict) or data.get('time', 0) == 0: continue
+                    key = (login, data['bid'], data['ask'], data['time'])
+                    self._observe(login, symbol, key)
+                    out.append((symbol, key, self._quote(login, symbol, data['bid'], data['ask'], data['time'])))
+
+        if not plan: return out, 1.0 # No usable worker yet
+        interval = FETCH_INTERVAL if fetches else self.manager.tick_interval
+        return out, interval
+
+    def stats(self):
+        candidates = [login for login in list(self.manager.workers.keys()) if self.usable(login)]
+        sources = {}
+        for login in list(self.manager.workers.keys()):
+            age = self._age(login)
+            sources[login] = {
+                "usable": login in candidates,
+                "score": round(self.score(login, candidates), 1) if login in candidates else None,
+                "fetch_ms": round(self.latency[login], 1) if login in self.latency else None,
+                "failures": self.failures.get(login, 0),
+                "since_update_s": round(age, 1) if age is not None else None,
+                "unavailable": sorted(s for s, real in self._mapping(login).items() if real is None),
+            }
+        return {"primary": self.primary, "switches": self.switches, "sources": sources}
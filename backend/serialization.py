@@ -0,0 +1,137 @@
+import json
+import struct
+
+from fastapi import WebSocketDisconnect
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# === SERIALIZATION ===
+# One place for every payload the API sends:
+#   REST       - FastJSONResponse (orjson when installed, same JSON otherwise)
+#   WebSockets - "json" text frames (default) or "msgpack" binary frames, negotiated per client
+#                with ?encoding=msgpack. Shared payloads are encoded once per encoding, not per client.
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+if orjson:
+    _ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=_ORJSON_OPTS)
+
+    def dumps_text(obj) -> str:
+        return orjson.dumps(obj, option=_ORJSON_OPTS).decode()
+
+    loads = orjson.loads
+else:
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def dumps_text(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+    loads = json.loads
+
+
+def packb(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def negotiate(requested):
+    # Encoding for a websocket client, json unless msgpack was asked for and is available
+    if requested == ENCODING_MSGPACK and msgpack:
+        return ENCODING_MSGPACK
+    return ENCODING_JSON
+
+
+def encode(obj, encoding=ENCODING_JSON):
+    return packb(obj) if encoding == ENCODING_MSGPACK else dumps_text(obj)
+
+
+class FastJSONResponse(JSONResponse):
+    # Drop-in JSONResponse with the fast encoder (returning it directly also skips jsonable_encoder)
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class Shared:
+    """A message sent unchanged to many clients, encoded lazily at most once per encoding."""
+    __slots__ = ("obj", "_encoded")
+
+    def __init__(self, obj):
+        self.obj = obj
+        self._encoded = {}
+
+    def encode(self, encoding=ENCODING_JSON):
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = self._encoded[encoding] = encode(self.obj, encoding)
+        return data
+
+
+class SharedItem:
+    """One key/value entry of a map frame; clients get the map of just the entries they subscribed to."""
+    __slots__ = ("key", "value", "_encoded")
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+        self._encoded = {}
+
+    def encode(self, encoding=ENCODING_JSON):
+        data = self._encoded.get(encoding)
+        if data is None:
+            if encoding == ENCODING_MSGPACK:
+                data = packb(self.key) + packb(self.value)
+            else:
+                data = f"{dumps_text(self.key)}:{dumps_text(self.value)}"
+            self._encoded[encoding] = data
+        return data
+
+
+def join_items(items, encoding=ENCODING_JSON):
+    # Map frame from SharedItems without re-encoding them
+    parts = [item.encode(encoding) for item in items]
+    if encoding != ENCODING_MSGPACK:
+        return "{" + ",".join(parts) + "}"
+    n = len(parts)
+    if n < 16:
+        header = bytes([0x80 | n])
+    elif n < 0x10000:
+        header = b"\xde" + struct.pack(">H", n)
+    else:
+        header = b"\xdf" + struct.pack(">I", n)
+    return header + b"".join(parts)
+
+
+async def send(websocket, data):
+    # data from encode()/Shared/join_items: text -> text frame, bytes -> binary frame
+    if isinstance(data, (bytes, bytearray)):
+        await websocket.send_bytes(bytes(data))
+    else:
+        await websocket.send_text(data)
+
+
+async def send_obj(websocket, obj, encoding=ENCODING_JSON):
+    await send(websocket, encode(obj, encoding))
+
+
+async def receive(websocket):
+    # Client commands: JSON text frames, or msgpack binary frames from msgpack clients
+    message = await websocket.receive()
+    if message.get("type") == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        if msgpack is None: raise ValueError("msgpack not available")
+        return msgpack.unpackb(message["bytes"], raw=False)
+    return loads(message.get("text") or "null")
@@ -0,0 +1,90 @@
+import os
+import time
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# === OUT-OF-BAND RATES ===
+# A raw HISTORY result is a copy_rates_* NumPy array (60 bytes per bar). Through the result
+# queue it would be pickled into the pipe and read back out of it in chunks, all while the
+# worker's command loop and the manager's reader thread are busy with it. From
+# SHM_RATES_MIN_BYTES up the worker copies the bars into a fresh shared memory block instead and
+# only its name, dtype and count go through the queue:
+#   worker  pack(rates, held)        -> create block, copy bars in, keep the handle in `held`
+#   manager unpack_result(res, ack)  -> copy bars out, close + unlink, put the name on `ack`,
+#                                       before the result reaches the loop
+#   worker  release(held, ack)       -> (main loop) close the handles the manager is done with
+# The worker has to hold its handle until then: on Windows a block only lives while some handle
+# is open (unlink() does nothing there), so closing it right after the copy would destroy the
+# bars before the manager attaches. On POSIX the manager's unlink removes the name and the
+# worker's close unmaps the last view.
+# The manager unpacks and acks every result it reads, also ones nobody waits for anymore.
+# Handles not acked within SHM_RATES_HOLD_S (manager gone or stuck) are closed anyway.
+# Small arrays, and workers started without an ack queue, stay in-band.
+
+MIN_BYTES = int(os.getenv("SHM_RATES_MIN_BYTES", "65536"))
+HOLD_S = float(os.getenv("SHM_RATES_HOLD_S", "60"))
+
+
+def pack(rates, held):
+    """
+    Worker side: the rates themselves when small (or held is None), else a {"shm", "dtype", "count"}
+    reference. held is the worker's { block name : (SharedMemory, monotonic time) } until acked.
+    """
+    if held is None or rates.nbytes < MIN_BYTES:
+        return rates
+    shm = shared_memory.SharedMemory(create=True, size=rates.nbytes)
+    try:
+        np.ndarray(rates.shape, dtype=rates.dtype, buffer=shm.buf)[:] = rates
+    except Exception:
+        shm.close()
+        shm.unlink()
+        raise
+    held[shm.name] = (shm, time.monotonic())
+    return {"shm": shm.name, "dtype": rates.dtype, "count": len(rates)}
+
+
+def release(held, ack_queue, close_all=False):
+    """Worker side: closes the handles the manager acked (every one on shutdown or once stale)."""
+    if not held: return
+    try:
+        while True:
+            entry = held.pop(ack_queue.get_nowait(), None)
+            if entry: entry[0].close()
+    except (queue.Empty, OSError, EOFError):
+        pass
+    now = time.monotonic()
+    for name in [n for n, (_, t) in held.items() if close_all or now - t > HOLD_S]:
+        held.pop(name)[0].close()
+
+
+def unpack(ref):
+    # Copies the bars out and removes the block. None if it is already gone.
+    try:
+        shm = shared_memory.SharedMemory(name=ref["shm"])
+    except FileNotFoundError:
+        return None
+    try:
+        rates = np.ndarray((ref["count"],), dtype=ref["dtype"], buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+    return rates
+
+
+def unpack_result(res, ack_queue):
+    """Manager side: swaps a shared memory reference in a worker message for the rates array."""
+    result = res.get('result')
+    if not isinstance(result, dict): return res
+    ref = result.get('rates')
+    if not isinstance(ref, dict) or "shm" not in ref: return res
+    rates = unpack(ref)
+    if ack_queue is not None:
+        try: ack_queue.put(ref["shm"]) # Worker may close its handle now
+        except (OSError, ValueError): pass
+    if rates is None:
+        res['result'] = {"status": "error", "detail": f"History block {ref['shm']} vanished before it was read"}
+    else:
+        result['rates'] = rates
+    return res
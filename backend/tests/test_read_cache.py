@@ -0,0 +1,50 @@
+"""
+Read coalescing / freshness cache: a read in flight while a trade invalidates the
+account must not land in the cache, nor be handed to callers arriving after the trade.
+"""
+import asyncio
+
+from backend.worker_manager import AsyncWorkerManager
+
+LOGIN = 1000
+
+
+def make_manager(monkeypatch):
+    monkeypatch.setenv("READ_CACHE_MS", "10000")
+    manager = AsyncWorkerManager(dispatch_mode="event")
+    manager.is_worker_running = lambda login: True
+    return manager
+
+
+def test_read_in_flight_during_invalidation_is_not_cached(monkeypatch):
+    manager = make_manager(monkeypatch)
+    positions = ["before"]
+    release = asyncio.Event()
+    calls = []
+
+    async def fake_execute(login, command_type, data=None, timeout=15):
+        calls.append(command_type)
+        if command_type == "TRADE":
+            positions[0] = "after"
+            return {"status": "success"}
+        seen = positions[0]
+        if len(calls) == 1: await release.wait() # First read answers from before the trade
+        return {"status": "success", "positions": seen}
+
+    manager._execute = fake_execute
+
+    async def scenario():
+        slow = asyncio.create_task(manager.execute(LOGIN, "POSITIONS"))
+        while not calls: await asyncio.sleep(0)
+        await manager.execute(LOGIN, "TRADE", {"symbol": "EURUSD"})
+        late = await manager.execute(LOGIN, "POSITIONS") # Must not join the pre-trade read
+        release.set()
+        stale = await slow
+        cached = await manager.execute(LOGIN, "POSITIONS")
+        return stale, late, cached
+
+    stale, late, cached = asyncio.run(scenario())
+    assert stale["positions"] == "before"
+    assert late["positions"] == "after"
+    assert cached["positions"] == "after"
+    assert calls == ["POSITIONS", "TRADE", "POSITIONS"] # Last one served from the cache
@@ -0,0 +1,91 @@
+"""
+Out-of-band HISTORY rates: a block packed in another process comes back intact and is removed,
+and the creator keeps its handle open until the reader has acked it.
+"""
+import sys
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from backend import shm_rates
+
+RATES_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8'),
+])
+
+
+def make_rates(n):
+    rates = np.zeros(n, dtype=RATES_DTYPE)
+    rates['time'] = np.arange(n) * 60
+    rates['close'] = 1.1 + np.arange(n) / 1e5
+    return rates
+
+
+def worker_side(n, out, ack_q, done):
+    # Like MT5Worker: pack, send, then only close the handle once the manager acked it
+    held = {}
+    out.put({"id": "x", "result": {"status": "success", "rates": shm_rates.pack(make_rates(n), held)}})
+    while held:
+        shm_rates.release(held, ack_q)
+    done.put("released")
+
+
+def test_large_rates_round_trip_while_creator_holds_the_block():
+    out, ack_q, done = multiprocessing.Queue(), multiprocessing.Queue(), multiprocessing.Queue()
+    child = multiprocessing.Process(target=worker_side, args=(5000, out, ack_q, done))
+    child.start()
+    res = out.get(timeout=10)
+
+    ref = res['result']['rates']
+    assert isinstance(ref, dict) and ref['count'] == 5000
+    assert done.empty() # Worker still holds the block: nothing acked yet
+    res = shm_rates.unpack_result(res, ack_q)
+    assert np.array_equal(res['result']['rates'], make_rates(5000))
+    assert done.get(timeout=10) == "released"
+    child.join(timeout=10)
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=ref['shm'])
+
+
+def test_release_only_closes_acked_blocks():
+    held, ack_q = {}, multiprocessing.Queue()
+    a = shm_rates.pack(make_rates(5000), held)
+    b = shm_rates.pack(make_rates(5000), held)
+    ack_q.put(a['shm'])
+    deadline = time.monotonic() + 5
+    while a['shm'] in held and time.monotonic() < deadline: # put() is flushed by a feeder thread
+        shm_rates.release(held, ack_q)
+    assert list(held) == [b['shm']]
+    shm_rates.release(held, ack_q, close_all=True)
+    assert not held
+    for ref in (a, b):
+        shm = shared_memory.SharedMemory(name=ref['shm'])
+        shm.close()
+        shm.unlink()
+
+
+@pytest.mark.skipif(sys.platform != "win32", reason="POSIX keeps a block until it is unlinked, "
+                    "only Windows destroys it with its last handle (why pack() holds its handle)")
+def test_block_dies_with_its_last_handle_on_windows():
+    shm = shared_memory.SharedMemory(create=True, size=4096)
+    name = shm.name
+    shm.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_small_rates_stay_in_band():
+    rates = make_rates(10)
+    assert shm_rates.pack(rates, {}) is rates
+    assert isinstance(shm_rates.pack(make_rates(5000), None), np.ndarray) # No ack queue, no block
+    res = {"id": "x", "result": {"status": "success", "rates": rates}}
+    assert shm_rates.unpack_result(res, None)['result']['rates'] is rates
+
+
+def test_vanished_block_is_an_error():
+    res = {"id": "x", "result": {"status": "success", "rates": {"shm": "psm_gone", "dtype": RATES_DTYPE, "count": 1}}}
+    assert shm_rates.unpack_result(res, None)['result']['status'] == "error"
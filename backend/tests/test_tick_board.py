@@ -0,0 +1,105 @@
+"""
+Shared-memory tick board: seqlock reads under a concurrent writer process, runtime
+registration, slot eviction when full.
+"""
+import time
+import multiprocessing
+
+import pytest
+
+from backend import tick_board
+from backend.tick_board import TickBoard
+
+SYMBOLS = ["EURUSD", "GBPUSD", "USDJPY", "XAUUSD"]
+LATE_SYMBOL = "BTCUSD"
+
+
+def fake_producer(board_name, stop):
+    # Every field derives from one counter (ask = bid + 0.5, time = bid, time_msc = bid * 1000),
+    # so a torn snapshot breaks those rules
+    board = TickBoard.attach(board_name)
+    n = 1
+    while not stop.is_set():
+        board.refresh_index() # Picks up LATE_SYMBOL once registered
+        for slot in board.index.values():
+            board.publish(slot, float(n), n + 0.5, n, n * 1000)
+            n += 1
+    board.close()
+
+
+@pytest.fixture
+def board():
+    b = TickBoard.create(capacity=16)
+    yield b
+    b.close()
+
+
+def test_no_torn_reads_and_late_registration(board):
+    for s in SYMBOLS: board.register(s)
+    stop = multiprocessing.Event()
+    producer = multiprocessing.Process(target=fake_producer, args=(board.name, stop), daemon=True)
+    producer.start()
+    try:
+        reads = torn = 0
+        late_registered = False
+        t_end = time.time() + 1.5
+        while time.time() < t_end:
+            if not late_registered and time.time() > t_end - 0.75:
+                board.register(LATE_SYMBOL)
+                late_registered = True
+            for slot in list(board.index.values()):
+                snap = board.read_slot(slot)
+                if snap is None or snap[0] == 0: continue
+                seq, bid, ask, tick_time, time_msc, gen = snap
+                reads += 1
+                if ask != bid + 0.5 or tick_time != int(bid) or time_msc != tick_time * 1000:
+                    torn += 1
+    finally:
+        stop.set()
+        producer.join(timeout=3)
+
+    assert reads > 1000
+    assert torn == 0
+    assert board.read(LATE_SYMBOL) is not None
+
+
+def test_register_is_idempotent(board):
+    assert board.register("EURUSD") == board.register("EURUSD") == 0
+    assert board.register("GBPUSD") == 1
+
+
+def test_full_board_with_every_symbol_in_use(board):
+    for i in range(board.capacity): assert board.register(f"SYM{i}") == i
+    assert board.register("ONE_MORE") is None
+    assert "ONE_MORE" not in board.index
+
+
+def test_idle_symbol_is_evicted_without_leaking_its_price(monkeypatch):
+    api = TickBoard.create(capacity=2)
+    worker = TickBoard.attach(api.name)
+    try:
+        api.register("EURUSD")
+        api.register("GBPUSD")
+        worker.refresh_index()
+        worker.publish(worker.index["EURUSD"], 1.1, 1.2, 100, 100000)
+        worker.publish(worker.index["GBPUSD"], 1.3, 1.4, 100, 100000)
+        assert api.read("EURUSD")["bid"] == 1.1
+        assert api.read("GBPUSD")["bid"] == 1.3
+
+        monkeypatch.setattr(tick_board, "EVICT_IDLE_S", 0.0)
+        api.last_read["GBPUSD"] = time.monotonic() - 5 # Least recently read -> evicted
+        slot = api.register("XAUUSD")
+        assert slot == 1
+        assert "GBPUSD" not in api.index
+        assert api.read("GBPUSD") is None
+        # Reused slot still holds GBPUSD's tick: not shown as XAUUSD
+        assert api.read("XAUUSD") is None
+
+        assert worker.refresh_index() == ["XAUUSD"]
+        assert "GBPUSD" not in worker.index
+        worker.publish(worker.index["XAUUSD"], 2400.0, 2400.5, 101, 101000)
+        assert api.read("XAUUSD")["bid"] == 2400.0
+        assert api.read("EURUSD")["bid"] == 1.1
+    finally:
+        worker.close()
+        api.close()
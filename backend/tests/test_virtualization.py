@@ -0,0 +1,61 @@
+"""
+Columnar mirror/multiplier virtualization against the per-dict loops it replaced
+(bench_virtualize.py), including .xx5 rounding ties and rows of mixed shapes.
+"""
+import copy
+
+import pytest
+
+from backend import virtualization
+from backend.bench_virtualize import (SETTINGS, fake_deals, fake_positions, legacy_history,
+                                      legacy_net_profit, legacy_positions)
+
+N = 5_000
+
+
+def mixed_deals():
+    # Trade deals with BALANCE/credit rows in between that lack some fields, one of them first
+    deals = fake_deals(200)
+    for i in (0, 7, 50, 199):
+        deals[i] = {"ticket": deals[i]["ticket"], "time": deals[i]["time"], "type": "BALANCE",
+                    "entry": 0, "profit": 1000.005, "comment": "Deposit"}
+    del deals[10]["swap"]
+    del deals[11]["commission"]
+    del deals[12]["volume"]
+    deals[20].update(sl=1.1, tp=1.2)
+    deals[21]["sl"] = 1.0 # No tp: stays put
+    return deals
+
+
+@pytest.mark.parametrize("mirror,multiplier", SETTINGS)
+def test_history_matches_legacy(mirror, multiplier):
+    u = {"mirror_enabled": 1 if mirror else 0, "multiplier": multiplier}
+    for deals in (fake_deals(N), mixed_deals()):
+        old, new = copy.deepcopy(deals), copy.deepcopy(deals)
+        legacy_history(old, u)
+        virtualization.virtualize_history(new, u['mirror_enabled'], multiplier)
+        assert new == old
+
+
+@pytest.mark.parametrize("mirror,multiplier", SETTINGS)
+def test_positions_match_legacy(mirror, multiplier):
+    u = {"mirror_enabled": 1 if mirror else 0, "multiplier": multiplier}
+    positions = fake_positions(N)
+    old, new = copy.deepcopy(positions), copy.deepcopy(positions)
+    floating_old = legacy_positions(old, u)
+    floating_new = virtualization.virtualize_positions(new, u['mirror_enabled'], multiplier)
+    assert new == old
+    assert floating_new == floating_old
+
+
+@pytest.mark.parametrize("mirror,multiplier", SETTINGS)
+def test_net_profit_matches_legacy(mirror, multiplier):
+    u = {"mirror_enabled": 1 if mirror else 0, "multiplier": multiplier}
+    for deals in (fake_deals(N), mixed_deals()):
+        assert virtualization.net_profit(deals, u['mirror_enabled'], multiplier) == legacy_net_profit(deals, u)
+
+
+def test_empty_rows():
+    assert virtualization.virtualize_history([], True, 2.0) is None
+    assert virtualization.virtualize_positions([], True, 2.0) == 0.0
+    assert virtualization.net_profit([], True, 2.0) == 0.0
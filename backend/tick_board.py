@@ -0,0 +1,210 @@
+import time
+import struct
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+
+# === SHARED-MEMORY TICK BOARD ===
+# Fixed-layout quote table written by one MT5Worker and read by the API process
+# without IPC or pickling.
+#
+# Header (64 bytes): magic, capacity, count (slots in use), epoch (bumped when a slot is reused)
+# Slot   (80 bytes): seq, bid, ask, time, time_msc, gen | name_gen, name[24]
+#
+# Each slot is a seqlock: the writer bumps seq to odd, writes the fields, bumps it
+# back to even. A reader retries until it sees the same even seq before and after.
+# Names/count/epoch/name_gen are only written by the registering side (API), the worker
+# only writes tick fields, so every field has a single writer.
+#
+# A full board reuses the slot of the symbol read least recently, if nobody read it for
+# EVICT_IDLE_S. The slot's name_gen goes up with the new name and the worker stamps each
+# tick with the name_gen it published for, so a reused slot reads as empty until the
+# worker has published the new symbol there (never the old symbol's price under the new name).
+# With every symbol in use, register() returns None and the caller stays on TICKS requests.
+
+MAGIC = 0x54424F31 # "TBO1"
+
+HEADER_FMT = "<IIII"
+HEADER_SIZE = 64
+
+SLOT_SIZE = 80
+SEQ_FMT = "<Q"
+DATA_FMT = "<ddqqI" # bid, ask, time, time_msc, gen (name_gen the tick belongs to)
+DATA_OFFSET = 8
+GEN_FMT = "<I"
+GEN_OFFSET = 48
+NAME_OFFSET = 52
+NAME_SIZE = 24
+
+READ_RETRIES = 100
+DEFAULT_CAPACITY = 256
+EVICT_IDLE_S = 60.0 # A symbol unread that long may lose its slot to a new one
+
+
+class TickBoard:
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.buf = shm.buf
+        self.owner = owner
+        self.capacity = struct.unpack_from(HEADER_FMT, self.buf, 0)[1]
+        self.index: Dict[str, int] = {} # { symbol : slot }
+        self.gens: Dict[int, int] = {} # { slot : name_gen } as last loaded
+        self.last_read: Dict[str, float] = {} # { symbol : monotonic time } eviction order (registering side)
+        self._known = 0 # Slots already loaded into self.index
+        self._epoch = 0
+        self._full_logged = False
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def create(cls, capacity=DEFAULT_CAPACITY, name=None):
+        size = HEADER_SIZE + capacity * SLOT_SIZE
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        shm.buf[:size] = bytes(size)
+        struct.pack_into(HEADER_FMT, shm.buf, 0, MAGIC, capacity, 0, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        # Workers share the creator's resource tracker, only the creator unlinks
+        shm = shared_memory.SharedMemory(name=name)
+        magic = struct.unpack_from(HEADER_FMT, shm.buf, 0)[0]
+        if magic != MAGIC:
+            shm.close()
+            raise ValueError(f"Not a tick board: {name}")
+        return cls(shm, owner=False)
+
+    def close(self):
+        self.buf = None
+        try: self.shm.close()
+        except Exception: pass
+        if self.owner:
+            try: self.shm.unlink()
+            except Exception: pass
+
+    # --- Symbol -> slot index ---
+
+    def _header(self):
+        # (count, epoch)
+        return struct.unpack_from(HEADER_FMT, self.buf, 0)[2:]
+
+    def _load_slot(self, slot):
+        off = HEADER_SIZE + slot * SLOT_SIZE
+        gen = struct.unpack_from(GEN_FMT, self.buf, off + GEN_OFFSET)[0] # Before the name, see register()
+        symbol = bytes(self.buf[off + NAME_OFFSET:off + NAME_OFFSET + NAME_SIZE]).rstrip(b"\x00").decode("utf-8", "replace")
+        return symbol, gen
+
+    def refresh_index(self):
+        """Pick up symbols registered (by another process) since the last call. Returns new symbols."""
+        count, epoch = self._header()
+        if epoch != self._epoch:
+            # Slots were reused: reload every name
+            old = dict(self.index)
+            self.index, self.gens = {}, {}
+            for slot in range(count):
+                symbol, self.gens[slot] = self._load_slot(slot)
+                self.index[symbol] = slot
+            self._known, self._epoch = count, epoch
+            return [sym for sym, slot in self.index.items() if old.get(sym) != slot]
+
+        added = []
+        for slot in range(self._known, count):
+            symbol, self.gens[slot] = self._load_slot(slot)
+            self.index[symbol] = slot
+            added.append(symbol)
+        self._known = count
+        return added
+
+    def register(self, symbol: str) -> Optional[int]:
+        """
+        Reserve a slot for symbol (registering side only). Safe to call repeatedly.
+        None if the board is full and no symbol has been idle long enough to evict.
+        """
+        self.refresh_index()
+        if symbol in self.index:
+            return self.index[symbol]
+
+        count, epoch = self._header()
+        if count < self.capacity:
+            slot, gen = count, 0
+        else:
+            idle = [s for s in self.index if time.monotonic() - self.last_read.get(s, 0) > EVICT_IDLE_S]
+            if not idle:
+                if not self._full_logged:
+                    print(f"Tick board full ({self.capacity} symbols in use), {symbol} stays on TICKS requests")
+                    self._full_logged = True
+                return None
+            victim = min(idle, key=lambda s: self.last_read.get(s, 0))
+            slot = self.index.pop(victim)
+            self.last_read.pop(victim, None)
+            gen = self.gens.get(slot, 0) + 1
+
+        raw = symbol.encode("utf-8")[:NAME_SIZE]
+        off = HEADER_SIZE + slot * SLOT_SIZE
+        # Name, then its generation, then count/epoch: a reader that sees the new gen sees the whole name
+        self.buf[off + NAME_OFFSET:off + NAME_OFFSET + NAME_SIZE] = raw.ljust(NAME_SIZE, b"\x00")
+        struct.pack_into(GEN_FMT, self.buf, off + GEN_OFFSET, gen)
+        if slot == count:
+            struct.pack_into(HEADER_FMT, self.buf, 0, MAGIC, self.capacity, count + 1, epoch)
+            self._known = count + 1
+        else:
+            struct.pack_into(HEADER_FMT, self.buf, 0, MAGIC, self.capacity, count, epoch + 1)
+            self._epoch = epoch + 1
+            self._full_logged = False
+
+        self.index[symbol] = slot
+        self.gens[slot] = gen
+        self.last_read[symbol] = time.monotonic() # Fresh registrations are not evicted right away
+        return slot
+
+    def symbols(self):
+        self.refresh_index()
+        return list(self.index.keys())
+
+    # --- Writer (worker) ---
+
+    def publish(self, slot: int, bid: float, ask: float, tick_time: int, time_msc: int):
+        off = HEADER_SIZE + slot * SLOT_SIZE
+        seq = struct.unpack_from(SEQ_FMT, self.buf, off)[0]
+        struct.pack_into(SEQ_FMT, self.buf, off, seq + 1) # odd: write in progress
+        struct.pack_into(DATA_FMT, self.buf, off + DATA_OFFSET, bid, ask, tick_time, time_msc, self.gens.get(slot, 0))
+        struct.pack_into(SEQ_FMT, self.buf, off, seq + 2) # even: stable
+
+    # --- Reader (API) ---
+
+    def read_slot(self, slot: int):
+        """Consistent (seq, bid, ask, time, time_msc, gen) for a slot, or None if it never stabilised."""
+        off = HEADER_SIZE + slot * SLOT_SIZE
+        for _ in range(READ_RETRIES):
+            seq1 = struct.unpack_from(SEQ_FMT, self.buf, off)[0]
+            if seq1 & 1:
+                continue
+            bid, ask, tick_time, time_msc, gen = struct.unpack_from(DATA_FMT, self.buf, off + DATA_OFFSET)
+            seq2 = struct.unpack_from(SEQ_FMT, self.buf, off)[0]
+            if seq1 == seq2:
+                return seq1, bid, ask, tick_time, time_msc, gen
+        return None
+
+    def read(self, symbol: str):
+        slot = self.index.get(symbol)
+        if slot is None:
+            self.refresh_index()
+            slot = self.index.get(symbol)
+            if slot is None: return None
+        self.last_read[symbol] = time.monotonic()
+
+        snap = self.read_slot(slot)
+        if not snap or snap[0] == 0: return None # Never published
+        seq, bid, ask, tick_time, time_msc, gen = snap
+        if gen != self.gens.get(slot, 0): return None # Still the previous symbol's tick (slot reused)
+        return {"bid": bid, "ask": ask, "time": tick_time, "time_msc": time_msc, "seq": seq}
+
+    def read_all(self):
+        self.refresh_index()
+        res = {}
+        for symbol in self.index:
+            q = self.read(symbol)
+            if q: res[symbol] = q
+        return res
+
@@ -0,0 +1,100 @@
+import numpy as np
+
+# === VIRTUALIZATION ENGINE ===
+# What a user sees of the MT5 account behind them: with mirror_enabled every side is flipped
+# (BUY <-> SELL, profit/swap negated, SL <-> TP), with a multiplier volumes and profits are
+# divided by it. Rows (worker/ledger dicts of one shape) are turned into float64 columns, every
+# transform and sum runs on the columns, then the changed columns are written back in one loop.
+#
+# Three views, each exactly as the endpoints computed them row by row before:
+#   virtualize_history    /trade_history deals/positions: profit/swap negated, volume/profit
+#                         divided and rounded only for multipliers other than 1
+#   virtualize_positions  /ws/positions open positions: profit becomes the rounded net
+#                         (profit + swap + commission), volume always divided and rounded
+#   net_profit            sync_history_loop: just the sum of the virtual net profits
+# tests/test_virtualization.py checks the results against the old per-dict code (kept in
+# bench_virtualize.py, which also times 100k deals).
+
+FLIP = {"BUY": "SELL", "SELL": "BUY"}
+
+
+def column(rows, key):
+    # float64 column of rows[*][key], 0 where missing (a BALANCE deal lacks fields a trade deal has)
+    return np.fromiter((p.get(key, 0) for p in rows), dtype=np.float64, count=len(rows))
+
+
+def _has(rows, key):
+    return any(key in p for p in rows)
+
+
+def round2(values):
+    # round(x, 2) for a whole column. np.round rounds x * 100, which can land on the other side
+    # of a .xx5 tie than Python's correctly rounded round(); those few go through round() itself.
+    out = np.round(values, 2)
+    scaled = values * 100
+    ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6 + 1e-9 * np.abs(scaled))
+    for i in ties.tolist(): out[i] = round(float(values[i]), 2)
+    return out
+
+
+def _net(rows, mirror, multiplier):
+    # Virtual (profit + swap + commission) per row
+    net = column(rows, 'profit') + column(rows, 'swap') + column(rows, 'commission')
+    if mirror: net = -net
+    if multiplier > 0: net = net / multiplier
+    return net
+
+
+def net_profit(rows, mirror, multiplier):
+    """Sum of the virtual net profit of closed deals (summed in row order, like the old loop)."""
+    if not rows: return 0.0
+    return sum(_net(rows, mirror, multiplier).tolist())
+
+
+def virtualize_history(rows, mirror, multiplier):
+    """
+    Virtualizes /trade_history rows in place. Rows may differ in shape: a field a row
+    doesn't have stays missing, like the old per-row code left it.
+    """
+    if not rows: return
+    scaled = multiplier > 0 and multiplier != 1.0
+    cols = {} # Changed columns only, these are written back
+
+    if (mirror or scaled) and _has(rows, 'profit'):
+        profit = column(rows, 'profit')
+        if mirror: profit = -profit
+        if scaled: profit = round2(profit / multiplier)
+        cols['profit'] = profit
+    if mirror and _has(rows, 'swap'):
+        cols['swap'] = -column(rows, 'swap')
+    if scaled and _has(rows, 'volume'):
+        cols['volume'] = round2(column(rows, 'volume') / multiplier)
+
+    if not (cols or mirror): return
+    changed = {k: v.tolist() for k, v in cols.items()}
+    for i, p in enumerate(rows):
+        for k, values in changed.items():
+            if k in p: p[k] = values[i]
+        if mirror:
+            if 'type' in p: p['type'] = FLIP.get(p['type'], p['type'])
+            if 'sl' in p and 'tp' in p: p['sl'], p['tp'] = p['tp'], p['sl']
+
+
+def virtualize_positions(rows, mirror, multiplier):
+    """
+    Virtualizes open positions in place for /ws/positions. Returns the floating profit
+    (sum of the unrounded virtual net profits).
+    """
+    if not rows: return 0.0
+    net = _net(rows, mirror, multiplier)
+    floating = sum(net.tolist())
+
+    profit = round2(net).tolist()
+    volume = round2(column(rows, 'volume') / multiplier).tolist() if multiplier > 0 else None
+    for i, p in enumerate(rows):
+        p['profit'] = profit[i]
+        if mirror:
+            p['type'] = 'SELL' if p['type'] == 'BUY' else 'BUY'
+            p['sl'], p['tp'] = p.get('tp', 0.0), p.get('sl', 0.0)
+        if volume is not None: p['volume'] = volume[i]
+    return floating
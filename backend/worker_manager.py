@@ -0,0 +1,628 @@
+import os
+import copy
+import json
+import threading
+import multiprocessing
+import uuid
+import time
+import asyncio
+from typing import Dict
+
+try:
+    from backend.tick_board import TickBoard
+    from backend import shm_rates
+except ImportError:
+    from tick_board import TickBoard
+    import shm_rates
+
+try:
+    from backend.mt5_worker import MT5Worker
+except ImportError:
+    try:
+        from mt5_worker import MT5Worker
+    except ImportError:
+        MT5Worker = None
+
+# Result dispatch modes:
+#   "event" - one blocking reader thread per worker, wakes the loop as soon as a result lands
+#   "poll"  - legacy single thread sweeping every res_q with a 10ms idle sleep (kept for comparison)
+DISPATCH_EVENT = "event"
+DISPATCH_POLL = "poll"
+
+_READER_STOP = None # Sentinel pushed into a res_q to release its reader thread
+
+# Priority lanes: urgent commands never wait behind history/position pulls
+LANE_URGENT = "urgent"
+LANE_BULK = "bulk"
+URGENT_COMMANDS = {"TRADE", "MODIFY", "CLOSE", "CHECK_MARGIN", "LOGIN", "STOP", "PING"}
+
+# Single-flight reads: identical in-flight requests (same login, type, data) share one worker round-trip
+COALESCE_COMMANDS = {"POSITIONS", "ACCOUNT_INFO", "TICKS", "HISTORY", "TRADE_HISTORY", "RESOLVE"}
+INVALIDATING_COMMANDS = {"TRADE", "MODIFY", "CLOSE", "LOGIN"} # Drop cached reads of that login
+
+# Deadlines: execute() stamps commands with an absolute deadline (queued time + timeout) and the
+# worker skips them unexecuted once it has passed, since nobody is waiting for the result anymore.
+# Per-type policy, overridable with DEADLINE_POLICY="HISTORY=execute,PING=execute":
+#   "drop"    - skip after the deadline; only idempotent reads, the next request just asks again
+#   "execute" - no deadline, always run (default: orders must reach the terminal even if the
+#               caller gave up waiting, the position/history stream shows what they did)
+DEADLINE_DROP = "drop"
+DEADLINE_EXECUTE = "execute"
+DEADLINE_POLICY = {cmd_type: DEADLINE_DROP for cmd_type in COALESCE_COMMANDS | {"CHECK_MARGIN", "PING"}}
+
+def _parse_deadline_policy(spec):
+    policy = dict(DEADLINE_POLICY)
+    for part in (spec or "").split(","):
+        if "=" not in part: continue
+        cmd_type, mode = (x.strip() for x in part.split("=", 1))
+        if mode in (DEADLINE_DROP, DEADLINE_EXECUTE):
+            policy[cmd_type.upper()] = mode
+        else:
+            print(f"Ignoring deadline policy '{part}', expected {DEADLINE_DROP} or {DEADLINE_EXECUTE}")
+    return policy
+
+# Supervisor
+SUPERVISE_INTERVAL = 0.5 # Seconds between liveness sweeps
+RESTART_BACKOFF_MAX = 60 # Seconds, cap for repeated failed respawns
+
+# === ASYNC WORKER MANAGER (NO ZOMBIES) ===
+class AsyncWorkerManager:
+    def __init__(self, dispatch_mode=None, worker_cls=None):
+        self.workers: Dict[int, multiprocessing.Process] = {}
+        self.queues: Dict[int, tuple] = {} # (cmd_q, res_q)  cmd_q is the bulk lane
+        self.lanes: Dict[int, tuple] = {} # (urgent_q, doorbell)
+        self.shm_acks: Dict[int, multiprocessing.Queue] = {} # { mt5_login : queue acking raw HISTORY blocks }
+        self.lane_stats: Dict[int, dict] = {} # { mt5_login : { lane : {depth, max_depth, last_wait_ms, max_wait_ms} } }
+        self.inflight: Dict[str, tuple] = {} # { request_id : (mt5_login, lane) } until its result (or zombie) arrives
+        self.state_cache: Dict[int, dict] = {} # { mt5_login : {version, positions{ticket: p}, account, updated_at} } (push mode)
+        self.futures: Dict[str, asyncio.Future] = {} # { request_id : Future }
+        self.readers: Dict[int, threading.Thread] = {} # { mt5_login : reader thread } (event mode)
+        self.tick_boards: Dict[int, TickBoard] = {} # { mt5_login : shared-memory quote table }
+        self.paths: Dict[int, str] = {} # { mt5_login : terminal path } workers the supervisor keeps alive
+        self.credentials: Dict[int, dict] = {} # { mt5_login : last successful LOGIN data } for re-login on respawn
+        self.health: Dict[int, dict] = {} # { mt5_login : restarts, last_failure, last_recover_s, last_heartbeat ... }
+        self.sessions: Dict[int, int] = {} # { mt5_login : bumped on every worker start and successful LOGIN }
+        self.recovering = set()
+        self.pinging = set()
+        self.loop = None
+        self.running = True
+        self.worker_cls = worker_cls or MT5Worker
+
+        self.dispatch_mode = dispatch_mode or os.getenv("WORKER_DISPATCH", DISPATCH_EVENT)
+        if self.dispatch_mode not in (DISPATCH_EVENT, DISPATCH_POLL):
+            print(f"Unknown dispatch mode '{self.dispatch_mode}', falling back to '{DISPATCH_EVENT}'")
+            self.dispatch_mode = DISPATCH_EVENT
+
+        # Workers publish quotes into shared memory (TICK_BOARD=0 falls back to TICKS requests)
+        self.tick_board_enabled = os.getenv("TICK_BOARD", "1") != "0"
+        self.tick_interval = int(os.getenv("TICK_BOARD_INTERVAL_MS", "100")) / 1000.0
+
+        # Opt-in push mode: workers stream position/account deltas into self.state_cache
+        self.push_enabled = os.getenv("PUSH_STATE", "0") == "1"
+        self.push_interval = int(os.getenv("PUSH_STATE_INTERVAL_MS", "500")) / 1000.0
+
+        # Terminal module for workers (MT5_MODULE=fake runs against the simulator in fake_mt5.py)
+        self.mt5_module = os.getenv("MT5_MODULE") or None
+
+        # Read coalescing (COALESCE_READS=0 disables). READ_CACHE_MS > 0 also lets reads reuse a result that young.
+        self.coalesce_enabled = os.getenv("COALESCE_READS", "1") != "0"
+        self.read_cache_window = float(os.getenv("READ_CACHE_MS", "0")) / 1000.0
+        self.shared_reads: Dict[tuple, dict] = {} # { read key : {task, waiters} } in flight
+        self.read_cache: Dict[tuple, tuple] = {} # { read key : (monotonic time, result) }
+        self.read_gen: Dict[int, int] = {} # { mt5_login : cache invalidations so far }
+        self.read_stats: Dict[int, dict] = {} # { mt5_login : {issued, coalesced, cache_hits} }
+
+        self.deadline_policy = _parse_deadline_policy(os.getenv("DEADLINE_POLICY", ""))
+
+        # Supervisor heartbeat (PING on the urgent lane); a worker silent for heartbeat_timeout is treated as hung
+        self.heartbeat_interval = float(os.getenv("WORKER_HEARTBEAT_S", "5"))
+        self.heartbeat_timeout = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT_S", "30"))
+
+        if self.dispatch_mode == DISPATCH_POLL:
+            # Thread to consume all result queues
+            self.listener_thread = threading.Thread(target=self._result_listener, daemon=True)
+            self.listener_thread.start()
+
+    def set_loop(self, loop):
+        self.loop = loop
+
+    def is_worker_running(self, mt5_login: int):
+        return mt5_login in self.workers and self.workers[mt5_login].is_alive()
+
+    def start_worker(self, mt5_login: int, path: str):
+        if self.is_worker_running(mt5_login): return True
+
+        if self.mt5_module != "fake" and not os.path.exists(path):
+            print(f"Terminal path not found: {path} for {mt5_login}")
+            return False
+
+        print(f"Starting Worker for MT5 {mt5_login} at {path}...")
+        cmd_q = multiprocessing.Queue()
+        res_q = multiprocessing.Queue()
+        urgent_q = multiprocessing.Queue()
+        doorbell = multiprocessing.Semaphore(0)
+        ack_q = multiprocessing.Queue() # Raw HISTORY blocks copied out (shm_rates.py)
+
+        extra = {"urgent_queue": urgent_q, "doorbell": doorbell, "shm_ack_queue": ack_q}
+        if self.mt5_module: extra["mt5_module"] = self.mt5_module
+        if self.tick_board_enabled:
+            self._close_tick_board(mt5_login) # Leftover from a dead worker
+            try:
+                board = TickBoard.create()
+                self.tick_boards[mt5_login] = board
+                extra.update({"tick_board_name": board.name, "tick_interval": self.tick_interval})
+            except Exception as e:
+                print(f"Tick board unavailable for {mt5_login}: {e}")
+
+        w = self.worker_cls(worker_id=mt5_login, terminal_path=path, command_queue=cmd_q, result_queue=res_q, **extra)
+        w.start()
+        self._new_session(mt5_login)
+
+        self.workers[mt5_login] = w
+        self.paths[mt5_login] = path
+        self.queues[mt5_login] = (cmd_q, res_q)
+        self.lanes[mt5_login] = (urgent_q, doorbell)
+        self.shm_acks[mt5_login] = ack_q
+        self.lane_stats[mt5_login] = {lane: {"depth": 0, "max_depth": 0, "last_wait_ms": None, "max_wait_ms": 0.0,
+                                                     "timed_out": 0, "expired": 0}
+                                      for lane in (LANE_URGENT, LANE_BULK)}
+
+        if self.dispatch_mode == DISPATCH_EVENT:
+            reader = threading.Thread(target=self._worker_reader, args=(mt5_login, res_q, ack_q), daemon=True)
+            reader.start()
+            self.readers[mt5_login] = reader
+
+        if self.push_enabled:
+            self.subscribe_state(mt5_login)
+        return True
+
+    def stop_worker(self, mt5_login: int):
+        # Intentional stop: the supervisor forgets this worker
+        self.paths.pop(mt5_login, None)
+        self.credentials.pop(mt5_login, None)
+
+        if mt5_login in self.queues:
+            try: self._put_command(mt5_login, LANE_URGENT, {"type": "STOP"})
+            except: pass
+
+        if mt5_login in self.workers:
+            self.workers[mt5_login].join(timeout=3)
+            self._teardown_worker(mt5_login, "Worker stopped")
+            print(f"Stopped Worker for {mt5_login}")
+
+    def _teardown_worker(self, mt5_login: int, reason):
+        # Drop a (dead, hung or stopping) worker and everything attached to it
+        w = self.workers.pop(mt5_login, None)
+        if w and w.is_alive(): w.terminate()
+        queues = self.queues.pop(mt5_login, None)
+        self.lanes.pop(mt5_login, None)
+        self.shm_acks.pop(mt5_login, None)
+        self.lane_stats.pop(mt5_login, None)
+        self.state_cache.pop(mt5_login, None)
+        self._drop_read_cache(mt5_login)
+
+        # Fail in-flight requests now instead of letting them wait out their timeout
+        failed = [req_id for req_id, (login, _) in list(self.inflight.items()) if login == mt5_login]
+        for req_id in failed: self.inflight.pop(req_id, None)
+        if failed and self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._fail_futures, failed, reason)
+
+        # Release the blocking reader (it drains anything the worker sent before exiting first)
+        reader = self.readers.pop(mt5_login, None)
+        if reader and queues:
+            try: queues[1].put(_READER_STOP)
+            except: pass
+        self._close_tick_board(mt5_login)
+
+    def _fail_futures(self, request_ids, reason):
+        for req_id in request_ids:
+            fut = self.futures.pop(req_id, None)
+            if fut and not fut.done():
+                fut.set_result({"status": "error", "detail": reason})
+
+    def _close_tick_board(self, mt5_login: int):
+        board = self.tick_boards.pop(mt5_login, None)
+        if board: board.close()
+
+    def get_tick_board(self, mt5_login: int):
+        # Board is only meaningful while its writer is alive
+        if not self.is_worker_running(mt5_login): return None
+        return self.tick_boards.get(mt5_login)
+
+    def stop_all(self):
+        self.running = False
+        active_ids = list(self.workers.keys())
+        for uid in active_ids: self.stop_worker(uid)
+
+    def _lane_for(self, command_type, data):
+        if command_type == "BATCH":
+            # A batch is as urgent as its most urgent sub-command
+            if any(sub.get("type") in URGENT_COMMANDS for sub in (data or [])):
+                return LANE_URGENT
+            return LANE_BULK
+        return LANE_URGENT if command_type in URGENT_COMMANDS else LANE_BULK
+
+    def _droppable(self, command_type, data):
+        # A command gets a deadline only if every part of it may be skipped
+        if command_type == "BATCH":
+            return all(self._droppable(sub.get("type"), sub.get("data")) for sub in (data or []))
+        return self.deadline_policy.get(command_type, DEADLINE_EXECUTE) == DEADLINE_DROP
+
+    def _put_command(self, mt5_login: int, lane, cmd):
+        cmd_q, _ = self.queues[mt5_login]
+        urgent_q, doorbell = self.lanes[mt5_login]
+
+        cmd["queued_at"] = time.time()
+        (urgent_q if lane == LANE_URGENT else cmd_q).put(cmd)
+        doorbell.release()
+
+        if cmd.get("id"):
+            self.inflight[cmd["id"]] = (mt5_login, lane)
+            stats = self.lane_stats[mt5_login][lane]
+            stats["depth"] += 1
+            stats["max_depth"] = max(stats["max_depth"], stats["depth"])
+
+    def _account_result(self, res):
+        # Lane depth bookkeeping; counts zombies too, since they left the queue as well
+        entry = self.inflight.pop(res.get('id'), None)
+        if not entry: return
+        login, lane = entry
+        stats = self.lane_stats.get(login, {}).get(lane)
+        if not stats: return
+        stats["depth"] = max(0, stats["depth"] - 1)
+        if res.get('expired'): stats["expired"] += 1 # Skipped by the worker, deadline passed
+        wait_ms = res.get('wait_ms')
+        if wait_ms is not None:
+            stats["last_wait_ms"] = wait_ms
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], wait_ms)
+
+    # --- Push mode (position/account state cache) ---
+
+    def subscribe_state(self, mt5_login: int, enabled=True):
+        # Fire-and-forget: the ack comes back without a future and is dropped as a zombie
+        if mt5_login not in self.queues: return
+        data = {"enabled": enabled, "interval": self.push_interval}
+        self._put_command(mt5_login, LANE_BULK, {"type": "SUBSCRIBE", "id": None, "data": data})
+
+    def _apply_state_push(self, msg):
+        login = msg.get('worker_id')
+        if login not in self.workers: return
+        version = msg.get('version')
+
+        if msg.get('full'):
+            self.state_cache[login] = {
+                "version": version,
+                "login": msg.get('login'),
+                "positions": {p['ticket']: p for p in msg.get('positions', [])},
+                "account": dict(msg.get('account') or {}),
+                "updated_at": time.time(),
+            }
+            return
+
+        state = self.state_cache.get(login)
+        if not state or version != state['version'] + 1:
+            # Missed a delta (or never got the snapshot): drop the cache and resync
+            print(f"State push gap for {login} (have {state['version'] if state else None}, got {version}), resyncing")
+            self.state_cache.pop(login, None)
+            self.subscribe_state(login)
+            return
+
+        positions = state['positions']
+        for p in msg.get('added', []):
+            positions[p['ticket']] = p
+        for diff in msg.get('changed', []):
+            if diff['ticket'] in positions:
+                positions[diff['ticket']].update(diff)
+        for ticket in msg.get('removed', []):
+            positions.pop(ticket, None)
+        state['account'].update(msg.get('account') or {})
+        state['login'] = msg.get('login')
+        state['version'] = version
+        state['updated_at'] = time.time()
+
+    def get_state(self, mt5_login: int, max_age=10.0):
+        """
+        Latest pushed positions/account for a worker, as copies callers may modify.
+        None if push mode is off, the worker is down or the cache is stale -> poll instead.
+        """
+        state = self.state_cache.get(mt5_login)
+        if not state or not self.is_worker_running(mt5_login): return None
+        if time.time() - state['updated_at'] > max_age: return None
+        return {
+            "version": state['version'],
+            "positions": [dict(p) for p in state['positions'].values()],
+            "account": dict(state['account']),
+        }
+
+    # --- Supervisor ---
+
+    async def supervise(self):
+        """
+        Keeps every started worker alive: detects dead processes (liveness sweep) and hung
+        ones (PING heartbeat), fails their in-flight requests and respawns them with re-LOGIN.
+        """
+        print("Worker Supervisor Started")
+        last_ping = time.monotonic()
+        while self.running:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            try:
+                for login in list(self.paths.keys()):
+                    if login in self.recovering: continue
+                    w = self.workers.get(login)
+                    if w is None or not w.is_alive():
+                        code = w.exitcode if w else None
+                        asyncio.create_task(self._recover(login, f"Worker process exited (code {code})"))
+
+                if time.monotonic() - last_ping >= self.heartbeat_interval:
+                    last_ping = time.monotonic()
+                    for login in list(self.workers.keys()):
+                        if login in self.recovering or login in self.pinging: continue
+                        asyncio.create_task(self._heartbeat(login))
+            except Exception as e:
+                print(f"Supervisor Error: {e}")
+
+    async def _heartbeat(self, mt5_login: int):
+        self.pinging.add(mt5_login)
+        try:
+            t0 = time.monotonic()
+            res = await self.execute(mt5_login, "PING", None, timeout=self.heartbeat_timeout)
+            health = self._health(mt5_login)
+            if isinstance(res, dict) and res.get('status') == 'success':
+                health['last_heartbeat'] = time.time()
+                health['heartbeat_ms'] = round((time.monotonic() - t0) * 1000, 1)
+                health['expired_total'] = res.get('expired') # Worker-side count since its (re)start
+                health['connected'] = res.get('connected')
+            elif isinstance(res, dict) and res.get('detail') == "Request timed out" and self.is_worker_running(mt5_login):
+                await self._recover(mt5_login, f"No heartbeat for {self.heartbeat_timeout}s (hung)")
+        finally:
+            self.pinging.discard(mt5_login)
+
+    def _new_session(self, mt5_login: int):
+        # Anything cached about the terminal (broker symbol names...) is only valid within one session
+        self.sessions[mt5_login] = self.sessions.get(mt5_login, 0) + 1
+
+    def _health(self, mt5_login: int):
+        if mt5_login not in self.health:
+            self.health[mt5_login] = {"restarts": 0, "last_failure": None, "last_failure_at": None,
+                                      "last_recover_s": None, "last_heartbeat": None, "heartbeat_ms": None,
+                                      "expired_total": None, "connected": None}
+        return self.health[mt5_login]
+
+    async def _recover(self, mt5_login: int, reason):
+        if mt5_login in self.recovering: return
+        self.recovering.add(mt5_login)
+        t0 = time.monotonic()
+        health = self._health(mt5_login)
+        health['last_failure'] = reason
+        health['last_failure_at'] = time.time()
+        print(f"Supervisor: {mt5_login} {reason}, restarting...")
+
+        try:
+            self._teardown_worker(mt5_login, f"Worker failed: {reason}")
+            delay = 1
+            while self.running and mt5_login in self.paths:
+                ok = self.start_worker(mt5_login, self.paths[mt5_login])
+                creds = self.credentials.get(mt5_login)
+                if ok and creds:
+                    res = await self.execute(mt5_login, "LOGIN", creds, timeout=90)
+                    ok = isinstance(res, dict) and res.get('status') == 'success'
+                    if not ok: print(f"Supervisor: re-login failed for {mt5_login}: {res}")
+                if ok: break
+
+                if mt5_login in self.workers: self._teardown_worker(mt5_login, "Worker restart failed")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RESTART_BACKOFF_MAX)
+            else:
+                return # Stopped on purpose while recovering
+
+            health['restarts'] += 1
+            health['last_recover_s'] = round(time.monotonic() - t0, 2)
+            print(f"Supervisor: {mt5_login} recovered in {health['last_recover_s']}s (restarts: {health['restarts']})")
+        finally:
+            self.recovering.discard(mt5_login)
+
+    def get_stats(self):
+        return {
+            login: {
+                "alive": self.is_worker_running(login),
+                "recovering": login in self.recovering,
+                "lanes": {lane: dict(s) for lane, s in self.lane_stats.get(login, {}).items()},
+                "health": dict(self._health(login)),
+                "reads": dict(self.read_stats.get(login, {})),
+            }
+            for login in list(self.paths.keys())
+        }
+
+    def _resolve_future(self, res):
+        # Runs on the event loop thread (both dispatch modes hand results over with call_soon_threadsafe),
+        # so no locking is needed around self.futures / inflight / lane_stats
+        if res.get('push') == "STATE":
+            self._apply_state_push(res)
+            return
+        self._account_result(res)
+        req_id = res.get('id')
+        fut = self.futures.pop(req_id, None) if req_id else None
+        if fut is None:
+            # ZOMBIE FOUND! Discard it.
+            return
+        if not fut.done():
+            fut.set_result(res.get('result'))
+
+    def _worker_reader(self, mt5_login, res_q, ack_q):
+        """
+        Per-worker thread blocked on res_q.get(). The pipe read wakes it the moment
+        the worker puts a result, so there is no polling delay and no CPU use while idle.
+        """
+        while self.running:
+            try:
+                res = res_q.get()
+            except (EOFError, OSError):
+                break # Queue torn down
+            except Exception as e:
+                if not self.running or mt5_login not in self.queues:
+                    break # Shutting down, queue already released
+                print(f"Result Reader Error ({mt5_login}): {e}")
+                continue
+
+            if res is _READER_STOP:
+                break
+            if not isinstance(res, dict):
+                continue
+            res = shm_rates.unpack_result(res, ack_q) # Off the loop thread, and even if nobody waits anymore
+
+            loop = self.loop
+            if loop and not loop.is_closed():
+                loop.call_soon_threadsafe(self._resolve_future, res)
+
+    def _result_listener(self):
+        """
+        Background thread that continously polls ALL result queues.
+        Dispatches results to Futures. Discards zombies.
+        (Legacy dispatch, enabled with WORKER_DISPATCH=poll)
+        """
+        print("Async Result Listener Started")
+        while self.running:
+            # Iterate all active queues
+            # Use list() to avoid runtime error if dict changes size
+            active_logins = list(self.queues.keys())
+
+            idle = True
+            for login in active_logins:
+                if login not in self.queues: continue
+                _, res_q = self.queues[login]
+
+                try:
+                    # Non-blocking get
+                    while not res_q.empty():
+                        res = res_q.get_nowait()
+                        idle = False
+                        if not isinstance(res, dict): continue
+                        res = shm_rates.unpack_result(res, self.shm_acks.get(login))
+                        # Futures, inflight and lane stats belong to the loop thread: same hand-off
+                        # as event mode (zombies are discarded there)
+                        loop = self.loop
+                        if loop and not loop.is_closed():
+                            loop.call_soon_threadsafe(self._resolve_future, res)
+                except:
+                    pass
+
+            if idle:
+                time.sleep(0.01) # Low CPU usage wait
+
+    async def execute(self, mt5_login: int, command_type, data=None, timeout=15):
+        if not self.is_worker_running(mt5_login):
+            return {"status": "error", "detail": "Worker not running"}
+
+        key = self._read_key(mt5_login, command_type, data)
+        if key is None:
+            result = await self._execute(mt5_login, command_type, data, timeout)
+            if command_type in INVALIDATING_COMMANDS:
+                self._drop_read_cache(mt5_login) # Positions/account just changed
+            return result
+        stats = self.read_stats.setdefault(mt5_login, {"issued": 0, "coalesced": 0, "cache_hits": 0})
+
+        # Freshness window: a result this young is as good as a new one
+        if self.read_cache_window > 0:
+            hit = self.read_cache.get(key)
+            if hit and time.monotonic() - hit[0] <= self.read_cache_window:
+                stats["cache_hits"] += 1
+                return copy.deepcopy(hit[1])
+
+        shared = self.shared_reads.get(key)
+        if shared and not shared["task"].done():
+            # Same read already in flight: wait for its result instead of queueing another
+            shared["waiters"] += 1
+            stats["coalesced"] += 1
+        else:
+            task = asyncio.get_event_loop().create_task(self._execute(mt5_login, command_type, data, timeout))
+            shared = {"task": task, "waiters": 1}
+            self.shared_reads[key] = shared
+            gen = self.read_gen.get(mt5_login, 0)
+            task.add_done_callback(lambda t, key=key, gen=gen: self._finish_read(key, t, gen))
+            stats["issued"] += 1
+
+        try:
+            # shield: a caller that gives up (timeout / disconnect) must not cancel the others' request
+            result = await asyncio.wait_for(asyncio.shield(shared["task"]), timeout=timeout)
+        except asyncio.TimeoutError:
+            return {"status": "error", "detail": "Request timed out"}
+
+        # Callers mutate results (virtualization), so shared ones are handed out as copies
+        if shared["waiters"] > 1 or self.read_cache_window > 0:
+            return copy.deepcopy(result)
+        return result
+
+    def _read_key(self, mt5_login, command_type, data):
+        # Identity of an idempotent read, None if the command must always run on its own
+        if not self.coalesce_enabled: return None
+        if command_type == "BATCH":
+            if not data or any(sub.get("type") not in COALESCE_COMMANDS for sub in data): return None
+        elif command_type not in COALESCE_COMMANDS:
+            return None
+        try:
+            return (mt5_login, command_type, json.dumps(data, sort_keys=True, default=str))
+        except (TypeError, ValueError):
+            return None
+
+    def _finish_read(self, key, task, gen):
+        if self.shared_reads.get(key, {}).get("task") is task:
+            del self.shared_reads[key]
+        if self.read_cache_window <= 0 or task.cancelled() or task.exception(): return
+        # Invalidated while in flight: the terminal may have answered from before the change
+        if self.read_gen.get(key[0], 0) != gen: return
+        result = task.result()
+        items = result if isinstance(result, list) else [result]
+        if any(isinstance(r, dict) and r.get("status") == "error" for r in items): return
+        self.read_cache[key] = (time.monotonic(), result)
+
+    def _drop_read_cache(self, mt5_login):
+        self.read_gen[mt5_login] = self.read_gen.get(mt5_login, 0) + 1
+        for key in [k for k in self.read_cache if k[0] == mt5_login]:
+            self.read_cache.pop(key, None)
+        # Reads already in flight keep their current waiters, later callers issue a fresh one
+        for key in [k for k in self.shared_reads if k[0] == mt5_login]:
+            self.shared_reads.pop(key, None)
+
+    async def _execute(self, mt5_login: int, command_type, data=None, timeout=15):
+        request_id = str(uuid.uuid4())
+
+        # Create Future
+        loop = asyncio.get_event_loop()
+        fut = loop.create_future()
+        self.futures[request_id] = fut
+
+        # Send Command (trades go to the urgent lane)
+        cmd = {"type": command_type, "id": request_id, "data": data}
+        if self._droppable(command_type, data):
+            cmd["deadline"] = time.time() + timeout
+        lane = self._lane_for(command_type, data)
+        self._put_command(mt5_login, lane, cmd)
+
+        try:
+            result = await asyncio.wait_for(fut, timeout=timeout)
+            if command_type == "LOGIN" and isinstance(result, dict) and result.get('status') == 'success':
+                self.credentials[mt5_login] = data # Supervisor re-logs in with these after a respawn
+                self._new_session(mt5_login) # Possibly another account/broker now
+            return result
+        except asyncio.TimeoutError:
+            # Cleanup future if timed out
+            if request_id in self.futures:
+                del self.futures[request_id]
+            stats = self.lane_stats.get(mt5_login, {}).get(lane)
+            if stats: stats["timed_out"] += 1
+            return {"status": "error", "detail": "Request timed out"}
+
+    async def execute_many(self, mt5_login: int, commands, timeout=15):
+        """
+        Run several commands on one worker in a single round-trip (BATCH).
+        commands: [(command_type, data), ...]  ->  [result, ...] in the same order.
+        On failure every slot carries the same error dict, so callers can unpack safely.
+        """
+        batch = [{"type": cmd_type, "data": data} for cmd_type, data in commands]
+        res = await self.execute(mt5_login, "BATCH", batch, timeout=timeout)
+
+        if isinstance(res, list) and len(res) == len(batch):
+            return res
+        if not isinstance(res, dict) or res.get('status') != 'error':
+            res = {"status": "error", "detail": f"Bad BATCH response: {res}"}
+        return [res for _ in batch]
@@ -1,6 +1,30 @@
+import 'dart:convert';
+import 'package:shared_preferences/shared_preferences.dart';
+
 class ApiConfig {
   // Replace with your machine's IP address
   // Cloudflare Tunnel Domain
   static const String baseUrl = "http://192.168.1.41:8000"; 
   static const String wsUrl = "ws://192.168.1.41:8000"; 
+
+  // /ws/positions only streams accounts the socket authenticated for: this is the first
+  // message to send after connecting, with the password saved at login (never in the URL).
+  static Future<String> positionsSubscribe(String login) async {
+    String password = "";
+    try {
+      final prefs = await SharedPreferences.getInstance();
+      final String? jsonString = prefs.getString('saved_accounts');
+      if (jsonString != null) {
+        for (final acc in jsonDecode(jsonString) as List) {
+          if (acc['login'].toString() == login) {
+            password = acc['password'] ?? "";
+            break;
+          }
+        }
+      }
+    } catch (e) {
+      print("Saved account lookup failed: $e");
+    }
+    return jsonEncode({"action": "subscribe", "login": login, "password": password});
+  }
 }
@@ -231,10 +231,13 @@ class ChartScreenState extends State<ChartScreen> {
     }
   }
 
-  void _connectPositionsWebSocket() {
+  Future<void> _connectPositionsWebSocket() async {
     _positionsChannel?.sink.close();
     try {
+        final subscribe = await ApiConfig.positionsSubscribe(widget.login.toString());
+        if (!mounted) return;
         _positionsChannel = WebSocketChannel.connect(Uri.parse('${ApiConfig.wsUrl}/ws/positions'));
+        _positionsChannel!.sink.add(subscribe);
         _positionsChannel!.stream.listen((message) {
           try {
             final rawData = jsonDecode(message);
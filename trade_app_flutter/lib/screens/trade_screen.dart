@@ -40,8 +40,11 @@ class _TradeScreenState extends State<TradeScreen> {
     super.dispose();
   }
 
-  void _connectWebSocket() {
+  Future<void> _connectWebSocket() async {
+    final subscribe = await ApiConfig.positionsSubscribe(widget.login.toString());
+    if (!mounted) return;
     _channel = WebSocketChannel.connect(Uri.parse('${ApiConfig.wsUrl}/ws/positions'));
+    _channel!.sink.add(subscribe);
     _channel!.stream.listen((message) {
       try {
         final rawData = jsonDecode(message);